@@ -1,3 +1,4 @@
+import os
 
 # ==========================================
 # ⚙️ LLM CONFIGURATION
@@ -10,3 +11,138 @@ GROQ_TEXT_MODEL = "openai/gpt-oss-120b"
 # Model untuk pemrosesan gambar (Vision)
 # llama-3.2-11b-vision DEPRECATED, gunakan 90b atau llava
 GROQ_VISION_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+# Batas request LLM yang boleh jalan bersamaan (sisanya antri, event loop tetap jalan)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+# Timeout per panggilan LLM (detik), termasuk waktu antri di gate
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+# Pool koneksi HTTP keep-alive ke Groq (dipakai bersama semua request)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "10"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+
+# Cache respons LLM untuk input identik (retry / pesan dobel). 0 = nonaktif
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "600"))
+
+# ==========================================
+# 🧾 OCR CONFIGURATION
+# ==========================================
+
+# Jumlah proses worker EasyOCR (masing-masing load model sendiri, ~1GB RAM).
+# 0 = OCR jalan di thread dalam proses API
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+
+# Job OCR yang boleh antri di luar yang sedang jalan; lebih dari ini ditolak
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "4"))
+
+# Batas waktu tunggu hasil OCR per gambar (detik), termasuk antri
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "60"))
+
+# Load model OCR di background saat startup (disarankan di production),
+# supaya upload struk pertama setelah deploy tidak menunggu model di-load
+OCR_WARMUP = os.getenv("OCR_WARMUP", "false").lower() == "true"
+
+# Jumlah potongan teks yang dikenali sekaligus oleh recognizer EasyOCR
+# (readtext batch_size); lebih besar = lebih cepat, RAM worker lebih besar
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+
+# Batas jumlah gambar per request /parse/images
+OCR_BATCH_MAX_IMAGES = int(os.getenv("OCR_BATCH_MAX_IMAGES", "50"))
+
+# Preprocessing gambar sebelum OCR (grayscale, crop, resize, deskew).
+# Opt-in dan belum diukur: belum ada hasil benchmarks/bench_ocr_preprocess.py
+# di foto struk asli, jadi default nonaktif (hasil OCR tidak berubah)
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "false").lower() == "true"
+# Tinggi huruf target (px) setelah resize; foto resolusi tinggi di-downscale ke sini
+OCR_TARGET_TEXT_HEIGHT = int(os.getenv("OCR_TARGET_TEXT_HEIGHT", "28"))
+# Sisi terpanjang maksimal gambar yang masuk OCR
+OCR_MAX_IMAGE_SIDE = int(os.getenv("OCR_MAX_IMAGE_SIDE", "2000"))
+OCR_AUTO_CROP = os.getenv("OCR_AUTO_CROP", "true").lower() == "true"
+OCR_DESKEW = os.getenv("OCR_DESKEW", "true").lower() == "true"
+# Kemiringan di atas ini dianggap salah deteksi (tidak diputar)
+OCR_MAX_DESKEW_ANGLE = float(os.getenv("OCR_MAX_DESKEW_ANGLE", "15"))
+
+# Cache hasil OCR per isi gambar (upload ulang struk yang sama = tanpa OCR)
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "256"))
+OCR_CACHE_TTL_SECONDS = float(os.getenv("OCR_CACHE_TTL_SECONDS", "86400"))
+# Folder cache di disk (opsional, kosong = hanya memori) dan batas jumlah file
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "")
+OCR_CACHE_DISK_MAX_ENTRIES = int(os.getenv("OCR_CACHE_DISK_MAX_ENTRIES", "2000"))
+
+# Struk yang tabelnya konsisten (qty x harga = total, jumlah = TOTAL) dibuat
+# draft-nya tanpa LLM; false = selalu lewat LLM (prompt tabel ringkas)
+OCR_LAYOUT_FAST_PATH = os.getenv("OCR_LAYOUT_FAST_PATH", "true").lower() == "true"
+
+# ==========================================
+# 🔎 RAG CONFIGURATION
+# ==========================================
+
+# Jumlah maksimal produk/supplier paling relevan yang dimasukkan ke prompt
+RAG_TOP_K_PRODUCTS = int(os.getenv("RAG_TOP_K_PRODUCTS", "30"))
+RAG_TOP_K_SUPPLIERS = int(os.getenv("RAG_TOP_K_SUPPLIERS", "5"))
+
+# Budget token (perkiraan ~4 karakter/token) untuk seluruh blok konteks katalog
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "800"))
+
+# Skor minimal (0-1) supaya kandidat dianggap relevan
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.25"))
+
+# ==========================================
+# 🗂️ CACHE CONFIGURATION
+# ==========================================
+
+# Umur maksimal snapshot katalog produk (detik) sebelum reload dari DB.
+# Jaring pengaman kalau ada perubahan yang tidak lewat API ini. 0 = tanpa batas
+CATALOG_MAX_AGE_SECONDS = float(os.getenv("CATALOG_MAX_AGE_SECONDS", "300"))
+
+# Sama, untuk directory kontak (supplier/customer)
+CONTACT_CACHE_MAX_AGE_SECONDS = float(os.getenv("CONTACT_CACHE_MAX_AGE_SECONDS", "300"))
+
+# Sinkronisasi invalidasi cache antar worker via Postgres LISTEN/NOTIFY.
+# Butuh koneksi langsung ke Postgres (CACHE_SYNC_DATABASE_URL), bukan pgbouncer
+CACHE_SYNC_ENABLED = os.getenv("CACHE_SYNC_ENABLED", "false").lower() == "true"
+CACHE_SYNC_CHANNEL = os.getenv("CACHE_SYNC_CHANNEL", "dnn_cache_sync")
+
+# ==========================================
+# 🔍 SEARCH CONFIGURATION
+# ==========================================
+
+# Jumlah hasil autocomplete /products/search
+PRODUCT_SEARCH_LIMIT = int(os.getenv("PRODUCT_SEARCH_LIMIT", "10"))
+
+# Jumlah hasil autocomplete /contacts/search
+CONTACT_SEARCH_LIMIT = int(os.getenv("CONTACT_SEARCH_LIMIT", "10"))
+
+# ==========================================
+# 💾 COMMIT CONFIGURATION
+# ==========================================
+
+# Batas jumlah draft per request /transactions/commit/batch (sync offline)
+COMMIT_BATCH_MAX_ENTRIES = int(os.getenv("COMMIT_BATCH_MAX_ENTRIES", "200"))
+
+# ==========================================
+# 🔄 DELTA SYNC CONFIGURATION
+# ==========================================
+
+# Jumlah baris default & maksimal per halaman /sync/*
+SYNC_PAGE_LIMIT = int(os.getenv("SYNC_PAGE_LIMIT", "500"))
+SYNC_PAGE_MAX = int(os.getenv("SYNC_PAGE_MAX", "2000"))
+
+# Cursor terakhir dimundurkan sekian detik, supaya baris dari transaksi yang
+# commit belakangan (updated_at = waktu mulai transaksi) tidak terlewat
+SYNC_OVERLAP_SECONDS = int(os.getenv("SYNC_OVERLAP_SECONDS", "60"))
+
+# Umur tombstone (hapus) yang disimpan; cursor lebih tua dari ini = full resync
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30"))
+
+# ==========================================
+# 📦 UNIT CONFIGURATION
+# ==========================================
+
+# Satuan standar -> faktor konversi ke base unit
+STANDARD_UNITS = {
+    'ton': 1000.0, 'kwintal': 100.0, 'ons': 0.1, 'pon': 0.5,
+    'lusin': 12.0, 'kodi': 20.0, 'gross': 144.0, 'rim': 500.0
+}
@@ -1,19 +1,34 @@
 from contextlib import asynccontextmanager
+import asyncio
 import databases
 import os
 import io
 import json
 import uuid
 import sys
+import time
 import uuid
-from app.services.commit_service import commit_transaction_logic, generate_invoice_number
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from app.services.commit_service import commit_transaction_logic, allocate_invoice_number
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from app.schemas import ProcurementDraft, ChatInput, CommitTransactionInput, CommitTransactionResponse, TransactionListItem, TransactionDetailResponse, TransactionItemDetail, TransactionStats, FinancialProfitLoss, ContactItem, ContactCreateInput, ContactUpdateInput, ContactStats, ContactSummary, ProductHistoryItem, ProductListItem, ProductDetailResponse, ProductUpdateInput, ProductStockAddInput, ProductStats, ProductCreateInput, SaleDraft, CommitSaleInput
+from app.schemas import ProcurementDraft, ChatInput, CommitTransactionInput, CommitTransactionResponse, TransactionListItem, TransactionDetailResponse, TransactionItemDetail, TransactionStats, FinancialProfitLoss, ContactItem, ContactCreateInput, ContactUpdateInput, ContactStats, ContactSummary, ProductHistoryItem, ProductListItem, ProductDetailResponse, ProductUpdateInput, ProductStockAddInput, ProductStats, ProductCreateInput, SaleDraft, CommitSaleInput, BatchCommitInput
 from typing import List, Optional
-from app.services.ai_service import parse_procurement_text, parse_procurement_image, parse_sale_text
-from app.services.commit_service import commit_transaction_logic, commit_sale_logic, generate_invoice_number, generate_sku, upsert_contact
+from app.services.ai_service import parse_procurement_text, parse_procurement_image, parse_procurement_images, parse_sale_text, stream_procurement_text, stream_procurement_image
+from app.services.llm_client import close_llm_client, get_llm_stats
+from app.services.fast_parser import get_fast_path_stats
+from app.services.ocr_service import get_ocr_stats, get_ocr_status, shutdown_ocr_pool, warm_up_ocr
+from app.config import OCR_WARMUP, OCR_BATCH_MAX_IMAGES, COMMIT_BATCH_MAX_ENTRIES
+from app.services.catalog_cache import product_catalog
+from app.services.product_matcher import get_product_matcher, score as fuzzy_score
+from app.services.product_search import search_products as search_products_ranked
+from app.services.contact_search import search_contacts as search_contacts_ranked, contact_match_sql, contact_search_indexed
+from app.services.contact_directory import contact_directory, resolve_contact, register_created_contacts
+from app.services.idempotency import run_idempotent, IdempotencyKeyError
+from app.services.delta_sync import fetch_changes, SyncCursorError
+from app.services.cache_sync import start_cache_sync, stop_cache_sync, publish_cache_change
+from app.services.commit_service import commit_transaction_logic, commit_sale_logic, commit_transaction_deferred, commit_sale_deferred, commit_batch_logic, allocate_invoice_number, generate_sku, upsert_contact, lock_products, apply_stock_deltas
 
 # Load environment variables dari file .env
 load_dotenv()
@@ -40,7 +55,16 @@ async def lifespan(app: FastAPI):
         print("✅ Database Connected Successfully!")
     except Exception as e:
         print(f"❌ Database Connection Failed: {e}")
+    await start_cache_sync(os.getenv("CACHE_SYNC_DATABASE_URL") or DATABASE_URL)
+    # Warm-up OCR di background: server langsung terima request, /ready?require=ocr
+    # baru OK setelah model siap
+    warmup_task = asyncio.create_task(warm_up_ocr()) if OCR_WARMUP else None
     yield
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    await stop_cache_sync()
+    shutdown_ocr_pool()
+    await close_llm_client()
     await database.disconnect()
 
 app = FastAPI(
@@ -72,30 +96,81 @@ async def health_check():
     """Health check untuk monitoring."""
     return {"status": "healthy"}
 
-@app.post("/api/v1/parse/text")
-async def parse_text_endpoint(chat_data: ChatInput):
-    print(f"[API_DEBUG] Received Text Input: {chat_data.new_message}")
-    print(f"[API_DEBUG] Current Draft Context: {chat_data.current_draft}")
+
+@app.get("/ready")
+async def readiness_check(require: str = "db,llm"):
+    """
+    Readiness per komponen (db, llm, ocr) untuk load balancer.
+    `require` = daftar komponen yang wajib siap, mis. /ready?require=db,llm,ocr
+    untuk instance yang melayani upload struk. 503 kalau ada yang belum siap.
+    """
+    components = {}
+
+    try:
+        await asyncio.wait_for(database.fetch_val("SELECT 1"), timeout=2)
+        components["db"] = {"status": "ready"}
+    except Exception as e:
+        components["db"] = {"status": "error", "error": str(e) or type(e).__name__}
+
+    if os.getenv("GROQ_API_KEY"):
+        components["llm"] = {"status": "ready"}
+    else:
+        components["llm"] = {"status": "error", "error": "GROQ_API_KEY not set"}
+
+    components["ocr"] = get_ocr_status()
+
+    required = [c.strip() for c in require.split(",") if c.strip()]
+    ready = all(components.get(c, {}).get("status") == "ready" for c in required)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "required": required, "components": components}
+    )
+
+
+@app.get("/api/v1/ai/stats")
+async def ai_stats():
+    """Counter AI pipeline (cache hit/miss, fast path) untuk monitoring."""
+    return {**get_llm_stats(), "fast_path": get_fast_path_stats(), "catalog": product_catalog.stats(), "contacts": contact_directory.stats(), "ocr": get_ocr_stats()}
+
+async def load_procurement_context():
+    """Ambil produk (RAG) dan supplier (dedup) untuk parse teks pengadaan."""
     known_products = []
     known_suppliers = []
     try:
-        # Fetch products with variant for enhanced RAG
-        query = "SELECT name, variant, base_unit, category, conversion_rules FROM products"
-        rows = await database.fetch_all(query=query)
-        known_products = [dict(row) for row in rows]
-        for p in known_products:
-            if isinstance(p.get('conversion_rules'), str):
-                p['conversion_rules'] = json.loads(p['conversion_rules'])
+        # Snapshot katalog (cache in-memory, tidak scan tabel tiap request)
+        known_products = await product_catalog.get(database)
         
-        # Fetch suppliers for deduplication
-        supplier_query = "SELECT name, phone FROM contacts WHERE type = 'SUPPLIER'"
-        supplier_rows = await database.fetch_all(query=supplier_query)
-        known_suppliers = [dict(row) for row in supplier_rows]
+        # Suppliers for deduplication (contact directory cache)
+        known_suppliers = await contact_directory.list_by_type(database, 'SUPPLIER')
                 
     except Exception as e:
         print(f"⚠️ RAG Warning: Gagal ambil data dari DB ({e}). AI akan jalan tanpa konteks.")
         known_products = []
         known_suppliers = []
+    return known_products, known_suppliers
+
+
+def sse_event(event: str, data) -> str:
+    """Format satu event Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    async def body():
+        async for event, data in events:
+            yield sse_event(event, data)
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/v1/parse/text")
+async def parse_text_endpoint(chat_data: ChatInput):
+    print(f"[API_DEBUG] Received Text Input: {chat_data.new_message}")
+    print(f"[API_DEBUG] Current Draft Context: {chat_data.current_draft}")
+    known_products, known_suppliers = await load_procurement_context()
 
     result = await parse_procurement_text(
         text_input=chat_data.new_message,
@@ -108,21 +183,31 @@ async def parse_text_endpoint(chat_data: ChatInput):
     
     return result
 
+
+@app.post("/api/v1/parse/text/stream")
+async def parse_text_stream_endpoint(chat_data: ChatInput):
+    """
+    Versi streaming (SSE) dari /parse/text.
+    Event: "supplier", "item" (per barang), lalu "draft" (hasil final).
+    """
+    known_products, known_suppliers = await load_procurement_context()
+    return sse_response(stream_procurement_text(
+        text_input=chat_data.new_message,
+        current_draft=chat_data.current_draft,
+        known_products=known_products,
+        known_suppliers=known_suppliers
+    ))
+
 # --- ENDPOINT PRODUCT SEARCH (AUTOCOMPLETE) ---
 @app.get("/api/v1/products/search")
 async def search_products(q: str):
     """
     Search products by name for autocomplete.
     Now includes variant for Smart Separation Strategy.
+    Ranked trigram search (typo-tolerant, prefix dulu), lihat product_search.
     """
     try:
-        query = """
-            SELECT id, name, variant, base_unit, category, current_stock, sku, latest_selling_price 
-            FROM products 
-            WHERE name ILIKE :q OR variant ILIKE :q
-            LIMIT 10
-        """
-        rows = await database.fetch_all(query=query, values={"q": f"%{q}%"})
+        rows = await search_products_ranked(database, q)
         
         return [
             {
@@ -153,25 +238,23 @@ async def match_product(name: str, variant: str = None):
     
     Returns candidates with similarity info.
     """
-    from fuzzywuzzy import fuzz
-    
     try:
         # Get all products for matching
-        query = "SELECT id, name, variant, base_unit, category FROM products"
-        rows = await database.fetch_all(query=query)
+        rows = await product_catalog.get(database)
         
         candidates = []
         search_term = f"{name} {variant}".strip() if variant else name
         
-        for row in rows:
+        # Hanya shortlist trigram yang di-skor, bukan seluruh katalog
+        for row in get_product_matcher(rows).shortlist_products(search_term):
             db_name = row["name"]
             db_variant = row["variant"] or ""
             db_full = f"{db_name} {db_variant}".strip()
             
             # Calculate similarity scores
-            name_similarity = fuzz.ratio(name.lower(), db_name.lower())
-            full_similarity = fuzz.ratio(search_term.lower(), db_full.lower())
-            partial_similarity = fuzz.partial_ratio(search_term.lower(), db_full.lower())
+            name_similarity = fuzzy_score("ratio", name.lower(), db_name.lower())
+            full_similarity = fuzzy_score("ratio", search_term.lower(), db_full.lower())
+            partial_similarity = fuzzy_score("partial_ratio", search_term.lower(), db_full.lower())
             
             # Take best score
             best_score = max(name_similarity, full_similarity, partial_similarity)
@@ -216,9 +299,7 @@ async def parse_sale_endpoint(chat_data: ChatInput):
     
     known_products = []
     try:
-        query = "SELECT name, variant, base_unit, category, latest_selling_price FROM products"
-        rows = await database.fetch_all(query=query)
-        known_products = [dict(row) for row in rows]
+        known_products = await product_catalog.get(database)
     except Exception as e:
         print(f"⚠️ DB Error: {e}")
 
@@ -231,24 +312,32 @@ async def parse_sale_endpoint(chat_data: ChatInput):
 
 
 # --- ENDPOINT PARSE IMAGE (PROCUREMENT) ---
-@app.post("/api/v1/parse/image")
-async def parse_image_endpoint(file: UploadFile = File(...), current_draft_str: str = None):
+def parse_draft_str(current_draft_str: str = None):
     # Note: current_draft dikirim sebagai string JSON jika lewat Form Data (Multipart)
-    current_draft = None
     if current_draft_str:
         try:
-            current_draft = json.loads(current_draft_str)
+            return json.loads(current_draft_str)
         except:
             pass
+    return None
 
-    # A. Ambil Context Produk (Sama seperti Text)
+
+async def load_receipt_context():
+    """Ambil konteks produk untuk koreksi hasil OCR (sama seperti Text)."""
     known_products = []
     try:
-        query = "SELECT name, base_unit, conversion_rules FROM products"
-        rows = await database.fetch_all(query=query)
-        known_products = [dict(row) for row in rows]
+        known_products = await product_catalog.get(database)
     except Exception:
         pass
+    return known_products
+
+
+@app.post("/api/v1/parse/image")
+async def parse_image_endpoint(file: UploadFile = File(...), current_draft_str: str = None):
+    current_draft = parse_draft_str(current_draft_str)
+
+    # A. Ambil Context Produk (Sama seperti Text)
+    known_products = await load_receipt_context()
 
     # B. Baca File Gambar
     image_bytes = await file.read()
@@ -263,12 +352,61 @@ async def parse_image_endpoint(file: UploadFile = File(...), current_draft_str:
     return result
 
 
+@app.post("/api/v1/parse/images")
+async def parse_images_endpoint(files: List[UploadFile] = File(...)):
+    """
+    Batch banyak foto struk sekaligus (mis. struk satu hari). OCR dan parse
+    LLM jalan sebagai pipeline; tiap struk dapat draft sendiri + timing per stage.
+    """
+    if len(files) > OCR_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"Maksimal {OCR_BATCH_MAX_IMAGES} gambar per request")
+
+    known_products = await load_receipt_context()
+    images = [await file.read() for file in files]
+
+    started = time.perf_counter()
+    results = await parse_procurement_images(images, known_products)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    stage_totals = {
+        stage: round(sum(r["timings"].get(f"{stage}_ms", 0) for r in results), 1)
+        for stage in ("ocr", "parse")
+    }
+    print(f"[RECEIPT_BATCH] {len(files)} images in {elapsed_ms}ms (stage sums: {stage_totals})")
+    return {
+        "count": len(results),
+        "elapsed_ms": elapsed_ms,
+        "stage_totals_ms": stage_totals,
+        "results": [
+            {"index": i, "filename": file.filename, **result}
+            for i, (file, result) in enumerate(zip(files, results))
+        ],
+    }
+
+
+@app.post("/api/v1/parse/image/stream")
+async def parse_image_stream_endpoint(file: UploadFile = File(...), current_draft_str: str = None):
+    """
+    Versi streaming (SSE) dari /parse/image.
+    Event: "ocr_done", "supplier", "item" (per barang), lalu "draft" (hasil final).
+    """
+    current_draft = parse_draft_str(current_draft_str)
+    known_products = await load_receipt_context()
+    image_bytes = await file.read()
+    return sse_response(stream_procurement_image(
+        image_bytes=image_bytes,
+        current_draft=current_draft,
+        known_products=known_products
+    ))
+
+
 # --- ENDPOINT COMMIT TRANSACTION ---
 @app.post("/api/v1/transactions/commit", response_model=CommitTransactionResponse)
-async def commit_transaction_endpoint(data: CommitTransactionInput):
+async def commit_transaction_endpoint(data: CommitTransactionInput, response: Response, idempotency_key: Optional[str] = Header(None)):
     """
     Commit a procurement transaction to the database.
     This saves data to: contacts, transactions, products, transaction_items, stock_ledger.
+    Optional Idempotency-Key header: retries with the same key return the stored response.
     """
     print(f"[COMMIT API] Received commit request for supplier: {data.supplier_name}")
     print(f"[COMMIT API] Items count: {len(data.items)}")
@@ -278,7 +416,14 @@ async def commit_transaction_endpoint(data: CommitTransactionInput):
     items_dict = [item.dict() for item in data.items]
     
     try:
-        result = await commit_transaction_logic(database, data)
+        result, replayed = await run_idempotent(
+            database, "transactions/commit", idempotency_key, data.dict(),
+            lambda: commit_transaction_deferred(database, data)
+        )
+    except IdempotencyKeyError as e:
+        print(f"[COMMIT API] Idempotency-Key rejected: {e}")
+        response.status_code = 422
+        return CommitTransactionResponse(success=False, message=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -291,20 +436,55 @@ async def commit_transaction_endpoint(data: CommitTransactionInput):
     
     print(f"[COMMIT API] Result: {result}")
     sys.stdout.flush()
-    
+
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
     return CommitTransactionResponse(**result)
 
 
     return CommitTransactionResponse(**result)
 
 
+# --- ENDPOINT BATCH COMMIT (SYNC OFFLINE) ---
+@app.post("/api/v1/transactions/commit/batch")
+async def commit_batch_endpoint(data: BatchCommitInput):
+    """
+    Commit banyak draft yang antri selama offline dalam satu request.
+    Entry diproses berurutan, masing-masing dengan transaksi sendiri; hasil per entry.
+    """
+    if len(data.entries) > COMMIT_BATCH_MAX_ENTRIES:
+        raise HTTPException(status_code=413, detail=f"Maksimal {COMMIT_BATCH_MAX_ENTRIES} transaksi per request")
+
+    started = time.perf_counter()
+    async with database.connection():
+        results = await commit_batch_logic(database, data.entries)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    succeeded = sum(1 for r in results if r["success"])
+    print(f"[COMMIT BATCH] {succeeded}/{len(results)} entries committed in {elapsed_ms}ms")
+    return {
+        "count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed_ms": elapsed_ms,
+        "results": results,
+    }
+
+
 # --- ENDPOINT COMMIT SALE ---
 @app.post("/api/v1/sales/commit")
-async def commit_sale_endpoint(data: CommitSaleInput):
+async def commit_sale_endpoint(data: CommitSaleInput, response: Response, idempotency_key: Optional[str] = Header(None)):
     print(f"[COMMIT SALE] Customer: {data.customer_name}, Items: {len(data.items)}")
     try:
-        result = await commit_sale_logic(database, data)
+        result, replayed = await run_idempotent(
+            database, "sales/commit", idempotency_key, data.dict(),
+            lambda: commit_sale_deferred(database, data)
+        )
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
         return result
+    except IdempotencyKeyError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"[COMMIT SALE ERROR] {e}")
         import traceback
@@ -356,8 +536,11 @@ async def get_transactions(
             values["date_to"] = date_to
             
         if search:
-            conditions.append("(t.invoice_number ILIKE :search OR c.name ILIKE :search)")
+            # Kontak dicari lewat index (nama typo-tolerant / nomor HP)
+            contact_sql, contact_values = contact_match_sql(search, await contact_search_indexed(database), alias="sc")
+            conditions.append(f"(t.invoice_number ILIKE :search OR t.contact_id IN (SELECT sc.id FROM contacts sc WHERE {contact_sql}))")
             values["search"] = f"%{search}%"
+            values.update(contact_values)
             
         where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
         
@@ -428,8 +611,11 @@ async def get_transaction_stats(
             values["date_to"] = date_to
             
         if search:
-            conditions.append("(t.invoice_number ILIKE :search OR c.name ILIKE :search)")
+            # Kontak dicari lewat index (nama typo-tolerant / nomor HP)
+            contact_sql, contact_values = contact_match_sql(search, await contact_search_indexed(database), alias="sc")
+            conditions.append(f"(t.invoice_number ILIKE :search OR t.contact_id IN (SELECT sc.id FROM contacts sc WHERE {contact_sql}))")
             values["search"] = f"%{search}%"
+            values.update(contact_values)
             
         where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
         
@@ -623,24 +809,12 @@ async def get_contact_summary():
 @app.get("/api/v1/contacts/search", response_model=list[ContactItem])
 async def search_contacts(q: str, type: str = None):
     """
-    Search contacts by name for autocomplete.
+    Search contacts by name (or phone number) for autocomplete.
     Optional type filter: "SUPPLIER" or "CUSTOMER".
+    Ranked trigram search (typo-tolerant), lihat contact_search.
     """
     try:
-        base_query = """
-            SELECT id, name, type, phone, address, notes, created_at
-            FROM contacts
-            WHERE name ILIKE :q
-        """
-        values = {"q": f"%{q}%"}
-        
-        if type:
-            base_query += " AND type = :type"
-            values["type"] = type.upper()
-        
-        base_query += " ORDER BY name ASC LIMIT 10"
-        
-        rows = await database.fetch_all(query=base_query, values=values)
+        rows = await search_contacts_ranked(database, q, type)
         
         return [
             ContactItem(
@@ -727,6 +901,8 @@ async def create_contact(data: ContactCreateInput):
         }
         
         row = await database.fetch_one(query=query, values=values)
+        contact_directory.add(row)
+        await publish_cache_change(database, "contacts")
         
         return ContactItem(
             id=str(row["id"]),
@@ -762,7 +938,8 @@ async def update_contact(contact_id: str, data: ContactUpdateInput):
             SET name = :name,
                 phone = :phone,
                 address = :address,
-                notes = :notes
+                notes = :notes,
+                updated_at = NOW()
             WHERE id = CAST(:id AS uuid)
             RETURNING id, name, type, phone, address, notes, created_at
         """
@@ -775,6 +952,8 @@ async def update_contact(contact_id: str, data: ContactUpdateInput):
         }
         
         row = await database.fetch_one(query=query, values=values)
+        contact_directory.add(row)
+        await publish_cache_change(database, "contacts")
         
         return ContactItem(
             id=str(row["id"]),
@@ -985,7 +1164,7 @@ async def create_product(data: ProductCreateInput):
                 )
             
             trans_id = str(uuid.uuid4())
-            invoice_num = generate_invoice_number()
+            invoice_num = await allocate_invoice_number(database)
 
             # PERBAIKAN BUG HARGA: 
             # Total murni didapat dari 'total_price' jikalau frontend mengirim. Jika tidak, gunakan fallback.
@@ -1043,6 +1222,9 @@ async def create_product(data: ProductCreateInput):
                 "qty_change": initial_stock,
                 "stock_after": initial_stock
             })
+
+        product_catalog.upsert(row)
+        await publish_cache_change(database, "products", "upsert", product_id)
         
         return ProductDetailResponse(
             id=product_id,
@@ -1225,6 +1407,12 @@ async def delete_product(product_id: str):
                             "DELETE FROM transactions WHERE id = CAST(:tid AS uuid)",
                             {"tid": tid}
                         )
+                    else:
+                        # Item-nya berkurang: tandai berubah supaya ikut delta sync
+                        await database.execute(
+                            "UPDATE transactions SET updated_at = NOW() WHERE id = CAST(:tid AS uuid)",
+                            {"tid": tid}
+                        )
 
             # 6. Finally delete the product itself
             await database.execute(
@@ -1232,6 +1420,9 @@ async def delete_product(product_id: str):
                 {"id": product_id}
             )
 
+        product_catalog.remove(product_id)
+        await publish_cache_change(database, "products", "remove", product_id)
+
         return {"success": True, "message": "Produk berhasil dihapus"}
         
     except Exception as e:
@@ -1284,6 +1475,8 @@ async def update_product(product_id: str, data: ProductUpdateInput):
             values["average_cost"] = data.average_cost
         
         row = await database.fetch_one(query=query, values=values)
+        product_catalog.upsert(row)
+        await publish_cache_change(database, "products", "upsert", product_id)
         
         return ProductDetailResponse(
             id=str(row["id"]),
@@ -1323,36 +1516,18 @@ async def add_product_stock(product_id: str, data: ProductStockAddInput):
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
+        created_contacts = []
         async with database.transaction():
-            # 1. Find or Create Supplier Contact
+            # 1. Find or Create Supplier Contact (via contact directory)
             supplier_id = None
             if data.supplier_name:
-                # Check existing
-                find_supplier = "SELECT id FROM contacts WHERE LOWER(name) = :name AND type = 'SUPPLIER'"
-                supplier = await database.fetch_one(query=find_supplier, values={"name": data.supplier_name.lower().strip()})
-                
-                if supplier:
-                    supplier_id = str(supplier["id"])
-                    # Optional: Update phone if provided and not set? 
-                    # For simplicity, we just use existing ID.
-                else:
-                    # Create new supplier
-                    new_supplier_id = str(uuid.uuid4())
-                    insert_supplier = """
-                        INSERT INTO contacts (id, name, type, phone, created_at, updated_at)
-                        VALUES (CAST(:id AS uuid), :name, 'SUPPLIER', :phone, NOW(), NOW())
-                        RETURNING id
-                    """
-                    await database.execute(query=insert_supplier, values={
-                        "id": new_supplier_id,
-                        "name": data.supplier_name.strip(),
-                        "phone": data.supplier_phone
-                    })
-                    supplier_id = new_supplier_id
+                supplier_id = await resolve_contact(
+                    database, data.supplier_name, 'SUPPLIER', data.supplier_phone, created=created_contacts
+                )
 
             # 2. Create Transaction (IN)
             transaction_id = str(uuid.uuid4())
-            invoice_number = generate_invoice_number()
+            invoice_number = await allocate_invoice_number(database)
             
             # Calculate total amount
             # total_buy_price is mandatory now
@@ -1389,11 +1564,12 @@ async def add_product_stock(product_id: str, data: ProductStockAddInput):
             })
 
             # 4. Update Product Stock & Average Cost
-            new_stock = float(product["current_stock"] or 0) + data.qty
-            
-            # Calculate new average cost
-            old_stock = float(product["current_stock"] or 0)
-            old_avg = float(product["average_cost"] or 0)
+            # Lock baris produk dulu supaya stok/avg yang dipakai adalah nilai terbaru
+            # (commit lain yang bersamaan menunggu sampai transaksi ini selesai)
+            locked = (await lock_products(database, [product_id])).get(str(product["id"]), product)
+            old_stock = float(locked["current_stock"] or 0)
+            old_avg = float(locked["average_cost"] or 0)
+            new_stock = old_stock + data.qty
             
             new_avg = old_avg # Default
             if new_stock > 0:
@@ -1405,18 +1581,10 @@ async def add_product_stock(product_id: str, data: ProductStockAddInput):
                 effective_old_stock = max(0, old_stock)
                 new_avg = ( (effective_old_stock * old_avg) + total_new_val ) / (effective_old_stock + data.qty)
             
-            update_product_query = """
-                UPDATE products
-                SET current_stock = :stock,
-                    average_cost = :avg,
-                    updated_at = NOW()
-                WHERE id = CAST(:id AS uuid)
-            """
-            await database.execute(query=update_product_query, values={
-                "stock": new_stock,
-                "avg": round(new_avg, 2),
-                "id": product_id
-            })
+            # Stok ditambah di database, stok akhir diambil dari RETURNING
+            pid = str(product["id"])
+            final_stocks = await apply_stock_deltas(database, {pid: data.qty}, {pid: round(new_avg, 2)})
+            new_stock = final_stocks.get(pid, new_stock)
 
             # 5. Insert into Stock Ledger
             insert_ledger = """
@@ -1430,6 +1598,8 @@ async def add_product_stock(product_id: str, data: ProductStockAddInput):
                 "stock_after": new_stock
             })
 
+        await register_created_contacts(database, created_contacts)
+
         return {"success": True, "message": "Stok berhasil ditambahkan", "new_stock": new_stock, "new_avg_cost": round(new_avg, 2)}
 
     except HTTPException:
@@ -1519,6 +1689,86 @@ async def recalculate_product_cost(product_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# --- ENDPOINT DELTA SYNC (MOBILE) ---
+async def sync_page(feed: str, cursor: Optional[str], limit: Optional[int], to_item) -> dict:
+    """Satu halaman change feed; to_item(row) -> dict item untuk client."""
+    try:
+        page = await fetch_changes(database, feed, cursor, limit)
+    except SyncCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "items": [to_item(row) for row in page["rows"]],
+        "deleted": page["deleted"],
+        "next_cursor": page["next_cursor"],
+        "has_more": page["has_more"],
+        "full_resync": page["full_resync"],
+    }
+
+
+@app.get("/api/v1/sync/products")
+async def sync_products(cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Produk yang berubah sejak cursor (tanpa cursor = seluruh katalog, per halaman).
+    Ulangi dengan next_cursor selama has_more; simpan next_cursor untuk sync berikutnya.
+    """
+    return await sync_page("products", cursor, limit, lambda row: {
+        **ProductListItem(
+            id=str(row["id"]),
+            name=row["name"],
+            sku=row["sku"],
+            stock=float(row["current_stock"] or 0),
+            unit=row["base_unit"],
+            price=float(row["latest_selling_price"] or 0),
+            initial=row["name"][:2].upper() if len(row["name"]) >= 2 else row["name"][:1].upper(),
+            category=row["category"],
+            variant=row["variant"]
+        ).dict(),
+        "average_cost": float(row["average_cost"] or 0),
+        "updated_at": str(row["updated_at"]),
+    })
+
+
+@app.get("/api/v1/sync/contacts")
+async def sync_contacts(cursor: Optional[str] = None, limit: Optional[int] = None):
+    """Kontak yang berubah sejak cursor (lihat /sync/products)."""
+    return await sync_page("contacts", cursor, limit, lambda row: {
+        **ContactItem(
+            id=str(row["id"]),
+            name=row["name"] or "Unknown",
+            type=row["type"] or "CUSTOMER",
+            phone=row["phone"],
+            address=row["address"],
+            notes=row["notes"],
+            created_at=str(row["created_at"]) if row["created_at"] else ""
+        ).dict(),
+        "updated_at": str(row["updated_at"]),
+    })
+
+
+@app.get("/api/v1/sync/transactions")
+async def sync_transactions(cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Transaksi yang berubah sejak cursor (lihat /sync/products).
+    contact_id ikut dikirim supaya nama kontak bisa di-join dengan /sync/contacts.
+    """
+    return await sync_page("transactions", cursor, limit, lambda row: {
+        **TransactionListItem(
+            id=str(row["id"]),
+            type=row["type"] or "IN",
+            transaction_date=str(row["transaction_date"]),
+            total_amount=float(row["total_amount"] or 0),
+            invoice_number=row["invoice_number"],
+            payment_method=row["payment_method"],
+            contact_name=row["contact_name"] or "Unknown",
+            contact_phone=row["contact_phone"],
+            contact_address=row["contact_address"],
+            created_at=str(row["created_at"])
+        ).dict(),
+        "contact_id": str(row["contact_id"]) if row["contact_id"] else None,
+        "updated_at": str(row["updated_at"]),
+    })
+
+
 # --- ENDPOINT DASHBOARD SUMMARY ---
 @app.get("/api/v1/dashboard/summary")
 async def get_dashboard_summary():
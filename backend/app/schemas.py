@@ -71,6 +71,19 @@ class CommitSaleInput(BaseModel):
     transaction_date: str = "NOW"
 
 
+class BatchCommitEntry(BaseModel):
+    """One offline-queued draft: type 'IN' (procurement) or 'OUT' (sale)."""
+    type: str
+    idempotency_key: Optional[str] = None
+    transaction: Optional[CommitTransactionInput] = None
+    sale: Optional[CommitSaleInput] = None
+
+
+class BatchCommitInput(BaseModel):
+    """Ordered list of drafts replayed by the app after reconnecting."""
+    entries: List[BatchCommitEntry]
+
+
 class CommitTransactionResponse(BaseModel):
     """Response schema after committing a transaction."""
     success: bool
@@ -1,125 +1,24 @@
 import os
 import json
-import base64
 import re
-import random
-import tempfile
-from groq import Groq
+import asyncio
+import time
 from dotenv import load_dotenv
 from fuzzywuzzy import fuzz
 from datetime import date
-from app.config import GROQ_TEXT_MODEL, GROQ_VISION_MODEL
-
-
-def normalize_phone(phone: str) -> str:
-    """Normalize phone number to always start with '0'."""
-    if not phone:
-        return phone
-    phone = phone.strip().replace(" ", "").replace("-", "")
-    # Remove +62 prefix
-    if phone.startswith("+62"):
-        phone = "0" + phone[3:]
-    elif phone.startswith("62") and len(phone) > 10:
-        phone = "0" + phone[2:]
-    # If starts with 8 (missing leading 0)
-    elif phone and phone[0] == '8':
-        phone = "0" + phone
-    return phone
-
-# EasyOCR for accurate text extraction (simpler than PaddleOCR, no conflicts)
-import easyocr
-
-# Lazy-loaded OCR instance
-_ocr_reader = None
-
-def get_ocr():
-    """Get or create EasyOCR reader (lazy loading for performance)"""
-    global _ocr_reader
-    if _ocr_reader is None:
-        print("[OCR] Initializing EasyOCR (first run may download models)...")
-        # Support Indonesian (id) and English (en) text
-        _ocr_reader = easyocr.Reader(['id', 'en'], gpu=False)
-    return _ocr_reader
-
-def extract_text_from_image(image_bytes) -> str:
-    """
-    Step 1: Extract raw text from image using EasyOCR.
-    REVISED: Better row grouping logic for skewed receipts.
-    """
-    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
-        f.write(image_bytes)
-        temp_path = f.name
-    
-    try:
-        reader = get_ocr()
-        # width_ths=0.7 allows merging closer words
-        result = reader.readtext(temp_path, paragraph=False, width_ths=0.7)
-        
-        if not result:
-            return ""
-        
-        # Helper to get center Y and min X
-        def get_box_center_y(box):
-            return (box[0][1] + box[2][1]) / 2
+from app.config import GROQ_TEXT_MODEL, STANDARD_UNITS
+from app.services.llm_client import chat_completion, stream_chat_completion, extract_json_text
+from app.services.stream_parser import IncrementalDraftParser
+from app.services.fast_parser import fast_parse_procurement, fast_parse_sale
+from app.services.rag_retriever import build_product_context, build_supplier_context
+from app.services.product_matcher import get_product_matcher, full_name
+from app.services.ocr_service import run_ocr_layout, ocr_batch_gate, OCRBusyError
+from app.services.receipt_layout import compact_receipt_text, fast_parse_receipt
+from app.services.contact_directory import normalize_phone
 
-        def get_box_min_x(box):
-            return box[0][0]
-
-        # 1. Sort all boxes by Y (top to bottom)
-        boxes = sorted(result, key=lambda r: get_box_center_y(r[0]))
-        
-        # 2. Group into rows
-        rows = []
-        if boxes:
-            current_row = [boxes[0]]
-            last_y = get_box_center_y(boxes[0][0])
-            
-            # Increased threshold for better line merging (was 30)
-            ROW_THRESHOLD = 50 
-            
-            for box in boxes[1:]:
-                current_y = get_box_center_y(box[0])
-                if abs(current_y - last_y) <= ROW_THRESHOLD:
-                    current_row.append(box)
-                else:
-                    rows.append(current_row)
-                    current_row = [box]
-                    last_y = current_y
-            rows.append(current_row)
-        
-        # 3. Sort each row by X (left to right) and join text
-        lines = []
-        for row in rows:
-            # Sort row items by X coordinate
-            row.sort(key=lambda r: get_box_min_x(r[0]))
-            
-            # Filter low confidence items aggressively
-            # Lowered threshold to 0.1 to catch faint prices
-            row_text = [r[1] for r in row if r[2] > 0.1] 
-            
-            if row_text:
-                lines.append(" ".join(row_text))
-        
-        raw_text = '\n'.join(lines)
-        print(f"[OCR] Extracted {len(lines)} lines. Raw Content:\n{raw_text}")
-        return raw_text
-
-    except Exception as e:
-        print(f"[OCR] Error: {e}")
-        return ""
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path) # Cleanup temp file
 
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-STANDARD_UNITS = {
-    'ton': 1000.0, 'kwintal': 100.0, 'ons': 0.1, 'pon': 0.5,
-    'lusin': 12.0, 'kodi': 20.0, 'gross': 144.0, 'rim': 500.0
-}
-
 # --- FUZZY MATCHING FOR OCR CORRECTION ---
 
 def fuzzy_correct_product_names(ai_response: dict, known_products: list, threshold: int = 70) -> dict:
@@ -138,32 +37,17 @@ def fuzzy_correct_product_names(ai_response: dict, known_products: list, thresho
     if not known_products or 'items' not in ai_response:
         return ai_response
     
-    # Build searchable product name list
-    product_name_map = {}
-    for p in known_products:
-        full_name = p.get('name', '')
-        variant = p.get('variant', '')
-        if variant:
-            full_name = f"{full_name} {variant}"
-        product_name_map[full_name.lower()] = full_name
+    # Index trigram katalog (dibangun sekali per snapshot katalog)
+    matcher = get_product_matcher(known_products)
     
     for item in ai_response.get('items', []):
         ocr_name = item.get('product_name', '')
         if not ocr_name:
             continue
-            
-        ocr_lower = ocr_name.lower()
-        
-        # Find best match
-        best_match = None
-        best_score = 0
         
-        for db_name_lower, db_name_original in product_name_map.items():
-            # Use token_set_ratio for better matching with word order variations
-            score = fuzz.token_set_ratio(ocr_lower, db_name_lower)
-            if score > best_score:
-                best_score = score
-                best_match = db_name_original
+        # Use token_set_ratio for better matching with word order variations
+        product, best_score = matcher.best(ocr_name, "token_set_ratio")
+        best_match = full_name(product) if product else None
         
         # Apply correction if match is good enough
         if best_match and best_score >= threshold:
@@ -683,11 +567,20 @@ async def parse_sale_text(text_input: str, current_draft: dict = None, known_pro
     Focus: Extract Product & Qty. Price defaults to latest_selling_price if not specified.
     """
     try:
-        rag_context = ""
-        if known_products:
-            # Include Price in context for AI to know default price
-            lines = [f"- {p['name']} ({p.get('variant','')}) @ Rp {p.get('latest_selling_price', 0)}" for p in known_products[:100]]
-            rag_context = "AVAILABLE PRODUCTS & PRICES:\n" + "\n".join(lines)
+        # Fast path: pesan sederhana yang produknya ada di katalog, tanpa LLM
+        fast = fast_parse_sale(
+            text_input, current_draft, known_products,
+            normalize_item=lambda item: normalize_item_data(item, product_context=known_products)
+        )
+        if fast:
+            print(f"[FAST_PATH] Sale parsed without LLM: {text_input!r}")
+            return fast
+
+        # Include Price in context for AI to know default price
+        rag_context = build_product_context(
+            text_input, known_products, "AVAILABLE PRODUCTS & PRICES:",
+            lambda p: f"- {p['name']} ({p.get('variant','')}) @ Rp {p.get('latest_selling_price', 0)}"
+        )
 
         draft_context = ""
         if current_draft:
@@ -718,17 +611,18 @@ async def parse_sale_text(text_input: str, current_draft: dict = None, known_pro
         """
         prompt = system_prompt + f"\n{rag_context}"
 
-        completion = client.chat.completions.create(
+        content = await chat_completion(
             model=GROQ_TEXT_MODEL,
             messages=[
                 {"role": "system", "content": prompt},
                 {"role": "user", "content": f"{draft_context}USER INPUT:\n{text_input}"}
             ],
             temperature=0.3,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            use_cache=True
         )
         
-        ai_response = json.loads(completion.choices[0].message.content)
+        ai_response = json.loads(content)
         
         # Post-processing: Normalize items
         for item in ai_response.get('items', []):
@@ -737,17 +631,8 @@ async def parse_sale_text(text_input: str, current_draft: dict = None, known_pro
             # fuzzy match logic reusing existing function logic (simplified)
             # Find matching product in known_products to get official name and default price
             if known_products:
-                # Simple fuzzy check
-                best_p = None
-                best_s = 0
-                item_name = f"{item.get('product_name')} {item.get('variant') or ''}".strip().lower()
-                
-                for p in known_products:
-                     p_name = f"{p['name']} {p.get('variant') or ''}".strip().lower()
-                     score = fuzz.partial_ratio(item_name, p_name)
-                     if score > best_s:
-                         best_s = score
-                         best_p = p
+                item_name = f"{item.get('product_name')} {item.get('variant') or ''}".strip()
+                best_p, best_s = get_product_matcher(known_products).best(item_name, "partial_ratio")
                 
                 if best_p and best_s > 70:
                     item['product_name'] = best_p['name']
@@ -766,241 +651,450 @@ async def parse_sale_text(text_input: str, current_draft: dict = None, known_pro
 
 # --- MAIN EXPORT FUNCTION ---
 
+def build_procurement_text_messages(text_input: str, current_draft: dict = None, known_products: list = None, known_suppliers: list = None) -> list:
+    rag_context = build_product_context(
+        text_input, known_products, "KNOWN PRODUCTS:",
+        lambda p: f"- {p['name']} ({p.get('variant','')})"
+    )
+    supplier_context = build_supplier_context(text_input, known_suppliers)
+
+    draft_context = ""
+    is_missing_supp = True
+    if current_draft:
+        draft_context = f"CURRENT_DRAFT:\n{json.dumps(current_draft, ensure_ascii=False)}\n"
+        if current_draft.get('supplier_name'): is_missing_supp = False
+
+    instruction = MISSING_SUPPLIER_INSTRUCTION if is_missing_supp else ""
+    prompt = BASE_SYSTEM_PROMPT + f"\n{rag_context}\n{supplier_context}\n{instruction}"
+
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": f"{draft_context}USER INPUT:\n{text_input}"}
+    ]
+
+def finalize_procurement_text(ai_response: dict, current_draft: dict = None, known_products: list = None, known_suppliers: list = None) -> dict:
+    # Normalize phone number
+    if ai_response.get('supplier_phone'):
+        ai_response['supplier_phone'] = normalize_phone(ai_response['supplier_phone'])
+    
+    for item in ai_response.get('items', []):
+        normalize_item_data(item, product_context=known_products)
+        
+    final = validate_extracted_items(ai_response)
+    final = check_draft_duplication(final, current_draft) # LOGIKA BARU
+    final = add_supplier_reminder(final, current_draft)
+    final = check_supplier_duplication(final, known_suppliers) # SUPPLIER DEDUP
+    return final
+
 async def parse_procurement_text(text_input: str, current_draft: dict = None, known_products: list = None, known_suppliers: list = None):
     try:
         pre = resolve_ambiguity_preprocessing(text_input, current_draft)
         if pre: return pre 
 
-        rag_context = ""
-        if known_products:
-            lines = [f"- {p['name']} ({p.get('variant','')})" for p in known_products[:50]]
-            rag_context = "KNOWN PRODUCTS:\n" + "\n".join(lines)
-
-        draft_context = ""
-        is_missing_supp = True
-        if current_draft:
-            draft_context = f"CURRENT_DRAFT:\n{json.dumps(current_draft, ensure_ascii=False)}\n"
-            if current_draft.get('supplier_name'): is_missing_supp = False
-
-        instruction = MISSING_SUPPLIER_INSTRUCTION if is_missing_supp else ""
-        prompt = BASE_SYSTEM_PROMPT + f"\n{rag_context}\n{instruction}"
-
-        completion = client.chat.completions.create(
-            model=GROQ_TEXT_MODEL,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": f"{draft_context}USER INPUT:\n{text_input}"}
-            ],
-            temperature=0.3,
-            response_format={"type": "json_object"}
-        )
-        
-        ai_response = json.loads(completion.choices[0].message.content)
-        
-        # Normalize phone number
-        if ai_response.get('supplier_phone'):
-            ai_response['supplier_phone'] = normalize_phone(ai_response['supplier_phone'])
-        
-        for item in ai_response.get('items', []):
-            normalize_item_data(item, product_context=known_products)
-            
-        final = validate_extracted_items(ai_response)
-        final = check_draft_duplication(final, current_draft) # LOGIKA BARU
-        final = add_supplier_reminder(final, current_draft)
-        final = check_supplier_duplication(final, known_suppliers) # SUPPLIER DEDUP
+        # Fast path: pesan sederhana yang produknya ada di katalog, tanpa LLM
+        ai_response = fast_parse_procurement(text_input, current_draft, known_products)
+        if ai_response:
+            print(f"[FAST_PATH] Procurement parsed without LLM: {text_input!r}")
+        else:
+            content = await chat_completion(
+                model=GROQ_TEXT_MODEL,
+                messages=build_procurement_text_messages(text_input, current_draft, known_products, known_suppliers),
+                temperature=0.3,
+                response_format={"type": "json_object"},
+                use_cache=True
+            )
+            ai_response = json.loads(content)
         
-        return final
+        return finalize_procurement_text(ai_response, current_draft, known_products, known_suppliers)
 
     except Exception as e:
         print(f"Error: {e}")
         return {"action": "chat", "follow_up_question": "Sistem sedang sibuk, coba lagi ya Kak!", "items": []}
 
+def build_receipt_messages(raw_text: str, known_products: list = None) -> list:
+    # Build product context for RAG-based correction
+    rag_context = build_product_context(
+        raw_text, known_products, "KNOWN PRODUCTS IN DATABASE (gunakan untuk koreksi typo):",
+        lambda p: f"- {p.get('name', '')} ({p.get('variant', '')})"
+    )
+    
+    ocr_parse_prompt = f"""
+    Kamu adalah asisten yang mengolah hasil OCR struk belanjaan grosir/reseller Indonesia.
+
+    ## TEKS OCR:
+    {raw_text}
+
+    {rag_context}
+
+    ## ATURAN PARSING SUPPLIER - SANGAT PENTING!
+
+    ### 0. PISAHKAN NAMA SUPPLIER DAN ALAMAT (CRITICAL!):
+    - **supplier_name**: HANYA nama toko/usaha (Toko X, UD X, CV X, PT X, Pak/Bu X)
+    - **supplier_address**: Alamat lengkap yang biasanya diawali dengan:
+    - "Jl.", "Jln.", "Jalan" (nama jalan)
+    - "Kec.", "Kecamatan" (kecamatan)
+    - "Kab.", "Kabupaten", "Kota" (kota/kabupaten)
+    - "No.", "Blok", "RT", "RW" (nomor rumah/blok)
+
+    CONTOH BENAR:
+    Struk Header:
+    ```
+    Toko Yunden Jaya
+    Jl. Raya Nanjung no.8
+    kec. Margaasih Kab. Bandung
+    ```
+    → supplier_name: "Toko Yunden Jaya" (HANYA ini!)
+    → supplier_address: "Jl. Raya Nanjung no.8, kec. Margaasih Kab. Bandung"
+
+    CONTOH SALAH:
+    → supplier_name: "Toko Yunden Jaya Raya" ❌ (kata "Raya" adalah bagian dari alamat!)
+
+    ### TIPS IDENTIFIKASI:
+    - Nama supplier biasanya di BARIS PERTAMA dan berformat "Toko/UD/CV + Nama"
+    - Alamat biasanya di baris KEDUA dan KETIGA
+    - JANGAN gabungkan baris alamat ke nama supplier!
+
+    ---
+
+    ## ATURAN PARSING GROSIR - SANGAT PENTING!
+
+    ### 1. PERBEDAAN QTY vs VARIANT:
+    - **qty**: JUMLAH YANG DIBELI (angka berdiri sendiri, biasanya di kolom qty struk)
+    - **variant**: UKURAN/ISI KEMASAN (angka yang menempel dengan kg/gr/L/isi)
+    - **unit**: SATUAN PEMBELIAN (Karton/Dus/Bungkus/Pcs, BUKAN kg jika kg adalah variant!)
+
+    ### 2. CONTOH PARSING BENAR:
+
+    KASUS KARTONAN:
+    Struk: "Kara Santan Kartonan isi 36 | 1 | Rp 175.000"
+    → product_name: "Kara Santan Kartonan"
+    → variant: "Isi 36"
+    → qty: 1
+    → unit: "Karton"
+    → total_price: 175000
+
+    KASUS UKURAN BERAT:
+    Struk: "Singkong jadul ORI 1kg | 5 | Rp 17.000 | Rp 85.000"  
+    → product_name: "Singkong Jadul ORI"
+    → variant: "1kg"
+    → qty: 5 (BUKAN 1! Angka berdiri sendiri = qty)
+    → unit: "Bungkus" (BUKAN kg! kg adalah variant)
+    → unit_price: 17000
+    → total_price: 85000
+
+    Struk: "Singkong jadul balado 1kg | 2 | Rp 20.000 | Rp 40.000"
+    → product_name: "Singkong Jadul Balado"
+    → variant: "1kg"
+    → qty: 2 (BUKAN 1!)
+    → unit: "Bungkus"
+    → total_price: 40000
+
+    ### 3. KOREKSI TYPO OCR:
+    - "Jongkong" → "Singkong"
+    - "Baladu" → "Balado"
+    - "tomyurn" → "tomyum"
+    - "Karuan" → "Kartonan"
+
+    ### 4. HITUNG QTY DARI HARGA (CRITICAL!):
+    - Jika OCR tidak menangkap qty tapi ada harga satuan dan total:
+    - **qty = total_price / unit_price**
+    - Contoh: unit_price=17.000, total=85.000 → qty = 5
+    - Contoh: unit_price=20.000, total=40.000 → qty = 2
+    - JANGAN default ke qty=1 jika bisa dihitung!
+
+    ## OUTPUT FORMAT (JSON):
+    {{
+    "action": "new",
+    "supplier_name": "Nama Toko",
+    "supplier_phone": "Nomor HP",
+    "supplier_address": "Alamat",
+    "transaction_date": "YYYY-MM-DD",
+    "receipt_number": "Nomor nota",
+    "items": [
+        {{"product_name":"Nama Produk", "variant":"ukuran/isi", "qty":1, "unit":"Karton/Bungkus/Pcs", "unit_price":0, "total_price":0, "notes":null}}
+    ],
+    "subtotal": 0,
+    "total": 0,
+    "payment_method": "Tunai/Transfer",
+    "follow_up_question": "Struk terbaca! Cek qty dan variannya ya Kak?",
+    "confidence_score": 0.85
+    }}
+
+    ## PENTING - JANGAN SKIP PRODUK!
+    - Ekstrak SEMUA produk yang ada di teks OCR
+    - Jika ada produk yang tidak jelas, tetap masukkan dengan confidence rendah
+    """
+    
+    return [
+        {"role": "system", "content": ocr_parse_prompt},
+        {"role": "user", "content": "Parse teks OCR di atas menjadi JSON. Koreksi semua typo OCR!"}
+    ]
+
+def build_receipt_table_messages(layout: dict, known_products: list = None) -> list:
+    """
+    Prompt ringkas untuk struk yang tabelnya sudah terbaca (receipt_layout):
+    kolom qty/harga sudah dipisah, jadi contoh-contoh panjang di prompt lama
+    tidak perlu lagi.
+    """
+    table_text = compact_receipt_text(layout)
+    rag_context = build_product_context(
+        table_text, known_products, "KNOWN PRODUCTS IN DATABASE (gunakan untuk koreksi typo):",
+        lambda p: f"- {p.get('name', '')} ({p.get('variant', '')})"
+    )
+
+    ocr_parse_prompt = f"""
+    Kamu mengolah hasil OCR struk grosir Indonesia yang sudah disusun jadi tabel.
+
+    {table_text}
+
+    {rag_context}
+
+    ## ATURAN
+    - supplier_name: HANYA nama toko dari HEADER (Toko/UD/CV/PT X). Baris Jl./Kec./Kab./No./RT/RW = supplier_address.
+    - Tiap baris ITEMS = satu item. qty, unit_price, total_price ambil dari kolomnya (jangan diubah).
+    - Ukuran/isi kemasan di nama (1kg, 500gr, isi 36) = variant, bukan qty; hapus dari product_name.
+    - unit = satuan beli (Karton/Dus/Bungkus/Pcs), BUKAN kg/gr kalau itu variant.
+    - Koreksi typo OCR pakai KNOWN PRODUCTS kalau mirip.
+
+    ## OUTPUT FORMAT (JSON):
+    {{
+    "action": "new", "supplier_name": "Nama Toko", "supplier_phone": "Nomor HP", "supplier_address": "Alamat",
+    "transaction_date": "YYYY-MM-DD", "receipt_number": "Nomor nota",
+    "items": [{{"product_name":"Nama Produk", "variant":"ukuran/isi", "qty":1, "unit":"Karton/Bungkus/Pcs", "unit_price":0, "total_price":0, "notes":null}}],
+    "subtotal": 0, "total": 0, "payment_method": "Tunai/Transfer",
+    "follow_up_question": "Struk terbaca! Cek qty dan variannya ya Kak?", "confidence_score": 0.85
+    }}
+    """
+
+    return [
+        {"role": "system", "content": ocr_parse_prompt},
+        {"role": "user", "content": "Ubah tabel struk di atas menjadi JSON."}
+    ]
+
+def receipt_messages_for(layout: dict, known_products: list = None) -> list:
+    """Prompt tabel ringkas kalau tabel item terbaca, prompt lengkap kalau tidak."""
+    if layout["table_text"]:
+        return build_receipt_table_messages(layout, known_products)
+    return build_receipt_messages(layout["text"], known_products)
+
+def finalize_receipt(ai_response: dict, current_draft: dict = None, known_products: list = None) -> dict:
+    # Normalize phone number
+    if ai_response.get('supplier_phone'):
+        ai_response['supplier_phone'] = normalize_phone(ai_response['supplier_phone'])
+    
+    # ============================================
+    # STEP 3: Post-process with Fuzzy Matching (fallback)
+    # ============================================
+    if known_products:
+        ai_response = fuzzy_correct_product_names(ai_response, known_products)
+    
+    # Normalize items
+    for item in ai_response.get('items', []):
+        normalize_item_data(item, product_context=known_products)
+    
+    # Calculate subtotal/total if not provided
+    if not ai_response.get('subtotal') and ai_response.get('items'):
+        calculated_subtotal = sum(item.get('total_price', 0) for item in ai_response['items'])
+        ai_response['subtotal'] = calculated_subtotal
+        if not ai_response.get('total'):
+            ai_response['total'] = calculated_subtotal
+    
+    # Add default follow-up if not present
+    if not ai_response.get('follow_up_question'):
+        item_count = len(ai_response.get('items', []))
+        total = ai_response.get('total', 0)
+        ai_response['follow_up_question'] = f"✅ Struk berhasil dibaca! {item_count} produk dengan total Rp {total:,.0f}. Ada yang perlu dikoreksi?"
+        ai_response['suggested_actions'] = ["Edit", "Simpan"]
+        
+    final = validate_extracted_items(ai_response)
+    final = check_draft_duplication(final, current_draft)
+    final = add_supplier_reminder(final, current_draft)
+    return final
+
+OCR_BUSY_RESPONSE = {
+    "action": "chat",
+    "follow_up_question": "Antrian scan struk lagi penuh, coba kirim ulang sebentar lagi ya Kak! 🙏",
+    "items": []
+}
+
+OCR_EMPTY_RESPONSE = {
+    "action": "chat", 
+    "follow_up_question": "Tidak bisa membaca teks dari gambar. Pastikan foto struk jelas ya Kak! 📸", 
+    "items": []
+}
+
+RECEIPT_ERROR_RESPONSE = {
+    "action": "chat",
+    "follow_up_question": "Gagal membaca struk. Pastikan gambar jelas dan coba lagi ya Kak! 📸",
+    "items": []
+}
+
+async def parse_receipt_layout(layout: dict, current_draft: dict = None, known_products: list = None) -> dict:
+    """Step 2 pipeline struk: hasil OCR (layout) -> draft (fast path atau LLM)."""
+    raw_text = layout["text"]
+    if not raw_text or len(raw_text.strip()) < 10:
+        return dict(OCR_EMPTY_RESPONSE)
+    
+    # Fast path: tabel konsisten dengan TOTAL struk, tanpa LLM
+    draft = fast_parse_receipt(layout)
+    if draft:
+        print(f"[FAST_PATH] Receipt parsed without LLM ({len(draft['items'])} items)")
+        return finalize_receipt(draft, current_draft, known_products)
+    
+    # This uses the smarter text model + fuzzy matching to correct typos
+    content = await chat_completion(
+        model=GROQ_TEXT_MODEL,
+        messages=receipt_messages_for(layout, known_products),
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        use_cache=True
+    )
+    
+    ai_response = json.loads(content)
+    print(f"[RECEIPT_OCR] Step 2 - Parsed Result: {ai_response}")
+    return finalize_receipt(ai_response, current_draft, known_products)
+
 async def parse_procurement_image(image_bytes, current_draft: dict = None, known_products: list = None):
     """
     TWO-STEP OCR PIPELINE:
-    Step 1: PaddleOCR - Accurate text extraction from image
+    Step 1: EasyOCR - Accurate text extraction from image
     Step 2: Text LLM + RAG - Parse text and correct typos using product database
     """
     try:
         # ============================================
-        # STEP 1: Extract text using PaddleOCR (accurate)
+        # STEP 1: Extract text using EasyOCR + susun tabel item
         # ============================================
-        raw_text = extract_text_from_image(image_bytes)
-        print(f"[RECEIPT_OCR] Step 1 - Raw OCR Text:\n{raw_text}\n")
-        
-        if not raw_text or len(raw_text.strip()) < 10:
-            return {
-                "action": "chat", 
-                "follow_up_question": "Tidak bisa membaca teks dari gambar. Pastikan foto struk jelas ya Kak! 📸", 
-                "items": []
-            }
+        layout = await run_ocr_layout(image_bytes)
         
         # ============================================
         # STEP 2: Parse with Text LLM + Product Database (RAG)
         # ============================================
-        # This uses the smarter text model + fuzzy matching to correct typos
-        
-        # Build product context for RAG-based correction
-        rag_context = ""
-        if known_products:
-            product_names = [f"- {p.get('name', '')} ({p.get('variant', '')})" for p in known_products[:100]]
-            rag_context = f"KNOWN PRODUCTS IN DATABASE (gunakan untuk koreksi typo):\n" + "\n".join(product_names)
-        
-        ocr_parse_prompt = f"""
-        Kamu adalah asisten yang mengolah hasil OCR struk belanjaan grosir/reseller Indonesia.
-
-        ## TEKS OCR:
-        {raw_text}
-
-        {rag_context}
-
-        ## ATURAN PARSING SUPPLIER - SANGAT PENTING!
-
-        ### 0. PISAHKAN NAMA SUPPLIER DAN ALAMAT (CRITICAL!):
-        - **supplier_name**: HANYA nama toko/usaha (Toko X, UD X, CV X, PT X, Pak/Bu X)
-        - **supplier_address**: Alamat lengkap yang biasanya diawali dengan:
-        - "Jl.", "Jln.", "Jalan" (nama jalan)
-        - "Kec.", "Kecamatan" (kecamatan)
-        - "Kab.", "Kabupaten", "Kota" (kota/kabupaten)
-        - "No.", "Blok", "RT", "RW" (nomor rumah/blok)
-
-        CONTOH BENAR:
-        Struk Header:
-        ```
-        Toko Yunden Jaya
-        Jl. Raya Nanjung no.8
-        kec. Margaasih Kab. Bandung
-        ```
-        → supplier_name: "Toko Yunden Jaya" (HANYA ini!)
-        → supplier_address: "Jl. Raya Nanjung no.8, kec. Margaasih Kab. Bandung"
-
-        CONTOH SALAH:
-        → supplier_name: "Toko Yunden Jaya Raya" ❌ (kata "Raya" adalah bagian dari alamat!)
-
-        ### TIPS IDENTIFIKASI:
-        - Nama supplier biasanya di BARIS PERTAMA dan berformat "Toko/UD/CV + Nama"
-        - Alamat biasanya di baris KEDUA dan KETIGA
-        - JANGAN gabungkan baris alamat ke nama supplier!
-
-        ---
-
-        ## ATURAN PARSING GROSIR - SANGAT PENTING!
-
-        ### 1. PERBEDAAN QTY vs VARIANT:
-        - **qty**: JUMLAH YANG DIBELI (angka berdiri sendiri, biasanya di kolom qty struk)
-        - **variant**: UKURAN/ISI KEMASAN (angka yang menempel dengan kg/gr/L/isi)
-        - **unit**: SATUAN PEMBELIAN (Karton/Dus/Bungkus/Pcs, BUKAN kg jika kg adalah variant!)
-
-        ### 2. CONTOH PARSING BENAR:
-
-        KASUS KARTONAN:
-        Struk: "Kara Santan Kartonan isi 36 | 1 | Rp 175.000"
-        → product_name: "Kara Santan Kartonan"
-        → variant: "Isi 36"
-        → qty: 1
-        → unit: "Karton"
-        → total_price: 175000
-
-        KASUS UKURAN BERAT:
-        Struk: "Singkong jadul ORI 1kg | 5 | Rp 17.000 | Rp 85.000"  
-        → product_name: "Singkong Jadul ORI"
-        → variant: "1kg"
-        → qty: 5 (BUKAN 1! Angka berdiri sendiri = qty)
-        → unit: "Bungkus" (BUKAN kg! kg adalah variant)
-        → unit_price: 17000
-        → total_price: 85000
-
-        Struk: "Singkong jadul balado 1kg | 2 | Rp 20.000 | Rp 40.000"
-        → product_name: "Singkong Jadul Balado"
-        → variant: "1kg"
-        → qty: 2 (BUKAN 1!)
-        → unit: "Bungkus"
-        → total_price: 40000
-
-        ### 3. KOREKSI TYPO OCR:
-        - "Jongkong" → "Singkong"
-        - "Baladu" → "Balado"
-        - "tomyurn" → "tomyum"
-        - "Karuan" → "Kartonan"
-
-        ### 4. HITUNG QTY DARI HARGA (CRITICAL!):
-        - Jika OCR tidak menangkap qty tapi ada harga satuan dan total:
-        - **qty = total_price / unit_price**
-        - Contoh: unit_price=17.000, total=85.000 → qty = 5
-        - Contoh: unit_price=20.000, total=40.000 → qty = 2
-        - JANGAN default ke qty=1 jika bisa dihitung!
-
-        ## OUTPUT FORMAT (JSON):
-        {{
-        "action": "new",
-        "supplier_name": "Nama Toko",
-        "supplier_phone": "Nomor HP",
-        "supplier_address": "Alamat",
-        "transaction_date": "YYYY-MM-DD",
-        "receipt_number": "Nomor nota",
-        "items": [
-            {{"product_name":"Nama Produk", "variant":"ukuran/isi", "qty":1, "unit":"Karton/Bungkus/Pcs", "unit_price":0, "total_price":0, "notes":null}}
-        ],
-        "subtotal": 0,
-        "total": 0,
-        "payment_method": "Tunai/Transfer",
-        "follow_up_question": "Struk terbaca! Cek qty dan variannya ya Kak?",
-        "confidence_score": 0.85
-        }}
-
-        ## PENTING - JANGAN SKIP PRODUK!
-        - Ekstrak SEMUA produk yang ada di teks OCR
-        - Jika ada produk yang tidak jelas, tetap masukkan dengan confidence rendah
-        """
-        
-        completion = client.chat.completions.create(
-            model=GROQ_TEXT_MODEL,
-            messages=[
-                {"role": "system", "content": ocr_parse_prompt},
-                {"role": "user", "content": "Parse teks OCR di atas menjadi JSON. Koreksi semua typo OCR!"}
-            ],
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-        
-        ai_response = json.loads(completion.choices[0].message.content)
-        print(f"[RECEIPT_OCR] Step 2 - Parsed Result: {ai_response}")
-        
-        # Normalize phone number
-        if ai_response.get('supplier_phone'):
-            ai_response['supplier_phone'] = normalize_phone(ai_response['supplier_phone'])
-        
-        # ============================================
-        # STEP 3: Post-process with Fuzzy Matching (fallback)
-        # ============================================
-        if known_products:
-            ai_response = fuzzy_correct_product_names(ai_response, known_products)
-        
-        # Normalize items
-        for item in ai_response.get('items', []):
-            normalize_item_data(item, product_context=known_products)
-        
-        # Calculate subtotal/total if not provided
-        if not ai_response.get('subtotal') and ai_response.get('items'):
-            calculated_subtotal = sum(item.get('total_price', 0) for item in ai_response['items'])
-            ai_response['subtotal'] = calculated_subtotal
-            if not ai_response.get('total'):
-                ai_response['total'] = calculated_subtotal
-        
-        # Add default follow-up if not present
-        if not ai_response.get('follow_up_question'):
-            item_count = len(ai_response.get('items', []))
-            total = ai_response.get('total', 0)
-            ai_response['follow_up_question'] = f"✅ Struk berhasil dibaca! {item_count} produk dengan total Rp {total:,.0f}. Ada yang perlu dikoreksi?"
-            ai_response['suggested_actions'] = ["Edit", "Simpan"]
-            
-        final = validate_extracted_items(ai_response)
-        final = check_draft_duplication(final, current_draft)
-        final = add_supplier_reminder(final, current_draft)
-        return final
+        return await parse_receipt_layout(layout, current_draft, known_products)
         
+    except (OCRBusyError, asyncio.TimeoutError) as e:
+        print(f"[RECEIPT_OCR] OCR unavailable: {e!r}")
+        return dict(OCR_BUSY_RESPONSE)
     except Exception as e:
         print(f"[RECEIPT_OCR] Error: {e}")
         import traceback
         traceback.print_exc()
-        return {"action": "chat", "follow_up_question": "Gagal membaca struk. Pastikan gambar jelas dan coba lagi ya Kak! 📸", "items": []}
\ No newline at end of file
+        return dict(RECEIPT_ERROR_RESPONSE)
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+async def parse_procurement_images(images: list, known_products: list = None) -> list:
+    """
+    Batch struk dengan pipeline 2 stage: OCR maksimal max(OCR_WORKERS, 1)
+    gambar bersamaan untuk semua request batch (ocr_batch_gate; sisanya
+    menunggu giliran, tidak kena OCRBusyError),
+    dan begitu OCR satu struk selesai, parse LLM-nya jalan sambil OCR struk
+    berikutnya lanjut. Total waktu ~ stage paling lambat, bukan jumlah semuanya.
+
+    Return list (urutan sama dengan input): {"draft": ..., "timings": {...}}.
+    """
+    ocr_gate = ocr_batch_gate()
+
+    async def process(image_bytes):
+        timings = {}
+        started = time.perf_counter()
+        try:
+            async with ocr_gate:
+                timings["ocr_wait_ms"] = _elapsed_ms(started)
+                ocr_started = time.perf_counter()
+                layout = await run_ocr_layout(image_bytes)
+                timings["ocr_ms"] = _elapsed_ms(ocr_started)
+            parse_started = time.perf_counter()
+            draft = await parse_receipt_layout(layout, None, known_products)
+            timings["parse_ms"] = _elapsed_ms(parse_started)
+        except (OCRBusyError, asyncio.TimeoutError) as e:
+            print(f"[RECEIPT_BATCH] OCR unavailable: {e!r}")
+            draft = dict(OCR_BUSY_RESPONSE)
+        except Exception as e:
+            print(f"[RECEIPT_BATCH] Error: {e}")
+            draft = dict(RECEIPT_ERROR_RESPONSE)
+        timings["total_ms"] = _elapsed_ms(started)
+        return {"draft": draft, "timings": timings}
+
+    return await asyncio.gather(*(process(image_bytes) for image_bytes in images))
+
+# --- STREAMING (SSE) VARIANTS ---
+# Generator yang menghasilkan (event, data): "ocr_done", "supplier", "item", lalu
+# selalu diakhiri "draft" (hasil final yang sama dengan versi non-stream).
+
+def _stream_receipt_item(item: dict, known_products: list = None) -> dict:
+    # Koreksi nama (fuzzy) dulu seperti finalize_receipt, supaya event "item"
+    # tidak menampilkan nama mentah OCR yang nanti berubah di draft akhir
+    item = fuzzy_correct_product_names({"items": [dict(item)]}, known_products)["items"][0]
+    return normalize_item_data(item, product_context=known_products)
+
+async def _stream_llm_draft(messages: list, temperature: float, known_products: list = None, item_fn=None):
+    parser = IncrementalDraftParser()
+    async for delta in stream_chat_completion(
+        model=GROQ_TEXT_MODEL, messages=messages, temperature=temperature,
+        json_mode=True, use_cache=True
+    ):
+        for event, data in parser.feed(delta):
+            if event == "item":
+                data = item_fn(data, known_products) if item_fn else normalize_item_data(dict(data), product_context=known_products)
+            yield event, data
+    yield "parsed", json.loads(extract_json_text(parser.buffer))
+
+async def stream_procurement_text(text_input: str, current_draft: dict = None, known_products: list = None, known_suppliers: list = None):
+    try:
+        pre = resolve_ambiguity_preprocessing(text_input, current_draft)
+        if pre:
+            yield "draft", pre
+            return
+
+        ai_response = fast_parse_procurement(text_input, current_draft, known_products)
+        if ai_response:
+            print(f"[FAST_PATH] Procurement parsed without LLM: {text_input!r}")
+            for item in ai_response['items']:
+                yield "item", normalize_item_data(dict(item), product_context=known_products)
+        else:
+            messages = build_procurement_text_messages(text_input, current_draft, known_products, known_suppliers)
+            async for event, data in _stream_llm_draft(messages, 0.3, known_products):
+                if event == "parsed":
+                    ai_response = data
+                else:
+                    yield event, data
+
+        yield "draft", finalize_procurement_text(ai_response, current_draft, known_products, known_suppliers)
+
+    except Exception as e:
+        print(f"[STREAM] Error: {e}")
+        yield "draft", {"action": "chat", "follow_up_question": "Sistem sedang sibuk, coba lagi ya Kak!", "items": []}
+
+async def stream_procurement_image(image_bytes, current_draft: dict = None, known_products: list = None):
+    try:
+        layout = await run_ocr_layout(image_bytes)
+        raw_text = layout["text"]
+        yield "ocr_done", {"line_count": len(raw_text.splitlines()), "text": raw_text}
+
+        if not raw_text or len(raw_text.strip()) < 10:
+            yield "draft", dict(OCR_EMPTY_RESPONSE)
+            return
+
+        ai_response = fast_parse_receipt(layout)
+        if ai_response:
+            print(f"[FAST_PATH] Receipt parsed without LLM ({len(ai_response['items'])} items)")
+            for item in ai_response['items']:
+                yield "item", _stream_receipt_item(item, known_products)
+        else:
+            messages = receipt_messages_for(layout, known_products)
+            async for event, data in _stream_llm_draft(messages, 0.1, known_products, item_fn=_stream_receipt_item):
+                if event == "parsed":
+                    ai_response = data
+                else:
+                    yield event, data
+
+        print(f"[RECEIPT_OCR] Stream - Parsed Result: {ai_response}")
+        yield "draft", finalize_receipt(ai_response, current_draft, known_products)
+
+    except (OCRBusyError, asyncio.TimeoutError) as e:
+        print(f"[RECEIPT_OCR] OCR unavailable: {e!r}")
+        yield "draft", dict(OCR_BUSY_RESPONSE)
+    except Exception as e:
+        print(f"[RECEIPT_OCR] Stream Error: {e}")
+        yield "draft", dict(RECEIPT_ERROR_RESPONSE)
@@ -0,0 +1,70 @@
+import json
+import uuid
+import asyncpg
+from app.config import CACHE_SYNC_ENABLED, CACHE_SYNC_CHANNEL
+
+# ==========================================
+# CROSS-WORKER CACHE SYNC (Postgres LISTEN/NOTIFY)
+# ==========================================
+# Opsional (CACHE_SYNC_ENABLED). Setiap write memanggil publish_cache_change();
+# worker lain menerima notifikasi dan meng-invalidate cache lokalnya.
+# LISTEN butuh koneksi sesi langsung ke Postgres (bukan lewat pgbouncer mode
+# transaction), jadi listener memakai koneksi asyncpg tersendiri.
+
+WORKER_ID = uuid.uuid4().hex[:12]
+
+_handlers = {}
+_listener_conn = None
+
+
+def register_sync_handler(scope: str, handler):
+    """handler(message: dict) dipanggil untuk notifikasi dari worker lain."""
+    _handlers[scope] = handler
+
+
+async def publish_cache_change(database, scope: str, op: str = "invalidate", key: str = None):
+    """Kirim pg_notify ke worker lain. Gagal kirim tidak boleh menggagalkan request."""
+    if not CACHE_SYNC_ENABLED:
+        return
+    payload = json.dumps({"origin": WORKER_ID, "scope": scope, "op": op, "key": key})
+    try:
+        await database.execute(
+            query="SELECT pg_notify(:channel, :payload)",
+            values={"channel": CACHE_SYNC_CHANNEL, "payload": payload}
+        )
+    except Exception as e:
+        print(f"[CACHE_SYNC] Notify failed: {e}")
+
+
+def _on_notification(connection, pid, channel, payload):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    if message.get("origin") == WORKER_ID:
+        return
+    handler = _handlers.get(message.get("scope"))
+    if handler:
+        handler(message)
+
+
+async def start_cache_sync(dsn: str):
+    global _listener_conn
+    if not CACHE_SYNC_ENABLED or not dsn or _listener_conn is not None:
+        return
+    try:
+        _listener_conn = await asyncpg.connect(dsn, statement_cache_size=0)
+        await _listener_conn.add_listener(CACHE_SYNC_CHANNEL, _on_notification)
+        print(f"[CACHE_SYNC] Listening on '{CACHE_SYNC_CHANNEL}' (worker {WORKER_ID})")
+    except Exception as e:
+        print(f"[CACHE_SYNC] Listener disabled: {e}")
+        _listener_conn = None
+
+
+async def stop_cache_sync():
+    global _listener_conn
+    if _listener_conn is not None:
+        try:
+            await _listener_conn.close()
+        finally:
+            _listener_conn = None
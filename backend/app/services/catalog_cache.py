@@ -0,0 +1,128 @@
+import json
+import time
+import asyncio
+from app.config import CATALOG_MAX_AGE_SECONDS
+from app.services.cache_sync import register_sync_handler
+
+# ==========================================
+# PRODUCT CATALOG SNAPSHOT (in-memory)
+# ==========================================
+# Satu snapshot katalog per proses, dipakai bersama oleh parse text/sale/image
+# dan /products/match. Snapshot TIDAK boleh di-mutate oleh pemakai: setiap
+# perubahan (upsert/remove) membuat list baru + version baru, jadi memo yang
+# berbasis identity list (RAG index) otomatis ikut ter-refresh.
+# Stok & HPP tidak disimpan di sini (berubah tiap commit, tidak dipakai AI).
+
+PRODUCT_FIELDS = ("id", "sku", "name", "variant", "base_unit", "category", "latest_selling_price", "conversion_rules")
+
+# Nilai default untuk produk baru yang di-patch dari data parsial
+PRODUCT_DEFAULTS = {**dict.fromkeys(PRODUCT_FIELDS), "latest_selling_price": 0}
+
+CATALOG_QUERY = f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products"
+
+
+def _row_to_product(row) -> dict:
+    product = dict(row)
+    product['id'] = str(product['id'])
+    if isinstance(product.get('conversion_rules'), str):
+        try:
+            product['conversion_rules'] = json.loads(product['conversion_rules'])
+        except ValueError:
+            product['conversion_rules'] = None
+    return product
+
+
+class ProductCatalog:
+    def __init__(self, max_age_seconds: float = CATALOG_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self.version = 0
+        self._products = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock = None
+        self.loads = 0
+        self.hits = 0
+
+    def _is_fresh(self) -> bool:
+        if self._products is None or self._stale:
+            return False
+        if self.max_age_seconds > 0 and time.monotonic() - self._loaded_at > self.max_age_seconds:
+            return False
+        return True
+
+    async def get(self, database) -> list:
+        """Snapshot katalog saat ini; reload dari DB kalau stale/kadaluarsa."""
+        if self._is_fresh():
+            self.hits += 1
+            return self._products
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Request lain mungkin sudah reload selama kita menunggu lock
+            if self._is_fresh():
+                self.hits += 1
+                return self._products
+            started_version = self.version
+            rows = await database.fetch_all(query=CATALOG_QUERY)
+            products = [_row_to_product(row) for row in rows]
+            if self.version == started_version:
+                self._stale = False
+            self._products = products
+            self._loaded_at = time.monotonic()
+            self.version += 1
+            self.loads += 1
+            print(f"[CATALOG] Loaded {len(products)} products (v{self.version})")
+            return products
+
+    def invalidate(self):
+        """Tandai stale; request berikutnya reload penuh dari DB."""
+        self._stale = True
+        self.version += 1
+
+    def upsert(self, product: dict):
+        """Patch satu produk (hasil INSERT/UPDATE ... RETURNING) tanpa reload."""
+        if self._products is None:
+            return
+        product = {k: v for k, v in _row_to_product(product).items() if k in PRODUCT_FIELDS}
+        updated = []
+        found = False
+        for p in self._products:
+            if p['id'] == product['id']:
+                updated.append({**p, **product})
+                found = True
+            else:
+                updated.append(p)
+        if not found:
+            updated.append({**PRODUCT_DEFAULTS, **product})
+        self._products = updated
+        self.version += 1
+
+    def remove(self, product_id: str):
+        if self._products is None:
+            return
+        self._products = [p for p in self._products if p['id'] != str(product_id)]
+        self.version += 1
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "products": len(self._products) if self._products is not None else None,
+            "stale": not self._is_fresh(),
+            "loads": self.loads,
+            "hits": self.hits,
+        }
+
+
+product_catalog = ProductCatalog()
+
+
+def _on_remote_change(message: dict):
+    # Worker lain mengubah produk: hapus langsung kalau delete, selain itu reload
+    if message.get("op") == "remove" and message.get("key"):
+        product_catalog.remove(message["key"])
+    else:
+        product_catalog.invalidate()
+
+
+register_sync_handler("products", _on_remote_change)
@@ -3,6 +3,10 @@ import re
 import uuid
 from typing import Optional, Dict, Any, List
 from datetime import datetime, date
+from app.services.catalog_cache import product_catalog
+from app.services.cache_sync import publish_cache_change
+from app.services.contact_directory import resolve_contact, register_created_contacts, prefetch_contacts
+from app.services.idempotency import run_idempotent
 
 # --- HELPER FUNCTIONS ---
 
@@ -25,11 +29,57 @@ def calculate_new_average_cost(old_stock: float, old_avg_cost: float, new_qty: f
     total_new_value = new_qty * new_unit_price
     return round((total_old_value + total_new_value) / total_qty, 2)
 
+def base_pricing(qty: float, unit_price: float, variant: Optional[str]):
+    """(conversion_rate, base_qty_change, base_unit_price) untuk satu baris pembelian."""
+    qty = float(qty or 0)
+    unit_price = float(unit_price or 0)
+    conversion_rate = extract_conversion_rate(variant)
+    base_qty_change = qty * conversion_rate
+    # Normalisasi harga ke per-base-unit (per pcs)
+    # unit_price dari OCR = harga total untuk semua qty, bukan per-unit
+    # Contoh: 17.000 total untuk 5 bungkus → 17.000/5 = 3.400/bungkus
+    # Lalu dibagi conversion_rate untuk per-pcs
+    # Contoh: 175.000/karton isi 36pcs → 175.000/1/36 = 4.861/pcs
+    safe_qty = qty if qty > 0 else 1
+    base_unit_price = unit_price / safe_qty / conversion_rate if conversion_rate > 0 else unit_price / safe_qty
+    return conversion_rate, base_qty_change, base_unit_price
+
+def cost_per_base_unit(qty, price, conv_rate) -> float:
+    # price = harga total untuk semua qty, bukan per-unit
+    safe_qty = float(qty or 1)
+    safe_conv = float(conv_rate or 1)
+    return float(price or 0) / safe_qty / safe_conv if safe_qty > 0 and safe_conv > 0 else float(price or 0)
+
+def product_key(name: str, variant: Optional[str]) -> tuple:
+    """Identitas produk saat commit: nama + varian, case-insensitive (NULL == '')."""
+    return ((name or "").lower(), (variant or "").lower())
+
 def generate_invoice_number() -> str:
     date_part = datetime.now().strftime("%Y%m%d")
     random_part = str(uuid.uuid4().int)[:5]
     return f"INV-{date_part}-{random_part}"
 
+# None = belum dicek ke DB
+_invoice_seq_available = None
+
+async def allocate_invoice_number(database) -> str:
+    """
+    INV-YYYYMMDD-000123 dari invoice_number_seq (migrations/005): naik terus,
+    boleh ada gap, tidak pernah bentrok walau banyak commit bersamaan.
+    Tanpa migration 005 pakai generate_invoice_number (acak) seperti dulu.
+    """
+    global _invoice_seq_available
+    if _invoice_seq_available is None:
+        _invoice_seq_available = bool(await database.fetch_val(
+            "SELECT to_regclass('public.invoice_number_seq') IS NOT NULL"
+        ))
+        if not _invoice_seq_available:
+            print("[INVOICE] invoice_number_seq not found, using random invoice numbers")
+    if not _invoice_seq_available:
+        return generate_invoice_number()
+    number = await database.fetch_val("SELECT nextval('invoice_number_seq')")
+    return f"INV-{datetime.now().strftime('%Y%m%d')}-{int(number):06d}"
+
 def parse_date(date_input) -> date:
     if isinstance(date_input, date): return date_input
     if isinstance(date_input, datetime): return date_input.date()
@@ -41,12 +91,8 @@ def parse_date(date_input) -> date:
                 continue
     return datetime.now().date()
 
-async def generate_sku(database, name: str, variant: Optional[str], unit: str, category: Optional[str] = None) -> str:
-    """
-    Generate SKU with format: [KATEGORI]-[MEREK]-[SATUAN]-[NUMBER]
-    Example: FRZ-SING-BKS-001, FRZ-SING-BKS-002, etc.
-    Checks database for existing SKUs and auto-increments to find unique number.
-    """
+def sku_prefix(name: str, variant: Optional[str], unit: str, category: Optional[str] = None) -> str:
+    """Bagian SKU tanpa nomor urut: [KATEGORI]-[MEREK]-[SATUAN]."""
     # Category mapping (3 letters)
     category_map = {
         "frozen": "FRZ", "beku": "FRZ",
@@ -87,95 +133,47 @@ async def generate_sku(database, name: str, variant: Optional[str], unit: str, c
     # Extract SATUAN (2-3 letters)
     satuan = unit_map.get(unit.lower(), unit[:3].upper())
     
-    # Base SKU without number
-    base_sku = f"{kategori}-{merek}-{satuan}"
-    
-    # Query database for existing SKUs with same prefix
-    query = "SELECT sku FROM products WHERE sku LIKE :pattern ORDER BY sku DESC LIMIT 1"
-    existing = await database.fetch_one(query=query, values={"pattern": f"{base_sku}-%"})
-    
-    # Determine next number
-    if existing:
-        # Extract number from last SKU (e.g., "GEN-SING-BKS-003" -> 3)
-        last_sku = existing["sku"]
-        try:
-            last_number = int(last_sku.split("-")[-1])
-            next_number = last_number + 1
-        except (ValueError, IndexError):
-            next_number = 1
-    else:
-        next_number = 1
-    
-    # Format with 3-digit padding (001, 002, etc.)
-    final_sku = f"{base_sku}-{next_number:03d}"
-    
-    return final_sku
+    return f"{kategori}-{merek}-{satuan}"
+
+async def generate_sku(database, name: str, variant: Optional[str], unit: str, category: Optional[str] = None) -> str:
+    """
+    Generate SKU with format: [KATEGORI]-[MEREK]-[SATUAN]-[NUMBER]
+    Example: FRZ-SING-BKS-001, FRZ-SING-BKS-002, etc.
+    Nomor diambil dari counter per prefix (allocate_skus), unik walau bersamaan.
+    """
+    return (await allocate_skus(database, [(name, variant, unit, category)]))[0]
 
 # --- DATABASE OPERATIONS ---
 
-async def upsert_contact(database, name: str, phone: Optional[str], address: Optional[str]) -> str:
-    # Normalize phone number: ensure it starts with '0'
-    if phone:
-        phone = phone.strip().replace(" ", "").replace("-", "")
-        # Remove +62 prefix
-        if phone.startswith("+62"):
-            phone = "0" + phone[3:]
-        elif phone.startswith("62") and len(phone) > 10:
-            phone = "0" + phone[2:]
-        # If starts with 8 (missing leading 0)
-        elif phone and phone[0] == '8':
-            phone = '0' + phone
-    
-    query = "SELECT id FROM contacts WHERE LOWER(name) = LOWER(:name) AND type = 'SUPPLIER'"
-    row = await database.fetch_one(query=query, values={"name": name})
-    if row:
-        return str(row["id"])
-    
-    new_id = str(uuid.uuid4())
-    query = """
-        INSERT INTO contacts (id, name, type, phone, address)
-        VALUES (CAST(:id AS uuid), :name, 'SUPPLIER', :phone, :address)
-    """
-    await database.execute(query=query, values={"id": new_id, "name": name, "phone": phone, "address": address})
-    return new_id
+async def upsert_contact(database, name: str, phone: Optional[str], address: Optional[str], created: list = None) -> str:
+    # Lookup lewat contact directory (cache), INSERT hanya kalau benar-benar baru
+    return await resolve_contact(database, name, 'SUPPLIER', phone, address, created=created)
 
 async def upsert_product(database, name: str, variant: Optional[str], unit: str, qty: float, unit_price: float) -> Dict[str, Any]:
     """
     Update/Insert produk dan mengembalikan data stok terupdate.
     """
-    qty = float(qty or 0)
-    unit_price = float(unit_price or 0)
-    conversion_rate = extract_conversion_rate(variant)
-    base_qty_change = qty * conversion_rate
-    # Normalisasi harga ke per-base-unit (per pcs)
-    # unit_price dari OCR = harga total untuk semua qty, bukan per-unit
-    # Contoh: 17.000 total untuk 5 bungkus → 17.000/5 = 3.400/bungkus
-    # Lalu dibagi conversion_rate untuk per-pcs
-    # Contoh: 175.000/karton isi 36pcs → 175.000/1/36 = 4.861/pcs
-    safe_qty = qty if qty > 0 else 1
-    base_unit_price = unit_price / safe_qty / conversion_rate if conversion_rate > 0 else unit_price / safe_qty
+    conversion_rate, base_qty_change, base_unit_price = base_pricing(qty, unit_price, variant)
 
-    # Cek Existing
+    # Cek Existing (FOR UPDATE: baris produk di-lock sampai transaksi selesai)
     if variant:
-        query = "SELECT id, current_stock, average_cost FROM products WHERE LOWER(name) = LOWER(:name) AND LOWER(variant) = LOWER(:variant)"
+        query = "SELECT id, current_stock, average_cost FROM products WHERE LOWER(name) = LOWER(:name) AND LOWER(variant) = LOWER(:variant) FOR UPDATE"
         params = {"name": name, "variant": variant}
     else:
-        query = "SELECT id, current_stock, average_cost FROM products WHERE LOWER(name) = LOWER(:name) AND (variant IS NULL OR variant = '')"
+        query = "SELECT id, current_stock, average_cost FROM products WHERE LOWER(name) = LOWER(:name) AND (variant IS NULL OR variant = '') FOR UPDATE"
         params = {"name": name}
         
     product = await database.fetch_one(query=query, values=params)
+    new_product = None
 
     if product:
         product_id = str(product["id"])
         old_stock = float(product["current_stock"] or 0)
         old_avg = float(product["average_cost"] or 0)
         new_avg = calculate_new_average_cost(old_stock, old_avg, base_qty_change, base_unit_price)
-        stock_after = old_stock + base_qty_change
-        
-        await database.execute(
-            query="UPDATE products SET current_stock = :stock, average_cost = :avg, updated_at = NOW() WHERE id = CAST(:id AS uuid)",
-            values={"stock": stock_after, "avg": new_avg, "id": product_id}
-        )
+
+        final_stocks = await apply_stock_deltas(database, {product_id: base_qty_change}, {product_id: new_avg})
+        stock_after = final_stocks.get(product_id, old_stock + base_qty_change)
     else:
         product_id = str(uuid.uuid4())
         stock_after = base_qty_change
@@ -188,18 +186,20 @@ async def upsert_product(database, name: str, variant: Optional[str], unit: str,
             """,
             values={"id": product_id, "sku": sku, "name": name, "variant": variant, "unit": unit, "stock": stock_after, "avg": base_unit_price}
         )
+        new_product = {"id": product_id, "sku": sku, "name": name, "variant": variant, "base_unit": unit}
 
     return {
         "product_id": product_id,
         "base_qty_change": float(base_qty_change), 
         "stock_after": float(stock_after),
         "conversion_rate": conversion_rate,
-        "base_unit_price": round(float(base_unit_price), 2)
+        "base_unit_price": round(float(base_unit_price), 2),
+        "new_product": new_product
     }
 
 async def create_transaction_header(database, contact_id, date_str, invoice, total, payment, source, evidence):
     trans_id = str(uuid.uuid4())
-    invoice = invoice or generate_invoice_number()
+    invoice = invoice or await allocate_invoice_number(database)
     query = """
         INSERT INTO transactions (id, type, contact_id, transaction_date, invoice_number, total_amount, payment_method, input_source, evidence_url, created_at, updated_at)
         VALUES (CAST(:id AS uuid), 'IN', CAST(:contact_id AS uuid), :date, :invoice, :total, :payment, :source, :evidence, NOW(), NOW())
@@ -213,10 +213,8 @@ async def create_transaction_header(database, contact_id, date_str, invoice, tot
 
 async def create_transaction_item(database, trans_id, prod_id, qty, unit, price, conv_rate, subtotal, notes):
     # Hitung harga per-pcs untuk disimpan di cost_price_at_moment
-    # price = harga total untuk semua qty, bukan per-unit
-    safe_qty = float(qty or 1)
     safe_conv = float(conv_rate or 1)
-    cost_per_unit = float(price or 0) / safe_qty / safe_conv if safe_qty > 0 and safe_conv > 0 else float(price or 0)
+    cost_per_unit = cost_per_base_unit(qty, price, conv_rate)
     
     query = """
         INSERT INTO transaction_items (id, transaction_id, product_id, input_qty, input_unit, input_price, conversion_rate, cost_price_at_moment, notes, created_at, updated_at)
@@ -242,12 +240,360 @@ async def record_stock_ledger(database, product_id, trans_id, qty_change, stock_
         "qty": qty_safe, "stock": stock_safe, "notes": notes or "Pembelian"
     })
 
+# --- BULK (SET-BASED) OPERATIONS ---
+# Satu query per langkah untuk SEMUA baris (unnest array), bukan 4-5 query
+# per item. Jumlah round-trip commit jadi konstan, tidak ikut jumlah item.
+
+# --- STOCK MUTATIONS (CONCURRENT-SAFE) ---
+# Beberapa kasir bisa commit produk yang sama bersamaan. Supaya stok tidak
+# hilang dan stock_after di ledger sesuai urutan commit:
+# 1. Lock baris produk dulu, selalu urut id (FOR UPDATE + ORDER BY id), jadi
+#    dua transaksi yang menyentuh produk yang sama tidak saling deadlock.
+# 2. Stok diubah di database (current_stock + delta), stok akhir diambil dari
+#    RETURNING - bukan ditulis ulang dari nilai yang dibaca di Python.
+
+LOCK_PRODUCTS_QUERY = """
+    SELECT id, current_stock, average_cost
+    FROM products
+    WHERE id = ANY(CAST(:ids AS uuid[]))
+    ORDER BY id
+    FOR UPDATE
+"""
+
+STOCK_DELTA_QUERY = """
+    UPDATE products p
+    SET current_stock = COALESCE(p.current_stock, 0) + u.delta,
+        average_cost = COALESCE(u.avg, p.average_cost),
+        updated_at = NOW()
+    FROM unnest(CAST(:ids AS uuid[]), CAST(:deltas AS numeric[]), CAST(:avgs AS numeric[])) AS u(id, delta, avg)
+    WHERE p.id = u.id
+    RETURNING p.id, p.current_stock
+"""
+
+async def lock_products(database, product_ids) -> Dict[str, Any]:
+    """Lock produk (urut id) sampai transaksi selesai. Return product_id -> row terbaru."""
+    ids = list(dict.fromkeys(str(pid) for pid in product_ids))
+    if not ids:
+        return {}
+    rows = await database.fetch_all(query=LOCK_PRODUCTS_QUERY, values={"ids": ids})
+    return {str(row["id"]): row for row in rows}
+
+async def apply_stock_deltas(database, deltas: Dict[str, float], avgs: Dict[str, float] = None) -> Dict[str, float]:
+    """
+    current_stock += delta untuk banyak produk dalam satu statement.
+    avgs (opsional): average_cost baru per produk. Return product_id -> stok akhir.
+    """
+    if not deltas:
+        return {}
+    avgs = avgs or {}
+    ids = list(deltas)
+    rows = await database.fetch_all(query=STOCK_DELTA_QUERY, values={
+        "ids": ids,
+        "deltas": [float(deltas[pid]) for pid in ids],
+        "avgs": [avgs.get(pid) for pid in ids],
+    })
+    return {str(row["id"]): float(row["current_stock"] or 0) for row in rows}
+
+def ledger_stock_after(lines: List[tuple], final_stocks: Dict[str, float]) -> List[float]:
+    """
+    stock_after tiap baris ledger dari stok akhir hasil RETURNING.
+    lines = [(product_id, delta)] berurutan; baris terakhir suatu produk =
+    stok akhir, baris sebelumnya dikurangi delta baris-baris sesudahnya.
+    """
+    running = dict(final_stocks)
+    stock_after = []
+    for pid, delta in reversed(lines):
+        stock_after.append(running[pid])
+        running[pid] -= delta
+    stock_after.reverse()
+    return stock_after
+
+RESOLVE_PRODUCTS_QUERY = """
+    SELECT DISTINCT ON (k.key_name, k.key_variant)
+           k.key_name, k.key_variant, p.id, p.current_stock, p.average_cost, p.base_unit
+    FROM unnest(CAST(:names AS text[]), CAST(:variants AS text[])) AS k(key_name, key_variant)
+    JOIN products p
+      ON LOWER(p.name) = k.key_name AND LOWER(COALESCE(p.variant, '')) = k.key_variant
+    ORDER BY k.key_name, k.key_variant, p.created_at
+"""
+
+# Fallback kalau migration 004 belum jalan: nomor terbesar per prefix (numerik)
+LAST_SKU_NUMBERS_QUERY = r"""
+    SELECT k.prefix, MAX(CAST(substring(p.sku FROM '-(\d+)$') AS integer)) AS last_number
+    FROM unnest(CAST(:prefixes AS text[])) AS k(prefix)
+    JOIN products p ON p.sku LIKE k.prefix || '-%'
+    GROUP BY k.prefix
+"""
+
+# Satu blok nomor per prefix dalam satu statement (migrations/004). Baris
+# counter di-lock urut prefix sampai transaksi selesai, jadi dua commit yang
+# membuat produk dengan prefix sama tidak pernah dapat nomor yang sama.
+SKU_COUNTER_QUERY = """
+    INSERT INTO sku_counters AS c (prefix, last_number)
+    SELECT prefix, n
+    FROM unnest(CAST(:prefixes AS text[]), CAST(:counts AS bigint[])) AS k(prefix, n)
+    ORDER BY prefix
+    ON CONFLICT (prefix) DO UPDATE
+      SET last_number = c.last_number + EXCLUDED.last_number, updated_at = NOW()
+    RETURNING prefix, last_number
+"""
+
+# None = belum dicek ke DB
+_sku_counters_available = None
+
+async def sku_counters_available(database) -> bool:
+    """Apakah migration 004 sudah jalan (dicek sekali per proses)."""
+    global _sku_counters_available
+    if _sku_counters_available is None:
+        _sku_counters_available = bool(await database.fetch_val(
+            "SELECT to_regclass('public.sku_counters') IS NOT NULL"
+        ))
+        if not _sku_counters_available:
+            print("[SKU] sku_counters not found, SKU numbers use MAX(sku) scan")
+    return _sku_counters_available
+
+async def resolve_products_bulk(database, keys: List[tuple]) -> Dict[tuple, Any]:
+    """product_key -> row produk yang sudah ada, satu query untuk semua key."""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    rows = await database.fetch_all(query=RESOLVE_PRODUCTS_QUERY, values={
+        "names": [k[0] for k in keys], "variants": [k[1] for k in keys]
+    })
+    return {(row["key_name"], row["key_variant"]): row for row in rows}
+
+async def allocate_skus(database, specs: List[tuple]) -> List[str]:
+    """
+    SKU untuk banyak produk baru sekaligus. specs = [(name, variant, unit[, category])].
+    Tiap prefix dapat satu blok nomor dari sku_counters (dua produk baru dengan
+    prefix sama dapat 001, 002), satu query untuk semua prefix.
+    """
+    prefixes = [sku_prefix(*spec) for spec in specs]
+    if not prefixes:
+        return []
+    counts = {}
+    for prefix in prefixes:
+        counts[prefix] = counts.get(prefix, 0) + 1
+
+    if await sku_counters_available(database):
+        rows = await database.fetch_all(query=SKU_COUNTER_QUERY, values={
+            "prefixes": list(counts), "counts": list(counts.values())
+        })
+        # last_number = nomor terakhir blok ini -> blok mulai dari last_number - n
+        counters = {row["prefix"]: int(row["last_number"]) - counts[row["prefix"]] for row in rows}
+    else:
+        rows = await database.fetch_all(query=LAST_SKU_NUMBERS_QUERY, values={"prefixes": list(counts)})
+        counters = {row["prefix"]: row["last_number"] or 0 for row in rows}
+
+    skus = []
+    for prefix in prefixes:
+        counters[prefix] = counters.get(prefix, 0) + 1
+        skus.append(f"{prefix}-{counters[prefix]:03d}")
+    return skus
+
+async def upsert_products_bulk(database, items: list, resolved: Dict[tuple, Any] = None) -> tuple:
+    """
+    Versi set-based dari upsert_product untuk semua baris pembelian.
+    Return (hasil per baris - bentuknya sama dengan upsert_product, produk baru).
+    Produk lama di-lock dulu (lock_products) lalu stoknya ditambah di database;
+    average_cost dihitung dari nilai yang sudah di-lock. Produk yang muncul di
+    beberapa baris diakumulasi berurutan seperti loop lama.
+    resolved (opsional): product_key -> produk yang sudah di-resolve pemanggil
+    (commit batch); kalau diisi, key yang tidak ada di situ = produk baru.
+    """
+    keys = [product_key(i.product_name, i.variant) for i in items]
+    if resolved is None:
+        existing = await resolve_products_bulk(database, keys)
+    else:
+        existing = {key: resolved[key] for key in keys if key in resolved}
+    locked = await lock_products(database, [row["id"] for row in existing.values()])
+
+    states = {}
+    results = []
+    for item in items:
+        qty = float(item.qty or 0)
+        conversion_rate, base_qty_change, base_unit_price = base_pricing(qty, item.unit_price, item.variant)
+        key = product_key(item.product_name, item.variant)
+        state = states.get(key)
+        if state is None and key not in existing:
+            state = states[key] = {
+                "id": str(uuid.uuid4()), "stock": base_qty_change, "avg": base_unit_price,
+                # Produk baru di-INSERT dengan stok absolut; delta hanya dipakai produk lama
+                "delta": 0.0,
+                "new": {"name": item.product_name, "variant": item.variant, "base_unit": item.unit},
+            }
+        else:
+            if state is None:
+                row = locked.get(str(existing[key]["id"]), existing[key])
+                state = states[key] = {
+                    "id": str(row["id"]), "stock": float(row["current_stock"] or 0),
+                    "avg": float(row["average_cost"] or 0), "delta": 0.0, "new": None,
+                }
+            state["avg"] = calculate_new_average_cost(state["stock"], state["avg"], base_qty_change, base_unit_price)
+            state["stock"] += base_qty_change
+            state["delta"] += base_qty_change
+
+        results.append({
+            "product_id": state["id"],
+            "base_qty_change": float(base_qty_change),
+            "conversion_rate": conversion_rate,
+            "base_unit_price": round(float(base_unit_price), 2),
+        })
+
+    created = [s for s in states.values() if s["new"]]
+    updated = [s for s in states.values() if not s["new"]]
+
+    new_products = []
+    if created:
+        skus = await allocate_skus(database, [(s["new"]["name"], s["new"]["variant"], s["new"]["base_unit"]) for s in created])
+        await database.execute(
+            query="""
+            INSERT INTO products (id, sku, name, variant, base_unit, current_stock, average_cost, created_at, updated_at)
+            SELECT id, sku, name, variant, unit, stock, avg, NOW(), NOW()
+            FROM unnest(
+                CAST(:ids AS uuid[]), CAST(:skus AS text[]), CAST(:names AS text[]), CAST(:variants AS text[]),
+                CAST(:units AS text[]), CAST(:stocks AS numeric[]), CAST(:avgs AS numeric[])
+            ) AS t(id, sku, name, variant, unit, stock, avg)
+            """,
+            values={
+                "ids": [s["id"] for s in created], "skus": skus,
+                "names": [s["new"]["name"] for s in created], "variants": [s["new"]["variant"] for s in created],
+                "units": [s["new"]["base_unit"] for s in created],
+                "stocks": [s["stock"] for s in created], "avgs": [s["avg"] for s in created],
+            }
+        )
+        new_products = [{"id": s["id"], "sku": sku, **s["new"]} for s, sku in zip(created, skus)]
+
+    final_stocks = {s["id"]: float(s["stock"]) for s in states.values()}
+    final_stocks.update(await apply_stock_deltas(
+        database,
+        {s["id"]: s["delta"] for s in updated},
+        {s["id"]: s["avg"] for s in updated},
+    ))
+    stock_after = ledger_stock_after([(r["product_id"], r["base_qty_change"]) for r in results], final_stocks)
+    for result, after in zip(results, stock_after):
+        result["stock_after"] = float(after)
+
+    return results, new_products
+
+async def create_transaction_items_bulk(database, trans_id: str, rows: List[dict]):
+    """Multi-row INSERT transaction_items. rows: prod_id, qty, unit, price, conv, cost_per_unit, notes."""
+    if not rows:
+        return
+    await database.execute(
+        query="""
+        INSERT INTO transaction_items (id, transaction_id, product_id, input_qty, input_unit, input_price, conversion_rate, cost_price_at_moment, notes, created_at, updated_at)
+        SELECT id, CAST(:trans_id AS uuid), prod_id, qty, unit, price, conv, cost, notes, NOW(), NOW()
+        FROM unnest(
+            CAST(:ids AS uuid[]), CAST(:prod_ids AS uuid[]), CAST(:qtys AS numeric[]), CAST(:units AS text[]),
+            CAST(:prices AS numeric[]), CAST(:convs AS numeric[]), CAST(:costs AS numeric[]), CAST(:notes AS text[])
+        ) AS t(id, prod_id, qty, unit, price, conv, cost, notes)
+        """,
+        values={
+            "trans_id": trans_id,
+            "ids": [str(uuid.uuid4()) for _ in rows],
+            "prod_ids": [r["prod_id"] for r in rows],
+            "qtys": [r["qty"] for r in rows],
+            "units": [r["unit"] for r in rows],
+            "prices": [r["price"] for r in rows],
+            "convs": [r["conv"] for r in rows],
+            "costs": [r["cost_per_unit"] for r in rows],
+            "notes": [r["notes"] for r in rows],
+        }
+    )
+
+async def record_stock_ledger_bulk(database, trans_id: str, ledger_type: str, rows: List[dict]):
+    """Multi-row INSERT stock_ledger. rows: product_id, qty_change, stock_after, notes."""
+    if not rows:
+        return
+    # Literal (bukan parameter) supaya langsung di-cast ke enum kolom type
+    if ledger_type not in ("IN", "OUT"):
+        raise ValueError(f"Invalid ledger type: {ledger_type}")
+    await database.execute(
+        query=f"""
+        INSERT INTO stock_ledger (product_id, transaction_id, date, type, qty_change, stock_after, notes)
+        SELECT prod_id, CAST(:trans_id AS uuid), NOW(), '{ledger_type}', qty, stock, notes
+        FROM unnest(
+            CAST(:prod_ids AS uuid[]), CAST(:qtys AS numeric[]), CAST(:stocks AS numeric[]), CAST(:notes AS text[])
+        ) AS t(prod_id, qty, stock, notes)
+        """,
+        values={
+            "trans_id": trans_id,
+            "prod_ids": [r["product_id"] for r in rows],
+            "qtys": [float(r["qty_change"] or 0) for r in rows],
+            "stocks": [float(r["stock_after"] or 0) for r in rows],
+            "notes": [r["notes"] for r in rows],
+        }
+    )
+
+SALE_PRODUCTS_QUERY = """
+    SELECT DISTINCT ON (k.idx) k.idx, p.id, p.current_stock, p.base_unit
+    FROM unnest(CAST(:names AS text[]), CAST(:variants AS text[])) WITH ORDINALITY AS k(key_name, key_variant, idx)
+    JOIN products p
+      ON LOWER(p.name) = k.key_name AND (k.key_variant IS NULL OR LOWER(p.variant) = k.key_variant)
+    ORDER BY k.idx, p.created_at
+"""
+
+async def resolve_sale_products_bulk(database, items: list) -> List[Optional[Any]]:
+    """
+    Produk untuk tiap baris penjualan (None kalau tidak ketemu), satu query.
+    Sama dengan lookup lama: nama wajib sama, varian hanya dicek kalau diisi.
+    """
+    if not items:
+        return []
+    rows = await database.fetch_all(query=SALE_PRODUCTS_QUERY, values={
+        "names": [(item.product_name or "").lower() for item in items],
+        "variants": [item.variant.lower() if item.variant else None for item in items],
+    })
+    by_idx = {row["idx"]: row for row in rows}
+    return [by_idx.get(i + 1) for i in range(len(items))]
+
+async def create_sale_items_bulk(database, trans_id: str, rows: List[dict]):
+    """Multi-row INSERT transaction_items penjualan. rows: prod_id, qty, unit, price, subtotal."""
+    if not rows:
+        return
+    await database.execute(
+        query="""
+        INSERT INTO transaction_items (id, transaction_id, product_id, input_qty, input_unit, input_price, subtotal, created_at)
+        SELECT id, CAST(:trans_id AS uuid), prod_id, qty, unit, price, subtotal, NOW()
+        FROM unnest(
+            CAST(:ids AS uuid[]), CAST(:prod_ids AS uuid[]), CAST(:qtys AS numeric[]), CAST(:units AS text[]),
+            CAST(:prices AS numeric[]), CAST(:subtotals AS numeric[])
+        ) AS t(id, prod_id, qty, unit, price, subtotal)
+        """,
+        values={
+            "trans_id": trans_id,
+            "ids": [str(uuid.uuid4()) for _ in rows],
+            "prod_ids": [r["prod_id"] for r in rows],
+            "qtys": [r["qty"] for r in rows],
+            "units": [r["unit"] for r in rows],
+            "prices": [r["price"] for r in rows],
+            "subtotals": [r["subtotal"] for r in rows],
+        }
+    )
+
 # --- MAIN SERVICE FUNCTION ---
 
-async def commit_transaction_logic(database, data):
+def purchase_lines(data) -> list:
+    """Baris pembelian yang di-commit (qty > 0)."""
+    return [item for item in data.items if float(item.qty or 0) > 0]
+
+def sale_lines(data) -> list:
+    """Baris penjualan yang di-commit (qty > 0)."""
+    return [item for item in data.items if float(item.qty) > 0]
+
+async def commit_transaction_deferred(database, data, resolved: Dict[tuple, Any] = None):
+    """
+    Commit pembelian, tanpa langkah cache. Return (result, after_commit):
+    after_commit() memasukkan supplier/produk baru ke cache dan WAJIB dipanggil
+    setelah transaksi terluar benar-benar commit (lihat run_idempotent).
+    resolved: map produk milik commit batch (lihat upsert_products_bulk);
+    produk baru ikut dimasukkan ke situ oleh after_commit.
+    """
+    created_contacts = []
     async with database.transaction():
         # 1. Supplier
-        contact_id = await upsert_contact(database, data.supplier_name, data.supplier_phone, data.supplier_address)
+        contact_id = await upsert_contact(database, data.supplier_name, data.supplier_phone, data.supplier_address, created=created_contacts)
         
         # 2. Header
         trans_id, invoice_num = await create_transaction_header(
@@ -255,62 +601,70 @@ async def commit_transaction_logic(database, data):
             data.total, data.payment_method, data.input_source, data.evidence_url
         )
         
-        # 3. Items
-        items_processed = 0
-        for item in data.items:
-            p_qty = float(item.qty or 0)
-            if p_qty <= 0: continue
-
-            # A. Upsert Product
-            prod_result = await upsert_product(
-                database, item.product_name, item.variant, item.unit, p_qty, float(item.unit_price or 0)
-            )
-            
-            # B. Transaction Item
-            await create_transaction_item(
-                database, trans_id, prod_result["product_id"],
-                p_qty, item.unit, float(item.unit_price or 0), prod_result["conversion_rate"], 
-                float(item.total_price or 0), item.notes
-            )
-            
-            # C. Stock Ledger - Gunakan key yang BENAR: 'base_qty_change'
-            await record_stock_ledger(
-                database, 
-                prod_result["product_id"], 
-                trans_id, 
-                prod_result["base_qty_change"], # KEY DIPERBAIKI DISINI
-                prod_result["stock_after"], 
-                "Pembelian Masuk"
-            )
-            items_processed += 1
-            
-        return {
-            "success": True,
-            "transaction_id": trans_id,
-            "invoice_number": invoice_num,
-            "items_processed": items_processed,
-            "message": "Transaksi berhasil disimpan!"
-        }
+        # 3. Items (set-based: jumlah query tidak tergantung jumlah item)
+        items = purchase_lines(data)
 
-async def commit_sale_logic(database, data):
+        # A. Upsert Products (1 SELECT + INSERT produk baru + 1 UPDATE)
+        prod_results, new_products = await upsert_products_bulk(database, items, resolved)
+
+        # B. Transaction Items (1 multi-row INSERT)
+        await create_transaction_items_bulk(database, trans_id, [
+            {
+                "prod_id": result["product_id"], "qty": float(item.qty), "unit": item.unit,
+                "price": float(item.unit_price or 0), "conv": float(result["conversion_rate"] or 1),
+                "cost_per_unit": round(cost_per_base_unit(item.qty, item.unit_price, result["conversion_rate"]), 2),
+                "notes": item.notes,
+            }
+            for item, result in zip(items, prod_results)
+        ])
+
+        # C. Stock Ledger (1 multi-row INSERT)
+        await record_stock_ledger_bulk(database, trans_id, "IN", [
+            {
+                "product_id": result["product_id"], "qty_change": result["base_qty_change"],
+                "stock_after": result["stock_after"], "notes": "Pembelian Masuk",
+            }
+            for result in prod_results
+        ])
+        items_processed = len(items)
+
+    # Supplier & produk baru masuk cache setelah transaksi benar-benar commit
+    async def after_commit():
+        await register_created_contacts(database, created_contacts)
+        for product in new_products:
+            product_catalog.upsert(product)
+            if resolved is not None:
+                resolved[product_key(product["name"], product["variant"])] = product
+        if new_products:
+            await publish_cache_change(database, "products")
+
+    return {
+        "success": True,
+        "transaction_id": trans_id,
+        "invoice_number": invoice_num,
+        "items_processed": items_processed,
+        "message": "Transaksi berhasil disimpan!"
+    }, after_commit
+
+async def commit_transaction_logic(database, data):
+    result, after_commit = await commit_transaction_deferred(database, data)
+    await after_commit()
+    return result
+
+async def commit_sale_deferred(database, data, products: list = None):
+    """
+    Commit penjualan, tanpa langkah cache. Return (result, after_commit) seperti commit_transaction_deferred.
+    products (opsional): produk per baris qty > 0 yang sudah di-resolve pemanggil (commit batch).
+    """
+    created_contacts = []
     async with database.transaction():
         # 1. Customer (Upsert if name provided, else use default ID or create 'Pelanggan Umum')
         customer_name = data.customer_name or "Pelanggan Umum"
-        query_cust = "SELECT id FROM contacts WHERE LOWER(name) = LOWER(:name) AND type = 'CUSTOMER'"
-        cust_row = await database.fetch_one(query=query_cust, values={"name": customer_name})
-        
-        if cust_row:
-            contact_id = str(cust_row["id"])
-        else:
-            contact_id = str(uuid.uuid4())
-            await database.execute(
-                query="INSERT INTO contacts (id, name, type, created_at) VALUES (CAST(:id AS uuid), :name, 'CUSTOMER', NOW())",
-                values={"id": contact_id, "name": customer_name}
-            )
+        contact_id = await resolve_contact(database, customer_name, 'CUSTOMER', created=created_contacts)
 
         # 2. Transaction Header (OUT)
         trans_id = str(uuid.uuid4())
-        invoice_num = generate_invoice_number()
+        invoice_num = await allocate_invoice_number(database)
         
         # Parse date logic similar to commit_transaction
         trx_date = datetime.now().date() 
@@ -328,58 +682,133 @@ async def commit_sale_logic(database, data):
             }
         )
 
-        # 3. Items & Stock Update
-        for item in data.items:
+        # 3. Items & Stock Update (set-based, latency tidak ikut jumlah item)
+        # We assume product MUST exist for Sale (frontend should validate or AI should match)
+        # Baris yang produknya tidak ketemu di-skip (sama seperti sebelumnya).
+        items = sale_lines(data)
+        if products is None:
+            products = await resolve_sale_products_bulk(database, items)
+
+        deltas = {}
+        sale_rows, ledger_lines = [], []
+        for item, product in zip(items, products):
+            if not product:
+                continue
+            pid = str(product["id"])
             qty = float(item.qty)
-            if qty <= 0: continue
-            
-            # Find Product
-            # We assume product MUST exist for Sale (frontend should validate or AI should match)
-            # If not found by exact name/variant, we might skip or error. 
-            # For robustness, we try fuzzy or just name.
-            
-            # Simple match by name and variant
-            p_query = "SELECT id, current_stock, base_unit FROM products WHERE LOWER(name) = LOWER(:name)"
-            p_vals = {"name": item.product_name}
-            if item.variant:
-                p_query += " AND LOWER(variant) = LOWER(:var)"
-                p_vals["var"] = item.variant
-            
-            product = await database.fetch_one(query=p_query, values=p_vals)
-            
-            if product:
-                pid = str(product["id"])
-                
-                # Insert Transaction Item
-                await database.execute(
-                    query="""
-                        INSERT INTO transaction_items (id, transaction_id, product_id, input_qty, input_unit, input_price, subtotal, created_at)
-                        VALUES (CAST(:id AS uuid), CAST(:tid AS uuid), CAST(:pid AS uuid), :qty, :unit, :price, :sub, NOW())
-                    """,
-                    values={
-                        "id": str(uuid.uuid4()), "tid": trans_id, "pid": pid,
-                        "qty": qty, "unit": item.unit, 
-                        "price": float(item.unit_price or 0), # Selling price
-                        "sub": float(item.total_price)
-                    }
-                )
-                
-                # Update Stock (Reduce)
-                new_stock = float(product["current_stock"] or 0) - qty
-                await database.execute(
-                    query="UPDATE products SET current_stock = :stock, updated_at = NOW() WHERE id = CAST(:id AS uuid)",
-                    values={"stock": new_stock, "id": pid}
-                )
-                
-                # Ledger (OUT)
-                await database.execute(
-                     query="INSERT INTO stock_ledger (product_id, transaction_id, date, type, qty_change, stock_after, notes) VALUES (CAST(:pid AS uuid), CAST(:tid AS uuid), NOW(), 'OUT', :qty, :stock, 'Penjualan')",
-                     values={"pid": pid, "tid": trans_id, "qty": -qty, "stock": new_stock}
-                )
-
-        return {
-            "success": True, 
-            "message": "Penjualan berhasil disimpan",
-            "transaction_id": trans_id,
-            "invoice_number": invoice_num
-        }
\ No newline at end of file
+            deltas[pid] = deltas.get(pid, 0.0) - qty
+
+            sale_rows.append({
+                "prod_id": pid, "qty": qty, "unit": item.unit,
+                "price": float(item.unit_price or 0),  # Selling price
+                "subtotal": float(item.total_price),
+            })
+            ledger_lines.append((pid, -qty))
+
+        # Lock urut id, lalu kurangi stok di database (atomic, stok akhir dari RETURNING)
+        await lock_products(database, deltas.keys())
+        final_stocks = await apply_stock_deltas(database, deltas)
+
+        await create_sale_items_bulk(database, trans_id, sale_rows)
+        await record_stock_ledger_bulk(database, trans_id, "OUT", [
+            {"product_id": pid, "qty_change": delta, "stock_after": after, "notes": "Penjualan"}
+            for (pid, delta), after in zip(ledger_lines, ledger_stock_after(ledger_lines, final_stocks))
+        ])
+
+    async def after_commit():
+        await register_created_contacts(database, created_contacts)
+
+    return {
+        "success": True, 
+        "message": "Penjualan berhasil disimpan",
+        "transaction_id": trans_id,
+        "invoice_number": invoice_num
+    }, after_commit
+
+async def commit_sale_logic(database, data):
+    result, after_commit = await commit_sale_deferred(database, data)
+    await after_commit()
+    return result
+
+# --- BATCH COMMIT (SYNC OFFLINE) ---
+
+BATCH_ENTRY_TYPES = {
+    # type -> (endpoint idempotency, field payload, fungsi commit)
+    "IN": ("transactions/commit", "transaction", commit_transaction_deferred),
+    "OUT": ("sales/commit", "sale", commit_sale_deferred),
+}
+
+def batch_created_product(resolved: Dict[tuple, Any], item) -> Optional[Any]:
+    """
+    Produk penjualan yang baru dibuat entry pembelian sebelumnya di batch yang
+    sama (aturan cocok sama dengan SALE_PRODUCTS_QUERY: varian hanya dicek
+    kalau diisi, produk paling awal menang).
+    """
+    name = (item.product_name or "").lower()
+    if item.variant:
+        return resolved.get((name, item.variant.lower()))
+    return next((product for key, product in resolved.items() if key[0] == name), None)
+
+async def commit_batch_logic(database, entries: list) -> List[dict]:
+    """
+    Commit draft-draft offline berurutan (urutan input = urutan di kasir).
+    Tiap entry transaksi DB sendiri: yang gagal di-rollback sendiri, entry lain
+    tetap tersimpan. idempotency_key per entry memakai namespace yang sama
+    dengan endpoint tunggal, jadi draft yang sudah sempat masuk tidak dobel.
+
+    Produk dan kontak semua entry di-resolve sekali di awal (set-based), bukan
+    per entry. Produk baru dari entry pembelian masuk ke map `resolved` setelah
+    entry itu commit, jadi entry sesudahnya memakai produk yang sama.
+    """
+    payloads = []
+    for entry in entries:
+        spec = BATCH_ENTRY_TYPES.get((entry.type or "").upper())
+        payloads.append(getattr(entry, spec[1]) if spec else None)
+    purchases = [p for e, p in zip(entries, payloads) if p is not None and e.type.upper() == "IN"]
+    sales = [p for e, p in zip(entries, payloads) if p is not None and e.type.upper() == "OUT"]
+
+    # 1 query produk pembelian + 1 query produk penjualan + (kalau cache miss) 1 query kontak
+    resolved = await resolve_products_bulk(database, [
+        product_key(item.product_name, item.variant) for data in purchases for item in purchase_lines(data)
+    ])
+    sale_items = [item for data in sales for item in sale_lines(data)]
+    found = iter(await resolve_sale_products_bulk(database, sale_items))
+    # Dipotong lagi per entry penjualan (urutan sama dengan sale_items)
+    sale_products = [[next(found) for _ in sale_lines(data)] for data in sales]
+    await prefetch_contacts(
+        database,
+        [(data.supplier_name, "SUPPLIER", data.supplier_phone) for data in purchases]
+        + [(data.customer_name or "Pelanggan Umum", "CUSTOMER", None) for data in sales]
+    )
+
+    def entry_commit(entry_type, commit_fn, payload):
+        if entry_type == "IN":
+            return lambda: commit_fn(database, payload, resolved)
+        # Dihitung saat entry dijalankan: produk baru dari entry sebelumnya sudah masuk `resolved`
+        products = sale_products[sales.index(payload)]
+        return lambda: commit_fn(database, payload, [
+            product or batch_created_product(resolved, item)
+            for item, product in zip(sale_lines(payload), products)
+        ])
+
+    results = []
+    for index, (entry, payload) in enumerate(zip(entries, payloads)):
+        entry_type = (entry.type or "").upper()
+        if payload is None:
+            results.append({
+                "index": index, "type": entry_type, "success": False,
+                "error": "type harus IN (isi 'transaction') atau OUT (isi 'sale')",
+            })
+            continue
+
+        endpoint, _, commit_fn = BATCH_ENTRY_TYPES[entry_type]
+        try:
+            result, replayed = await run_idempotent(
+                database, endpoint, entry.idempotency_key, payload.dict(),
+                entry_commit(entry_type, commit_fn, payload)
+            )
+            results.append({"index": index, "type": entry_type, "success": True, "replayed": replayed, "result": result})
+        except Exception as e:
+            print(f"[COMMIT BATCH] Entry {index} ({entry_type}) failed: {e}")
+            results.append({"index": index, "type": entry_type, "success": False, "error": str(e)})
+    return results
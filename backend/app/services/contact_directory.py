@@ -0,0 +1,252 @@
+import re
+import time
+import uuid
+import asyncio
+from typing import Optional
+from app.config import CONTACT_CACHE_MAX_AGE_SECONDS
+from app.services.cache_sync import register_sync_handler, publish_cache_change
+
+# ==========================================
+# CONTACT DIRECTORY (supplier/customer cache)
+# ==========================================
+# Index in-memory kontak per type: nama ternormalisasi dan nomor HP
+# ternormalisasi -> contact. Dipakai dedup supplier saat parse dan resolusi
+# kontak saat commit, supaya tidak query LOWER(name) ke DB setiap request.
+# Kontak yang baru di-INSERT di dalam transaksi baru masuk directory setelah
+# transaksi commit (lihat parameter `created` di resolve_contact).
+
+CONTACT_QUERY = "SELECT id, name, type, phone FROM contacts"
+
+
+def normalize_name(name: str) -> str:
+    return re.sub(r"\s+", " ", (name or "").strip().lower())
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Normalize phone number to always start with '0'."""
+    if not phone:
+        return phone
+    phone = phone.strip().replace(" ", "").replace("-", "")
+    # Remove +62 prefix
+    if phone.startswith("+62"):
+        phone = "0" + phone[3:]
+    elif phone.startswith("62") and len(phone) > 10:
+        phone = "0" + phone[2:]
+    # If starts with 8 (missing leading 0)
+    elif phone and phone[0] == '8':
+        phone = '0' + phone
+    return phone
+
+
+def phone_key(phone: Optional[str]) -> Optional[str]:
+    digits = re.sub(r"\D", "", normalize_phone(phone) or "")
+    # Nomor terlalu pendek tidak dipakai sebagai identitas
+    return digits if len(digits) >= 8 else None
+
+
+def _row_to_contact(row) -> dict:
+    contact = dict(row)
+    return {
+        "id": str(contact["id"]),
+        "name": contact["name"],
+        "type": str(contact.get("type") or "CUSTOMER"),
+        "phone": contact.get("phone"),
+    }
+
+
+class ContactDirectory:
+    def __init__(self, max_age_seconds: float = CONTACT_CACHE_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self.version = 0
+        self._contacts = None       # id -> contact
+        self._by_name = {}          # (type, normalized name) -> contact
+        self._by_phone = {}         # (type, phone digits) -> contact
+        self._lists = {}            # type -> list snapshot (dipakai dedup/RAG)
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock = None
+        self.loads = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self) -> bool:
+        if self._contacts is None or self._stale:
+            return False
+        if self.max_age_seconds > 0 and time.monotonic() - self._loaded_at > self.max_age_seconds:
+            return False
+        return True
+
+    async def ensure_loaded(self, database):
+        if self._is_fresh():
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._is_fresh():
+                return
+            started_version = self.version
+            rows = await database.fetch_all(query=CONTACT_QUERY)
+            self._contacts = {}
+            self._by_name = {}
+            self._by_phone = {}
+            for row in rows:
+                self._index(_row_to_contact(row))
+            self._lists = {}
+            if self.version == started_version:
+                self._stale = False
+            self._loaded_at = time.monotonic()
+            self.version += 1
+            self.loads += 1
+            print(f"[CONTACTS] Loaded {len(self._contacts)} contacts (v{self.version})")
+
+    def _index(self, contact: dict):
+        self._contacts[contact["id"]] = contact
+        # Kontak paling awal menang kalau ada nama/HP kembar (sama seperti LIMIT 1 lama)
+        self._by_name.setdefault((contact["type"], normalize_name(contact["name"])), contact)
+        key = phone_key(contact.get("phone"))
+        if key:
+            self._by_phone.setdefault((contact["type"], key), contact)
+
+    def _unindex(self, contact_id: str):
+        old = self._contacts.pop(contact_id, None)
+        if not old:
+            return
+        name_key = (old["type"], normalize_name(old["name"]))
+        if self._by_name.get(name_key) is old:
+            del self._by_name[name_key]
+        key = phone_key(old.get("phone"))
+        if key and self._by_phone.get((old["type"], key)) is old:
+            del self._by_phone[(old["type"], key)]
+
+    def find(self, contact_type: str, name: str = None, phone: str = None) -> Optional[dict]:
+        """Cari di cache: nama dulu, lalu nomor HP."""
+        if self._contacts is None:
+            return None
+        contact = self._by_name.get((contact_type, normalize_name(name))) if name else None
+        if contact is None and phone_key(phone):
+            contact = self._by_phone.get((contact_type, phone_key(phone)))
+        return contact
+
+    async def list_by_type(self, database, contact_type: str) -> list:
+        """Snapshot kontak satu type (jangan di-mutate)."""
+        await self.ensure_loaded(database)
+        contacts = self._lists.get(contact_type)
+        if contacts is None:
+            contacts = [c for c in self._contacts.values() if c["type"] == contact_type]
+            self._lists[contact_type] = contacts
+        return contacts
+
+    def add(self, row):
+        """Patch satu kontak (hasil INSERT/UPDATE ... RETURNING) tanpa reload."""
+        if self._contacts is None:
+            return
+        contact = _row_to_contact(row)
+        self._unindex(contact["id"])
+        self._index(contact)
+        self._lists = {}
+        self.version += 1
+
+    def invalidate(self):
+        self._stale = True
+        self.version += 1
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "contacts": len(self._contacts) if self._contacts is not None else None,
+            "stale": not self._is_fresh(),
+            "loads": self.loads,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+contact_directory = ContactDirectory()
+
+
+async def resolve_contact(database, name: str, contact_type: str, phone: Optional[str] = None,
+                          address: Optional[str] = None, created: list = None) -> str:
+    """
+    Cari id kontak (per type) berdasarkan nama / nomor HP, buat baru kalau belum ada.
+    Kalau dipanggil di dalam transaksi, kirim list `created`: kontak baru
+    ditampung di situ dan baru dimasukkan ke directory (add) setelah commit,
+    supaya id dari transaksi yang rollback tidak pernah masuk cache.
+    """
+    name = (name or "").strip()
+    phone = normalize_phone(phone)
+
+    await contact_directory.ensure_loaded(database)
+    contact = contact_directory.find(contact_type, name, phone)
+    if contact:
+        contact_directory.hits += 1
+        return contact["id"]
+    contact_directory.misses += 1
+
+    # Cache miss: cek DB (kontak dari worker lain / belum ter-reload)
+    row = await database.fetch_one(
+        query="SELECT id, name, type, phone FROM contacts WHERE LOWER(name) = LOWER(:name) AND type = :type LIMIT 1",
+        values={"name": name, "type": contact_type}
+    )
+    if row:
+        contact_directory.add(row)
+        return str(row["id"])
+
+    new_id = str(uuid.uuid4())
+    row = await database.fetch_one(
+        query="""
+            INSERT INTO contacts (id, name, type, phone, address, created_at, updated_at)
+            VALUES (CAST(:id AS uuid), :name, :type, :phone, :address, NOW(), NOW())
+            RETURNING id, name, type, phone
+        """,
+        values={"id": new_id, "name": name, "type": contact_type, "phone": phone, "address": address}
+    )
+    if created is not None:
+        created.append(dict(row))
+    else:
+        contact_directory.add(row)
+    return new_id
+
+
+PREFETCH_CONTACTS_QUERY = """
+    SELECT DISTINCT ON (k.key_name, k.key_type) c.id, c.name, c.type, c.phone
+    FROM unnest(CAST(:names AS text[]), CAST(:types AS text[])) AS k(key_name, key_type)
+    JOIN contacts c ON LOWER(c.name) = k.key_name AND CAST(c.type AS text) = k.key_type
+    ORDER BY k.key_name, k.key_type, c.created_at
+"""
+
+
+async def prefetch_contacts(database, specs: list):
+    """
+    Versi set-based dari cache miss resolve_contact untuk banyak kontak
+    (commit batch). specs = [(name, type, phone)]. Yang belum ada di directory
+    dicari sekaligus dalam satu query dan dimasukkan ke directory, jadi
+    resolve_contact per entry sesudahnya cukup hit cache (atau INSERT baru).
+    """
+    await contact_directory.ensure_loaded(database)
+    misses = {}
+    for name, contact_type, phone in specs:
+        name = (name or "").strip()
+        if not contact_directory.find(contact_type, name, normalize_phone(phone)):
+            misses[(name.lower(), contact_type)] = True
+    if not misses:
+        return
+    rows = await database.fetch_all(query=PREFETCH_CONTACTS_QUERY, values={
+        "names": [k[0] for k in misses], "types": [k[1] for k in misses]
+    })
+    for row in rows:
+        contact_directory.add(row)
+
+
+async def register_created_contacts(database, created: list):
+    """Panggil setelah transaksi commit: masukkan kontak baru ke directory."""
+    for row in created:
+        contact_directory.add(row)
+    if created:
+        await publish_cache_change(database, "contacts")
+
+
+def _on_remote_change(message: dict):
+    contact_directory.invalidate()
+
+
+register_sync_handler("contacts", _on_remote_change)
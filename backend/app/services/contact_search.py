@@ -0,0 +1,135 @@
+import re
+from app.config import CONTACT_SEARCH_LIMIT
+from app.services.product_search import escape_like
+from app.services.contact_directory import normalize_name
+
+# ==========================================
+# CONTACT SEARCH (supplier/customer picker)
+# ==========================================
+# Butuh migrations/002_contact_search_trgm.sql (kolom search_name &
+# phone_digits + index pg_trgm). Input angka = cari nomor HP, selain itu
+# nama dengan urutan: prefix nama > prefix salah satu kata > kemiripan
+# trigram ("Yundenn" tetap ketemu "Toko Yunden"). Tanpa migration: ILIKE lama.
+
+SEARCH_COLUMNS = "id, name, type, phone, address, notes, created_at"
+
+NAME_SEARCH_QUERY = f"""
+    SELECT {SEARCH_COLUMNS},
+           word_similarity(:q, search_name)
+             + CASE WHEN search_name LIKE :prefix THEN 1.0
+                    WHEN search_name LIKE :word_prefix THEN 0.5
+                    ELSE 0 END AS score
+    FROM contacts
+    WHERE (:q <% search_name OR search_name LIKE :contains) {{type_filter}}
+    ORDER BY score DESC, name
+    LIMIT :limit
+"""
+
+PREFIX_SEARCH_QUERY = f"""
+    SELECT {SEARCH_COLUMNS}
+    FROM contacts
+    WHERE search_name LIKE :prefix {{type_filter}}
+    ORDER BY name
+    LIMIT :limit
+"""
+
+PHONE_SEARCH_QUERY = f"""
+    SELECT {SEARCH_COLUMNS}
+    FROM contacts
+    WHERE phone_digits LIKE :contains {{type_filter}}
+    ORDER BY (phone_digits LIKE :prefix) DESC, name
+    LIMIT :limit
+"""
+
+LEGACY_SEARCH_QUERY = f"""
+    SELECT {SEARCH_COLUMNS}
+    FROM contacts
+    WHERE name ILIKE :contains {{type_filter}}
+    ORDER BY name ASC
+    LIMIT :limit
+"""
+
+# Minimal digit supaya input dianggap nomor HP
+MIN_PHONE_QUERY_DIGITS = 4
+
+# None = belum dicek ke DB
+_indexed = None
+
+
+async def contact_search_indexed(database) -> bool:
+    """Apakah migration 002 sudah jalan (dicek sekali per proses)."""
+    global _indexed
+    if _indexed is None:
+        _indexed = bool(await database.fetch_val("""
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'contacts' AND column_name = 'search_name'
+            ) AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+        """))
+        if not _indexed:
+            print("[SEARCH] contacts.search_name not found, contact search uses ILIKE")
+    return _indexed
+
+
+def phone_query(q: str):
+    """Digit nomor HP dari input ('+62 812-3' -> '0812 3'), None kalau bukan nomor."""
+    if re.search(r"[a-zA-Z]", q or ""):
+        return None
+    digits = re.sub(r"\D", "", q)
+    if len(digits) < MIN_PHONE_QUERY_DIGITS:
+        return None
+    if q.strip().startswith("+62") or (digits.startswith("62") and len(digits) > 10):
+        digits = "0" + digits[2:]
+    return digits
+
+
+def contact_match_sql(q: str, indexed: bool, alias: str = "contacts"):
+    """
+    Kondisi WHERE "kontak cocok dengan q" untuk dipakai di query lain
+    (mis. filter search /transactions). Return (sql, values).
+    """
+    digits = phone_query(q)
+    if indexed and digits:
+        return f"{alias}.phone_digits LIKE :contact_contains", {"contact_contains": f"%{digits}%"}
+    if indexed and len(normalize_name(q)) >= 3:
+        query = normalize_name(q)
+        return (
+            f"(:contact_q <% {alias}.search_name OR {alias}.search_name LIKE :contact_contains)",
+            {"contact_q": query, "contact_contains": f"%{escape_like(query)}%"},
+        )
+    return f"{alias}.name ILIKE :contact_contains", {"contact_contains": f"%{escape_like(q.strip())}%"}
+
+
+async def search_contacts(database, q: str, contact_type: str = None, limit: int = CONTACT_SEARCH_LIMIT) -> list:
+    """Kontak paling relevan untuk teks autocomplete (record DB, sudah terurut)."""
+    query = normalize_name(q)
+    if not query:
+        return []
+
+    values = {"limit": limit}
+    type_filter = ""
+    if contact_type:
+        type_filter = "AND type = :type"
+        values["type"] = contact_type.upper()
+
+    if not await contact_search_indexed(database):
+        sql = LEGACY_SEARCH_QUERY
+        values["contains"] = f"%{escape_like(q.strip())}%"
+    elif phone_query(q):
+        digits = phone_query(q)
+        sql = PHONE_SEARCH_QUERY
+        values.update({"contains": f"%{digits}%", "prefix": f"{digits}%"})
+    elif len(query) < 3:
+        sql = PREFIX_SEARCH_QUERY
+        values["prefix"] = f"{escape_like(query)}%"
+    else:
+        like = escape_like(query)
+        sql = NAME_SEARCH_QUERY
+        values.update({
+            "q": query,
+            "prefix": f"{like}%",
+            "word_prefix": f"% {like}%",
+            "contains": f"%{like}%",
+        })
+
+    return await database.fetch_all(query=sql.format(type_filter=type_filter), values=values)
@@ -0,0 +1,118 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from app.config import SYNC_PAGE_LIMIT, SYNC_PAGE_MAX, SYNC_OVERLAP_SECONDS, SYNC_TOMBSTONE_RETENTION_DAYS
+
+# ==========================================
+# DELTA SYNC (change feed untuk aplikasi mobile)
+# ==========================================
+# Butuh migrations/007_delta_sync.sql. Client kirim cursor dari response
+# sebelumnya dan hanya menerima baris yang berubah sesudahnya (keyset
+# (updated_at, id), index), plus id yang dihapus (tombstone). Tanpa cursor =
+# sinkron awal seluruh data, dihalaman dengan cara yang sama.
+#
+# Cursor = "<updated_at dalam mikrodetik epoch>_<id>" (aman di query string).
+# Halaman terakhir (has_more=false) mengembalikan cursor = jam DB dikurangi
+# SYNC_OVERLAP_SECONDS: beberapa baris terkirim ulang (client upsert per id),
+# tapi baris dari transaksi yang commit terlambat tidak pernah terlewat, dan
+# cursor tetap maju walau feed tidak berubah (tidak jatuh ke full_resync).
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ZERO_ID = "00000000-0000-0000-0000-000000000000"
+
+FEEDS = {
+    "products": {
+        "table": "products",
+        "query": """
+            SELECT t.id, t.name, t.sku, t.current_stock, t.base_unit, t.latest_selling_price,
+                   t.variant, t.category, t.average_cost, t.updated_at
+            FROM products t
+            WHERE (t.updated_at, t.id) > (:since, CAST(:since_id AS uuid))
+            ORDER BY t.updated_at, t.id
+            LIMIT :limit
+        """,
+    },
+    "contacts": {
+        "table": "contacts",
+        "query": """
+            SELECT t.id, t.name, t.type, t.phone, t.address, t.notes, t.created_at, t.updated_at
+            FROM contacts t
+            WHERE (t.updated_at, t.id) > (:since, CAST(:since_id AS uuid))
+            ORDER BY t.updated_at, t.id
+            LIMIT :limit
+        """,
+    },
+    "transactions": {
+        "table": "transactions",
+        "query": """
+            SELECT t.id, t.type, t.transaction_date, t.total_amount, t.invoice_number,
+                   t.payment_method, t.contact_id, t.created_at, t.updated_at,
+                   c.name AS contact_name, c.phone AS contact_phone, c.address AS contact_address
+            FROM transactions t
+            LEFT JOIN contacts c ON t.contact_id = c.id
+            WHERE (t.updated_at, t.id) > (:since, CAST(:since_id AS uuid))
+            ORDER BY t.updated_at, t.id
+            LIMIT :limit
+        """,
+    },
+}
+
+TOMBSTONES_QUERY = """
+    SELECT entity_id FROM sync_tombstones
+    WHERE entity = :entity AND deleted_at > :since
+    ORDER BY deleted_at
+"""
+
+
+class SyncCursorError(ValueError):
+    """Cursor dari client tidak bisa dibaca."""
+
+
+def encode_cursor(updated_at: datetime, row_id) -> str:
+    micros = (updated_at - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{row_id}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(updated_at, id) dari cursor; tanpa cursor = awal waktu."""
+    if not cursor:
+        return EPOCH, ZERO_ID
+    try:
+        micros, row_id = cursor.split("_", 1)
+        return EPOCH + timedelta(microseconds=int(micros)), str(uuid.UUID(row_id))
+    except (ValueError, OverflowError):
+        raise SyncCursorError(f"Cursor sync tidak valid: {cursor}")
+
+
+async def fetch_changes(database, feed: str, cursor: str = None, limit: int = SYNC_PAGE_LIMIT) -> dict:
+    """
+    Satu halaman perubahan untuk feed ('products' / 'contacts' / 'transactions').
+    Return {rows, deleted, next_cursor, has_more, full_resync}.
+    """
+    spec = FEEDS[feed]
+    limit = max(1, min(limit or SYNC_PAGE_LIMIT, SYNC_PAGE_MAX))
+    since, since_id = decode_cursor(cursor)
+
+    # Tombstone sudah dibersihkan: hapus data lokal, mulai lagi tanpa cursor
+    if cursor and since < datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS):
+        return {"rows": [], "deleted": [], "next_cursor": None, "has_more": False, "full_resync": True}
+
+    rows = await database.fetch_all(query=spec["query"], values={
+        "since": since, "since_id": since_id, "limit": limit + 1
+    })
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Sinkron awal tidak butuh daftar hapus (data lokal masih kosong)
+    deleted = []
+    if cursor:
+        deleted = [str(row["entity_id"]) for row in await database.fetch_all(
+            query=TOMBSTONES_QUERY, values={"entity": spec["table"], "since": since}
+        )]
+
+    if has_more:
+        next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+    else:
+        db_now = await database.fetch_val("SELECT now()")
+        next_cursor = encode_cursor(max(db_now - timedelta(seconds=SYNC_OVERLAP_SECONDS), EPOCH), ZERO_ID)
+
+    return {"rows": rows, "deleted": deleted, "next_cursor": next_cursor, "has_more": has_more, "full_resync": False}
@@ -0,0 +1,343 @@
+import re
+from datetime import date
+from app.config import STANDARD_UNITS
+
+# ==========================================
+# RULE-BASED FAST PATH (tanpa LLM)
+# ==========================================
+# Untuk pesan yang strukturnya jelas ("Beras 5 karung 250rb", "jual kopi 3 pcs").
+# Hanya menghasilkan draft kalau SEMUA baris terbaca dan SEMUA produk ketemu
+# persis di katalog. Selain itu return None -> fallback ke LLM.
+
+NUMBER_WORDS = {
+    "nol": 0, "satu": 1, "dua": 2, "tiga": 3, "empat": 4, "lima": 5,
+    "enam": 6, "tujuh": 7, "delapan": 8, "sembilan": 9,
+    "sepuluh": 10, "sebelas": 11, "setengah": 0.5,
+}
+NUMBER_SCALES = {"ribu": 1000, "juta": 1000000}
+
+PRICE_SUFFIXES = {"rb": 1000, "ribu": 1000, "k": 1000, "jt": 1000000, "juta": 1000000}
+PRICE_MARKERS = {"rp", "harga", "seharga", "total", "totalnya", "harganya", "senilai"}
+UNIT_PRICE_MARKERS = {"@", "per", "satuan", "perpcs"}
+
+# Alias satuan -> bentuk baku. Satuan STANDARD_UNITS (lusin, kodi, dst) ikut dikenali
+# dan nanti dikonversi oleh normalize_item_data seperti hasil LLM.
+UNIT_ALIASES = {
+    "pcs": "pcs", "pc": "pcs", "biji": "pcs", "buah": "pcs", "bh": "pcs",
+    "bungkus": "bungkus", "bks": "bungkus", "pack": "pack", "pak": "pack",
+    "dus": "dus", "box": "box", "karton": "karton", "krt": "karton", "ctn": "karton",
+    "karung": "karung", "sak": "sak", "bal": "bal", "ikat": "ikat", "renteng": "renteng",
+    "botol": "botol", "btl": "botol", "kaleng": "kaleng", "sachet": "sachet", "galon": "galon",
+    "kg": "kg", "kilo": "kg", "gram": "gram", "gr": "gram", "liter": "liter", "ltr": "liter",
+    "lembar": "lembar", "lbr": "lembar", "pasang": "pasang", "set": "set", "roll": "roll",
+}
+UNIT_ALIASES.update({u: u for u in STANDARD_UNITS})
+
+PROCUREMENT_VERBS = {"beli", "kulakan", "belanja", "tambah", "catat", "masuk"}
+SALE_VERBS = {"jual", "laku", "terjual", "keluar"}
+
+# Counter fast-path vs fallback LLM per jenis parse
+fast_path_stats = {
+    "procurement": {"hits": 0, "misses": 0},
+    "sale": {"hits": 0, "misses": 0},
+    "receipt": {"hits": 0, "misses": 0},
+}
+
+
+def get_fast_path_stats() -> dict:
+    stats = {}
+    for kind, c in fast_path_stats.items():
+        total = c["hits"] + c["misses"]
+        stats[kind] = {**c, "hit_rate": round(c["hits"] / total, 4) if total else 0.0}
+    return stats
+
+
+def tokenize(text: str) -> list:
+    text = str(text or "").lower()
+    # "5karung" -> "5 karung", "250rb" -> "250 rb"
+    text = re.sub(r"(\d)([a-z])", r"\1 \2", text)
+    return re.findall(r"\d+(?:[.,]\d+)*|[a-z]+|@", text)
+
+
+def normalize_key(text: str) -> str:
+    return " ".join(t for t in tokenize(text) if t != "@")
+
+
+def split_lines(text: str) -> list:
+    parts = re.split(r"\n|;|,\s+|\s+dan\s+", text.strip())
+    return [p.strip() for p in parts if p.strip()]
+
+
+# --- ANGKA ---
+
+def parse_number_words(tokens: list, i: int):
+    """'dua puluh lima' -> 25, 'seratus lima puluh ribu' -> 150000. Return (value, next_index)."""
+    total = hundreds = small = 0
+    start = i
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok in NUMBER_WORDS:
+            small += NUMBER_WORDS[tok]
+        elif tok == "belas" and small:
+            small += 10
+        elif tok == "puluh" and small:
+            small *= 10
+        elif tok == "ratus" and small:
+            hundreds += small * 100
+            small = 0
+        elif tok == "seratus":
+            hundreds += 100
+        elif tok in NUMBER_SCALES and (hundreds or small):
+            total += (hundreds + small) * NUMBER_SCALES[tok]
+            hundreds = small = 0
+        elif tok in ("seribu", "sejuta"):
+            total += 1000 if tok == "seribu" else 1000000
+        else:
+            break
+        i += 1
+    if i == start:
+        return None, start
+    return total + hundreds + small, i
+
+
+def parse_digits(raw: str, decimal_allowed: bool) -> float:
+    """'250.000' -> 250000, '1,5' -> 1.5 (kalau decimal_allowed)."""
+    groups = re.split(r"[.,]", raw)
+    if len(groups) == 2 and decimal_allowed and len(groups[1]) <= 2:
+        return float(f"{groups[0]}.{groups[1]}")
+    if len(groups) > 1 and all(len(g) == 3 for g in groups[1:]):
+        return float("".join(groups))
+    if len(groups) == 1:
+        return float(raw)
+    return None
+
+
+def parse_quantity(tokens: list, i: int):
+    if i >= len(tokens):
+        return None, i
+    tok = tokens[i]
+    if tok[0].isdigit():
+        value = parse_digits(tok, decimal_allowed=True)
+        return (value, i + 1) if value is not None else (None, i)
+    return parse_number_words(tokens, i)
+
+
+def parse_amount(tokens: list, i: int):
+    """Harga: '250rb', '1,5 jt', 'rp 250.000', 'dua ratus ribu'. Return (value, next_index)."""
+    if i >= len(tokens):
+        return None, i
+    tok = tokens[i]
+    if tok[0].isdigit():
+        suffix = tokens[i + 1] if i + 1 < len(tokens) else None
+        if suffix in PRICE_SUFFIXES:
+            value = parse_digits(tok, decimal_allowed=True)
+            return (value * PRICE_SUFFIXES[suffix], i + 2) if value is not None else (None, i)
+        value = parse_digits(tok, decimal_allowed=False)
+        # Angka kecil tanpa "rb"/"rp" terlalu ambigu (25 = 25rb?), serahkan ke LLM
+        if value is None or value < 100:
+            return None, i
+        return value, i + 1
+    value, j = parse_number_words(tokens, i)
+    if value is not None and j < len(tokens) and tokens[j] in PRICE_SUFFIXES:
+        return value * PRICE_SUFFIXES[tokens[j]], j + 1
+    if value is not None and value >= 100:
+        return value, j
+    return None, i
+
+
+def parse_price_clause(tokens: list, i: int):
+    """Return (total_or_unit_price, is_unit_price, next_index)."""
+    is_unit_price = False
+    while i < len(tokens) and (tokens[i] in PRICE_MARKERS or tokens[i] in UNIT_PRICE_MARKERS):
+        if tokens[i] in UNIT_PRICE_MARKERS:
+            is_unit_price = True
+        i += 1
+    value, i = parse_amount(tokens, i)
+    return value, is_unit_price, i
+
+
+# --- KATALOG ---
+
+def build_catalog_lookup(known_products: list) -> dict:
+    by_full, by_name = {}, {}
+    for p in known_products or []:
+        name_key = normalize_key(p.get("name"))
+        if not name_key:
+            continue
+        full_key = normalize_key(f"{p.get('name', '')} {p.get('variant') or ''}")
+        by_full.setdefault(full_key, []).append(p)
+        by_name.setdefault(name_key, []).append(p)
+    return {"full": by_full, "name": by_name}
+
+
+def lookup_product(lookup: dict, name_tokens: list):
+    """Match persis (nama+varian, lalu nama saja). Ambigu -> None."""
+    key = " ".join(name_tokens)
+    for index in (lookup["full"], lookup["name"]):
+        candidates = index.get(key)
+        if candidates:
+            return candidates[0] if len(candidates) == 1 else None
+    return None
+
+
+# --- PARSER PER BARIS ---
+
+def _strip_verbs(tokens: list, verbs: set) -> list:
+    while tokens and tokens[0] in verbs:
+        tokens = tokens[1:]
+    return tokens
+
+
+def _parse_name_qty_unit(tokens: list):
+    """Semua kemungkinan '<nama> <qty> <unit>' -> (name_tokens, qty, unit, next_index)."""
+    for i in range(1, len(tokens)):
+        qty, j = parse_quantity(tokens, i)
+        if qty is not None and j < len(tokens) and tokens[j] in UNIT_ALIASES:
+            yield tokens[:i], qty, UNIT_ALIASES[tokens[j]], j + 1
+
+
+def parse_procurement_line(line: str, lookup: dict):
+    tokens = _strip_verbs(tokenize(line), PROCUREMENT_VERBS)
+
+    # "Singkong 1kg 5 bungkus 85rb": split pertama (qty=1 kg) gagal, coba berikutnya
+    for name_tokens, qty, unit, i in _parse_name_qty_unit(tokens):
+        price, is_unit_price, i = parse_price_clause(tokens, i)
+        if price is None or i != len(tokens) or qty <= 0:
+            continue
+        product = lookup_product(lookup, name_tokens)
+        if product:
+            break
+    else:
+        return None
+
+    return {
+        "product_name": product["name"],
+        "variant": product.get("variant") or None,
+        "qty": qty,
+        "unit": unit,
+        "unit_price": price if is_unit_price else None,
+        "total_price": price * qty if is_unit_price else price,
+        "notes": None,
+    }
+
+
+def _parse_qty_first(tokens: list):
+    """'<qty> [unit] <nama>' -> (name_tokens, qty, unit, next_index)."""
+    qty, i = parse_quantity(tokens, 0)
+    if qty is None:
+        return
+    unit = None
+    if i < len(tokens) and tokens[i] in UNIT_ALIASES:
+        unit = UNIT_ALIASES[tokens[i]]
+        i += 1
+    end = i
+    while end < len(tokens) and not tokens[end][0].isdigit() \
+            and tokens[end] not in PRICE_MARKERS and tokens[end] not in UNIT_PRICE_MARKERS:
+        end += 1
+    yield tokens[i:end], qty, unit, end
+
+
+def parse_sale_line(line: str, lookup: dict):
+    tokens = _strip_verbs(tokenize(line), SALE_VERBS)
+    if not tokens:
+        return None
+
+    # "jual 3 pcs kopi" atau "jual kopi 3 pcs" (+ harga opsional)
+    candidates = list(_parse_qty_first(tokens)) + list(_parse_name_qty_unit(tokens))
+    for name_tokens, qty, unit, i in candidates:
+        price, is_unit_price, i = parse_price_clause(tokens, i)
+        if i != len(tokens) or not name_tokens or qty <= 0:
+            continue
+        product = lookup_product(lookup, name_tokens)
+        if product:
+            break
+    else:
+        return None
+
+    unit = unit or product.get("base_unit") or "pcs"
+    # Qty setelah konversi satuan (2 lusin -> 24), sama dengan qty yang nanti
+    # disimpan normalize_item_data; harga default & unit_price per base unit
+    base_qty = qty * STANDARD_UNITS.get(unit, 1.0)
+    if price is not None:
+        total_price = price * qty if is_unit_price else price
+    else:
+        # Harga default dari database (sama seperti fallback LLM)
+        total_price = float(product.get("latest_selling_price") or 0) * base_qty
+    unit_price = total_price / base_qty
+
+    return {
+        "product_name": product["name"],
+        "variant": product.get("variant") or None,
+        "qty": qty,
+        "unit": unit,
+        "unit_price": unit_price,
+        "total_price": total_price,
+        "notes": None,
+    }
+
+
+# --- ENTRY POINTS ---
+
+def _parse_all_lines(text: str, known_products: list, line_parser):
+    if not known_products:
+        return None
+    lines = split_lines(text)
+    if not lines:
+        return None
+    lookup = build_catalog_lookup(known_products)
+    items = []
+    for line in lines:
+        item = line_parser(line, lookup)
+        if item is None:
+            return None
+        items.append(item)
+    return items
+
+
+def fast_parse_procurement(text_input: str, current_draft: dict = None, known_products: list = None):
+    """Draft pengadaan tanpa LLM, atau None kalau tidak yakin."""
+    items = _parse_all_lines(text_input, known_products, parse_procurement_line)
+    if items is None:
+        fast_path_stats["procurement"]["misses"] += 1
+        return None
+    fast_path_stats["procurement"]["hits"] += 1
+
+    names = ", ".join(i["product_name"] + (f" ({i['variant']})" if i["variant"] else "") for i in items)
+    return {
+        "action": "append",
+        "supplier_name": None,
+        "transaction_date": date.today().isoformat(),
+        "items": items,
+        "follow_up_question": f"Sip, {names} dicatat! Ada barang lain Kak?",
+        "suggested_actions": ["Simpan"],
+        "confidence_score": 0.95,
+    }
+
+
+def fast_parse_sale(text_input: str, current_draft: dict = None, known_products: list = None, normalize_item=None):
+    """
+    Draft penjualan tanpa LLM, atau None kalau tidak yakin.
+    normalize_item (opsional) hanya dijalankan ke item BARU, bukan item draft
+    lama yang sudah pernah dinormalisasi.
+    """
+    items = _parse_all_lines(text_input, known_products, parse_sale_line)
+    if items is None:
+        fast_path_stats["sale"]["misses"] += 1
+        return None
+    fast_path_stats["sale"]["hits"] += 1
+    if normalize_item:
+        items = [normalize_item(item) for item in items]
+
+    # Mobile mengganti draft sale secara utuh, jadi kirim item lama + item baru
+    existing_items = list((current_draft or {}).get("items") or [])
+    all_items = existing_items + items
+    total = sum(float(i.get("total_price") or 0) for i in all_items)
+    names = ", ".join(i["product_name"] for i in items)
+    return {
+        "action": "new",
+        "customer_name": (current_draft or {}).get("customer_name") or "Pelanggan Umum",
+        "items": all_items,
+        "total": total,
+        "follow_up_question": f"Oke, {names} masuk nota. Total Rp {total:,.0f}. Ada lagi?",
+        "suggested_actions": ["Simpan", "Edit"],
+    }
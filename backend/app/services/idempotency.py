@@ -0,0 +1,92 @@
+import json
+import hashlib
+
+# ==========================================
+# IDEMPOTENCY KEY (commit endpoints)
+# ==========================================
+# Butuh migrations/006_idempotency_keys.sql. Header Idempotency-Key diklaim
+# (INSERT ... ON CONFLICT DO NOTHING) di transaksi yang sama dengan commit:
+# - key baru       -> commit jalan, response disimpan bersama transaksinya
+# - key sudah ada  -> response tersimpan dikembalikan, commit TIDAK diulang
+# - retry bersamaan -> INSERT kedua menunggu yang pertama selesai, lalu replay
+# Commit yang gagal ikut rollback klaimnya, jadi retry berikutnya jalan normal.
+# commit_fn() return (result, after_commit); after_commit (isi cache kontak/
+# produk baru) baru dijalankan setelah transaksi terluar di sini commit.
+
+MAX_KEY_LENGTH = 255
+
+CLAIM_QUERY = """
+    INSERT INTO idempotency_keys (endpoint, key, request_hash)
+    VALUES (:endpoint, :key, :hash)
+    ON CONFLICT (endpoint, key) DO NOTHING
+    RETURNING key
+"""
+
+STORED_QUERY = """
+    SELECT request_hash, response FROM idempotency_keys
+    WHERE endpoint = :endpoint AND key = :key
+"""
+
+SAVE_RESPONSE_QUERY = """
+    UPDATE idempotency_keys
+    SET response = CAST(:response AS jsonb), transaction_id = CAST(:tid AS uuid)
+    WHERE endpoint = :endpoint AND key = :key
+"""
+
+# None = belum dicek ke DB
+_available = None
+
+
+class IdempotencyKeyError(ValueError):
+    """Key tidak valid, atau sudah dipakai untuk request dengan isi berbeda."""
+
+
+def request_hash(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def idempotency_available(database) -> bool:
+    """Apakah migration 006 sudah jalan (dicek sekali per proses)."""
+    global _available
+    if _available is None:
+        _available = bool(await database.fetch_val(
+            "SELECT to_regclass('public.idempotency_keys') IS NOT NULL"
+        ))
+        if not _available:
+            print("[IDEMPOTENCY] idempotency_keys not found, Idempotency-Key header ignored")
+    return _available
+
+
+async def run_idempotent(database, endpoint: str, key: str, payload: dict, commit_fn) -> tuple:
+    """
+    Jalankan commit_fn() sekali per (endpoint, key). commit_fn -> (result, after_commit).
+    Return (result, replayed) - replayed=True kalau result adalah response tersimpan.
+    """
+    if not key or not await idempotency_available(database):
+        result, after_commit = await commit_fn()
+        await after_commit()
+        return result, False
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyKeyError(f"Idempotency-Key harus 1-{MAX_KEY_LENGTH} karakter")
+
+    values = {"endpoint": endpoint, "key": key}
+    payload_hash = request_hash(payload)
+    async with database.transaction():
+        claimed = await database.fetch_val(query=CLAIM_QUERY, values={**values, "hash": payload_hash})
+        if not claimed:
+            stored = await database.fetch_one(query=STORED_QUERY, values=values)
+            if stored["request_hash"] != payload_hash:
+                raise IdempotencyKeyError("Idempotency-Key sudah dipakai untuk transaksi lain")
+            response = stored["response"]
+            print(f"[IDEMPOTENCY] Replay {endpoint} key={key}")
+            return (json.loads(response) if isinstance(response, str) else response), True
+
+        result, after_commit = await commit_fn()
+        await database.execute(query=SAVE_RESPONSE_QUERY, values={
+            **values,
+            "response": json.dumps(result, default=str),
+            "tid": result.get("transaction_id"),
+        })
+    await after_commit()
+    return result, False
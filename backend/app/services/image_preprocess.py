@@ -0,0 +1,178 @@
+import cv2
+import numpy as np
+from app.config import (
+    OCR_PREPROCESS, OCR_TARGET_TEXT_HEIGHT, OCR_MAX_IMAGE_SIDE,
+    OCR_AUTO_CROP, OCR_DESKEW, OCR_MAX_DESKEW_ANGLE
+)
+
+# ==========================================
+# RECEIPT IMAGE PREPROCESSING (sebelum readtext)
+# ==========================================
+# Opt-in (OCR_PREPROCESS): ditujukan untuk foto HP 12MP+ yang lambat di OCR,
+# tapi untung waktu/akurasinya belum diukur di foto struk asli. Urutan: grayscale -> crop ke area struk ->
+# resize ke tinggi huruf target -> deskew. Semua langkah bisa dimatikan
+# lewat config dan tiap langkah gagal = dilewati (tidak merusak gambar).
+
+# Semua config yang mempengaruhi hasil OCR (bagian dari key cache OCR)
+PREPROCESS_SIGNATURE = (
+    OCR_PREPROCESS, OCR_TARGET_TEXT_HEIGHT, OCR_MAX_IMAGE_SIDE,
+    OCR_AUTO_CROP, OCR_DESKEW, OCR_MAX_DESKEW_ANGLE
+)
+
+# Thumbnail untuk deteksi area struk (cukup kecil supaya cepat)
+CROP_THUMB_SIDE = 800
+CROP_MIN_AREA_RATIO = 0.2
+CROP_MARGIN_RATIO = 0.02
+
+
+def to_grayscale(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def resize(image: np.ndarray, scale: float) -> np.ndarray:
+    if abs(scale - 1.0) < 0.01:
+        return image
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def crop_to_receipt(gray: np.ndarray):
+    """
+    Cari kertas struk (area terang terbesar) dan crop ke bounding box-nya.
+    Return (gambar, (x, y, w, h)) atau (gray, None) kalau tidak yakin.
+    """
+    height, width = gray.shape
+    thumb_scale = min(1.0, CROP_THUMB_SIDE / max(height, width))
+    thumb = resize(gray, thumb_scale)
+    blurred = cv2.GaussianBlur(thumb, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Tutup celah teks hitam di dalam kertas
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return gray, None
+
+    largest = max(contours, key=cv2.contourArea)
+    area_ratio = cv2.contourArea(largest) / float(thumb.shape[0] * thumb.shape[1])
+    if area_ratio < CROP_MIN_AREA_RATIO or area_ratio > 0.95:
+        # Terlalu kecil (bukan struk) atau hampir seluruh gambar (tidak perlu crop)
+        return gray, None
+
+    x, y, w, h = cv2.boundingRect(largest)
+    margin = int(max(w, h) * CROP_MARGIN_RATIO)
+    x, y = max(x - margin, 0), max(y - margin, 0)
+    w, h = min(w + 2 * margin, thumb.shape[1] - x), min(h + 2 * margin, thumb.shape[0] - y)
+    # Koordinat thumbnail -> koordinat asli
+    x, y, w, h = [int(round(v / thumb_scale)) for v in (x, y, w, h)]
+    return gray[y:y + h, x:x + w], (x, y, w, h)
+
+
+def _ink_mask(gray: np.ndarray) -> np.ndarray:
+    """Piksel tinta (teks gelap di kertas terang) = 255."""
+    return cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15
+    )
+
+
+def estimate_text_height(gray: np.ndarray):
+    """Median tinggi karakter (px) dari connected components tinta. None kalau tidak ada teks."""
+    mask = _ink_mask(gray)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        return None
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    # Buang noise (titik kecil) dan blob besar (garis, logo, bayangan)
+    max_height = gray.shape[0] * 0.1
+    keep = (heights >= 4) & (heights <= max_height) & (widths <= heights * 4)
+    if keep.sum() < 10:
+        return None
+    return float(np.median(heights[keep]))
+
+
+def estimate_skew_angle(gray: np.ndarray):
+    """
+    Sudut kemiringan baris teks (derajat) = median sudut minAreaRect tiap
+    baris (tinta yang di-dilate horizontal). None kalau tidak bisa diukur.
+    Nilainya langsung bisa dipakai ke rotate() untuk meluruskan.
+    """
+    mask = _ink_mask(gray)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(gray.shape[1] // 40, 9), 3))
+    lines = cv2.dilate(mask, kernel)
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    angles = []
+    for contour in contours:
+        rect = cv2.minAreaRect(contour)
+        w, h = rect[1]
+        if w < h:
+            w, h = h, w
+        # Hanya blob memanjang (baris teks), bukan logo / noise
+        if w < gray.shape[1] * 0.15 or w < h * 5:
+            continue
+        # Sudut sisi terpanjang kotak terhadap sumbu x (y ke bawah)
+        points = cv2.boxPoints(rect)
+        edges = [points[1] - points[0], points[2] - points[1]]
+        dx, dy = max(edges, key=lambda e: e[0] ** 2 + e[1] ** 2)
+        angle = np.degrees(np.arctan2(dy, dx))
+        if angle > 90:
+            angle -= 180
+        elif angle <= -90:
+            angle += 180
+        if abs(angle) > 45:
+            continue
+        angles.append(angle)
+    if len(angles) < 3:
+        return None
+    return float(np.median(angles))
+
+
+def rotate(gray: np.ndarray, angle: float) -> np.ndarray:
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def preprocess_receipt(image: np.ndarray, enabled: bool = OCR_PREPROCESS):
+    """
+    Jalankan pipeline preprocessing. Return (gambar siap OCR, info).
+    info["scale"] = faktor resize terhadap gambar asli (dipakai untuk
+    menyesuaikan threshold yang berbasis pixel).
+    """
+    info = {"scale": 1.0, "crop": None, "angle": 0.0, "text_height": None,
+            "input_shape": image.shape[:2]}
+    if not enabled:
+        return image, info
+
+    gray = to_grayscale(image)
+
+    # Batas kasar dulu supaya langkah berikutnya tidak jalan di 12MP
+    pre_scale = min(1.0, (OCR_MAX_IMAGE_SIDE * 2) / max(gray.shape))
+    gray = resize(gray, pre_scale)
+    info["scale"] = pre_scale
+
+    if OCR_AUTO_CROP:
+        gray, info["crop"] = crop_to_receipt(gray)
+
+    text_height = estimate_text_height(gray)
+    info["text_height"] = text_height
+    scale = 1.0
+    if text_height and text_height > OCR_TARGET_TEXT_HEIGHT:
+        scale = OCR_TARGET_TEXT_HEIGHT / text_height
+    # Hanya downscale; batas sisi terpanjang tetap berlaku
+    scale = min(scale, OCR_MAX_IMAGE_SIDE / max(gray.shape))
+    if scale < 1.0:
+        gray = resize(gray, scale)
+        info["scale"] *= scale
+
+    if OCR_DESKEW:
+        angle = estimate_skew_angle(gray)
+        if angle is not None and 0.5 <= abs(angle) <= OCR_MAX_DESKEW_ANGLE:
+            gray = rotate(gray, angle)
+            info["angle"] = round(angle, 2)
+
+    info["output_shape"] = gray.shape[:2]
+    return gray, info
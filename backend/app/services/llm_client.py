@@ -0,0 +1,171 @@
+import os
+import json
+import asyncio
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+from app.config import (
+    LLM_MAX_CONCURRENCY, LLM_TIMEOUT_SECONDS,
+    LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE,
+    LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS
+)
+from app.services.ttl_cache import TTLCache, make_cache_key
+
+# Lazy-loaded async client + concurrency gate (dibuat di event loop yang aktif)
+_client = None
+_gate = None
+
+# Content-addressed cache: key = hash(model, system prompt + RAG, draft context + user input)
+llm_response_cache = TTLCache(max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS)
+
+
+def get_llm_client() -> AsyncGroq:
+    """Get or create the shared AsyncGroq client with a keep-alive HTTP pool."""
+    global _client
+    if _client is None:
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            ),
+        )
+        _client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=http_client)
+    return _client
+
+
+def _get_gate() -> asyncio.Semaphore:
+    global _gate
+    if _gate is None:
+        _gate = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _gate
+
+
+async def _create_completion(**kwargs):
+    async with _get_gate():
+        return await get_llm_client().chat.completions.create(**kwargs)
+
+
+async def chat_completion(model: str, messages: list, temperature: float = 0.3,
+                          response_format: dict = None, timeout: float = None,
+                          use_cache: bool = False) -> str:
+    """
+    Call the chat completion API without blocking the event loop.
+    At most LLM_MAX_CONCURRENCY calls are in flight; the timeout covers
+    queueing at the gate plus the round-trip itself.
+    With use_cache=True, identical (model, messages) pairs are served from
+    llm_response_cache. JSON-mode answers are only cached if they parse.
+    Returns the message content of the first choice.
+    """
+    cache_key = None
+    if use_cache:
+        cache_key = make_cache_key(model, messages, temperature, response_format)
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            print(f"[LLM_CACHE] Hit {cache_key[:12]}")
+            return cached
+
+    timeout = timeout or LLM_TIMEOUT_SECONDS
+    kwargs = {"model": model, "messages": messages, "temperature": temperature, "timeout": timeout}
+    if response_format:
+        kwargs["response_format"] = response_format
+
+    completion = await asyncio.wait_for(_create_completion(**kwargs), timeout=timeout)
+    content = completion.choices[0].message.content
+
+    if cache_key and _is_cacheable(content, response_format):
+        llm_response_cache.set(cache_key, content)
+    return content
+
+
+async def stream_chat_completion(model: str, messages: list, temperature: float = 0.3,
+                                 json_mode: bool = False, timeout: float = None,
+                                 use_cache: bool = False):
+    """
+    Async generator yielding content deltas from the streaming API.
+    Holds one slot of the concurrency gate for the whole stream; the timeout
+    is an overall deadline. Groq does not combine streaming with
+    response_format, so in json_mode the prompt enforces JSON and the final
+    text is extracted/validated before it is cached. Cache entries are shared
+    with chat_completion(response_format=json_object).
+    """
+    response_format = {"type": "json_object"} if json_mode else None
+    cache_key = None
+    if use_cache:
+        cache_key = make_cache_key(model, messages, temperature, response_format)
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            print(f"[LLM_CACHE] Hit {cache_key[:12]} (stream)")
+            yield cached
+            return
+
+    loop = asyncio.get_running_loop()
+    timeout = timeout or LLM_TIMEOUT_SECONDS
+    deadline = loop.time() + timeout
+
+    def remaining():
+        return max(deadline - loop.time(), 0.001)
+
+    parts = []
+    stream = None
+    gate = _get_gate()
+    await asyncio.wait_for(gate.acquire(), timeout=remaining())
+    try:
+        stream = await asyncio.wait_for(
+            get_llm_client().chat.completions.create(
+                model=model, messages=messages, temperature=temperature,
+                stream=True, timeout=timeout
+            ),
+            timeout=remaining()
+        )
+        chunks = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=remaining())
+            except StopAsyncIteration:
+                break
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        if stream is not None:
+            await stream.close()
+        gate.release()
+
+    if cache_key:
+        content = "".join(parts)
+        if json_mode:
+            content = extract_json_text(content)
+        if _is_cacheable(content, response_format):
+            llm_response_cache.set(cache_key, content)
+
+
+def extract_json_text(content: str) -> str:
+    """Ambil object JSON terluar (buang ```json fence / teks pembuka dari model)."""
+    start = content.find("{")
+    end = content.rfind("}")
+    if start == -1 or end < start:
+        return content
+    return content[start:end + 1]
+
+
+def _is_cacheable(content: str, response_format: dict = None) -> bool:
+    if not content:
+        return False
+    if response_format and response_format.get("type") == "json_object":
+        try:
+            json.loads(content)
+        except ValueError:
+            return False
+    return True
+
+
+def get_llm_stats() -> dict:
+    return {"response_cache": llm_response_cache.stats()}
+
+
+async def close_llm_client():
+    """Close the shared HTTP pool (dipanggil saat shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from app.config import (
+    OCR_CACHE_MAX_ENTRIES, OCR_CACHE_TTL_SECONDS,
+    OCR_CACHE_DIR, OCR_CACHE_DISK_MAX_ENTRIES
+)
+from app.services.ttl_cache import TTLCache, make_cache_key
+from app.services.image_preprocess import PREPROCESS_SIGNATURE
+
+# ==========================================
+# OCR RESULT CACHE (memory + disk opsional)
+# ==========================================
+# Key = sha256 isi file gambar + signature config preprocessing (hasil OCR
+# berubah kalau preprocessing berubah). Value = hasil worker (boxes + scale),
+# teks disusun ulang dari boxes. Tier disk (OCR_CACHE_DIR) bertahan lintas
+# restart dan dipakai bersama worker uvicorn di mesin yang sama.
+
+CACHE_FORMAT_VERSION = "ocr-v1"
+
+
+def ocr_cache_key(image_bytes: bytes) -> str:
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return make_cache_key(CACHE_FORMAT_VERSION, digest, PREPROCESS_SIGNATURE)
+
+
+class OCRCache:
+    def __init__(self, max_entries: int = OCR_CACHE_MAX_ENTRIES, ttl_seconds: float = OCR_CACHE_TTL_SECONDS,
+                 disk_dir: str = OCR_CACHE_DIR, disk_max_entries: int = OCR_CACHE_DISK_MAX_ENTRIES):
+        self.memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    async def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None or not self.disk_dir:
+            return value
+        value = await asyncio.to_thread(self._disk_get, key)
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: dict):
+        self.memory.set(key, value)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, value)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f)
+            # Sentuh mtime -> eviction jadi LRU, bukan FIFO
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _disk_set(self, key: str, value: dict):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._disk_evict()
+        except OSError as e:
+            print(f"[OCR_CACHE] Disk write failed: {e}")
+
+    def _disk_evict(self):
+        entries = [e for e in os.scandir(self.disk_dir) if e.name.endswith(".json")]
+        overflow = len(entries) - self.disk_max_entries
+        if overflow <= 0:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:overflow]:
+            try:
+                os.remove(entry.path)
+                self.disk_evictions += 1
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            **self.memory.stats(),
+            "disk_dir": self.disk_dir,
+            "disk_hits": self.disk_hits,
+            "disk_evictions": self.disk_evictions,
+        }
+
+
+ocr_cache = OCRCache()
@@ -0,0 +1,273 @@
+import os
+import asyncio
+import multiprocessing
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.config import OCR_WORKERS, OCR_MAX_QUEUE, OCR_TIMEOUT_SECONDS, OCR_PREPROCESS, OCR_BATCH_SIZE
+from app.services.image_preprocess import preprocess_receipt
+from app.services.ocr_cache import ocr_cache, ocr_cache_key
+from app.services.receipt_layout import cluster_rows, rows_to_text, analyze_receipt
+
+# ==========================================
+# OCR SERVICE (EasyOCR di process pool)
+# ==========================================
+# readtext() berat di CPU dan memegang GIL, jadi dijalankan di proses worker
+# terpisah. Tiap worker punya easyocr.Reader sendiri yang di-load sekali lewat
+# initializer. OCR_WORKERS = 0 -> jalan di thread dalam proses API (dev/low-RAM).
+
+# Lazy-loaded OCR instance (per proses)
+_ocr_reader = None
+
+_executor = None
+_inflight = 0
+# Job OCR yang sedang jalan per cache key (dedup upload identik bersamaan)
+_pending = {}
+# Gate OCR untuk batch (/parse/images), dipakai bersama SEMUA request batch
+_batch_gate = None
+
+# Status model OCR untuk readiness: cold -> warming -> ready / error
+_ocr_status = "cold"
+_ocr_error = None
+
+
+class OCRBusyError(Exception):
+    """Antrian OCR penuh (backpressure)."""
+
+
+def get_ocr():
+    """Get or create EasyOCR reader (lazy loading for performance)"""
+    global _ocr_reader
+    if _ocr_reader is None:
+        # EasyOCR for accurate text extraction (simpler than PaddleOCR, no conflicts)
+        import easyocr
+        print(f"[OCR] Initializing EasyOCR in pid {os.getpid()} (first run may download models)...")
+        # Support Indonesian (id) and English (en) text
+        _ocr_reader = easyocr.Reader(['id', 'en'], gpu=False)
+    return _ocr_reader
+
+
+def decode_image(image_bytes):
+    """
+    Decode bytes upload langsung di memori (tanpa temp file) jadi array RGB.
+    Return None kalau bukan gambar yang valid.
+    """
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    # EasyOCR membaca file sebagai RGB; samakan urutan channel
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def recognize(image, preprocess: bool = OCR_PREPROCESS) -> dict:
+    """
+    Preprocess + readtext satu gambar (array RGB). Hasil JSON-safe supaya
+    bisa dikirim balik dari worker dan disimpan di cache:
+    {"boxes": [[points, text, conf], ...], "scale": faktor resize}.
+    """
+    # Grayscale, crop, resize ke tinggi huruf target, deskew
+    image, prep = preprocess_receipt(image, enabled=preprocess)
+    print(f"[OCR] Preprocess: {prep}")
+
+    reader = get_ocr()
+    # width_ths=0.7 allows merging closer words
+    # batch_size: potongan teks dikenali per batch, bukan satu-satu
+    result = reader.readtext(image, paragraph=False, width_ths=0.7, batch_size=OCR_BATCH_SIZE)
+    boxes = [
+        [[[float(x), float(y)] for x, y in box], str(text), float(conf)]
+        for box, text, conf in result
+    ]
+    return {"boxes": boxes, "scale": float(prep["scale"])}
+
+
+def recognize_image_bytes(image_bytes) -> dict:
+    """Job untuk worker: decode + recognize. Error dikembalikan, bukan di-raise."""
+    try:
+        image = decode_image(image_bytes)
+        if image is None:
+            return {"boxes": [], "scale": 1.0, "error": "cannot decode image"}
+        return recognize(image)
+    except Exception as e:
+        print(f"[OCR] Error: {e}")
+        return {"boxes": [], "scale": 1.0, "error": str(e)}
+
+
+def boxes_to_text(boxes: list) -> str:
+    """
+    Susun ulang box OCR jadi teks per baris (atas ke bawah, kiri ke kanan).
+    Threshold baris relatif terhadap tinggi box, jadi tidak tergantung resolusi.
+    """
+    rows = cluster_rows(boxes)
+    raw_text = rows_to_text(rows)
+    print(f"[OCR] Extracted {len(rows)} lines. Raw Content:\n{raw_text}")
+    return raw_text
+
+
+def extract_text_from_image(image_bytes) -> str:
+    """
+    Step 1: Extract raw text from image using EasyOCR.
+    REVISED: Better row grouping logic for skewed receipts.
+    """
+    result = recognize_image_bytes(image_bytes)
+    return boxes_to_text(result["boxes"])
+
+
+def ocr_image(image, preprocess: bool = OCR_PREPROCESS) -> str:
+    """OCR satu gambar yang sudah di-decode (array RGB) jadi teks per baris."""
+    result = recognize(image, preprocess=preprocess)
+    return boxes_to_text(result["boxes"])
+
+
+def _init_worker():
+    """Initializer proses worker: load model sekali sebelum menerima job."""
+    get_ocr()
+
+
+def _warmup_job() -> int:
+    """Load model + satu inference dummy supaya request pertama tidak bayar cold start."""
+    reader = get_ocr()
+    reader.readtext(np.full((64, 256, 3), 255, dtype=np.uint8))
+    return os.getpid()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None and OCR_WORKERS > 0:
+        # spawn: jangan fork proses API (event loop, koneksi DB, thread httpx)
+        _executor = ProcessPoolExecutor(
+            max_workers=OCR_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        print(f"[OCR] Process pool started ({OCR_WORKERS} workers, queue {OCR_MAX_QUEUE})")
+    return _executor
+
+
+def _release_slot(future):
+    global _inflight
+    _inflight -= 1
+    # Ambil exception job yang sudah di-timeout supaya tidak jadi warning asyncio
+    if not future.cancelled():
+        future.exception()
+
+
+async def _recognize_in_pool(image_bytes, key: str) -> dict:
+    global _inflight, _executor
+    capacity = max(OCR_WORKERS, 1) + OCR_MAX_QUEUE
+    if _inflight >= capacity:
+        raise OCRBusyError(f"OCR queue full ({_inflight}/{capacity})")
+
+    loop = asyncio.get_running_loop()
+    try:
+        future = loop.run_in_executor(_get_executor(), recognize_image_bytes, image_bytes)
+    except BrokenProcessPool:
+        # Worker mati (OOM dsb): buat pool baru untuk request berikutnya
+        _executor = None
+        raise
+    # Slot baru dilepas saat job benar-benar selesai, bukan saat timeout
+    _inflight += 1
+    future.add_done_callback(_release_slot)
+
+    try:
+        result = await asyncio.wait_for(asyncio.shield(future), timeout=OCR_TIMEOUT_SECONDS)
+    except BrokenProcessPool:
+        _executor = None
+        raise
+    _mark_ready()
+    # Error (gambar rusak dsb) tidak di-cache
+    if not result.get("error"):
+        await ocr_cache.set(key, result)
+    return result
+
+
+async def run_ocr_boxes(image_bytes) -> dict:
+    """
+    Hasil OCR mentah {"boxes", "scale"} tanpa memblokir event loop.
+    Upload ulang gambar yang sama dilayani dari ocr_cache; upload identik
+    yang bersamaan menunggu satu job yang sama.
+    Maksimal OCR_WORKERS job jalan + OCR_MAX_QUEUE antri; lebih dari itu
+    langsung OCRBusyError (jangan menumpuk request yang pasti timeout).
+    """
+    key = ocr_cache_key(image_bytes)
+    cached = await ocr_cache.get(key)
+    if cached is not None:
+        print(f"[OCR_CACHE] Hit {key[:12]}")
+        return cached
+
+    task = _pending.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_recognize_in_pool(image_bytes, key))
+        _pending[key] = task
+        task.add_done_callback(lambda _t: _pending.pop(key, None))
+    return await asyncio.shield(task)
+
+
+def ocr_batch_gate() -> asyncio.Semaphore:
+    """
+    Semaphore bersama untuk OCR batch: semua upload batch (dari request mana
+    pun) maksimal max(OCR_WORKERS, 1) job sekaligus, sisanya menunggu giliran.
+    Jadi batch tidak pernah memenuhi antrian dan tidak kena OCRBusyError;
+    slot OCR_MAX_QUEUE tetap tersedia untuk upload satuan.
+    """
+    global _batch_gate
+    if _batch_gate is None:
+        _batch_gate = asyncio.Semaphore(max(OCR_WORKERS, 1))
+    return _batch_gate
+
+
+async def run_ocr_layout(image_bytes) -> dict:
+    """Hasil OCR yang sudah disusun jadi baris + tabel item (lihat receipt_layout)."""
+    result = await run_ocr_boxes(image_bytes)
+    layout = analyze_receipt(result["boxes"])
+    print(f"[OCR] Layout: {len(layout['items'])} items, total={layout['total']}, "
+          f"consistent={layout['is_consistent']}\nRaw Content:\n{layout['text']}")
+    return layout
+
+
+def _mark_ready():
+    global _ocr_status, _ocr_error
+    if _ocr_status != "ready":
+        _ocr_status, _ocr_error = "ready", None
+
+
+async def warm_up_ocr():
+    """
+    Dipanggil di background saat startup (OCR_WARMUP): spawn worker, load
+    model dan jalankan inference dummy di tiap worker.
+    """
+    global _ocr_status, _ocr_error
+    _ocr_status = "warming"
+    loop = asyncio.get_running_loop()
+    try:
+        jobs = [loop.run_in_executor(_get_executor(), _warmup_job) for _ in range(max(OCR_WORKERS, 1))]
+        pids = await asyncio.gather(*jobs)
+        _mark_ready()
+        print(f"[OCR] Warm-up done (pids {sorted(set(pids))})")
+    except Exception as e:
+        _ocr_status, _ocr_error = "error", str(e)
+        print(f"[OCR] Warm-up failed: {e}")
+
+
+def get_ocr_status() -> dict:
+    return {"status": _ocr_status, "error": _ocr_error}
+
+
+def get_ocr_stats() -> dict:
+    return {
+        "workers": OCR_WORKERS,
+        "max_queue": OCR_MAX_QUEUE,
+        "inflight": _inflight,
+        "status": _ocr_status,
+        "cache": ocr_cache.stats(),
+    }
+
+
+def shutdown_ocr_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,105 @@
+import numpy as np
+from app.services.rag_retriever import tokenize, trigrams
+
+# ==========================================
+# PRODUCT MATCHER (nama produk -> produk katalog)
+# ==========================================
+# Dulu tiap request menghitung fuzz.* untuk SEMUA pasangan (item, produk):
+# O(item x katalog) di pure Python. Sekarang:
+#   1. Index trigram per katalog (memo by identity, dibangun sekali).
+#   2. Blocking: hanya SHORTLIST_SIZE produk dengan trigram paling mirip.
+#   3. Skor fuzzy hanya untuk shortlist, pakai rapidfuzz (C++, batch) kalau
+#      terinstall; fallback fuzzywuzzy dengan skor yang sama (0-100).
+
+try:
+    from rapidfuzz import fuzz as _fuzz, process as _process, utils as _utils
+    BACKEND = "rapidfuzz"
+except ImportError:  # pragma: no cover - tergantung environment
+    from fuzzywuzzy import fuzz as _fuzz
+    _process = _utils = None
+    BACKEND = "fuzzywuzzy"
+
+SCORERS = ("ratio", "partial_ratio", "token_set_ratio", "token_sort_ratio")
+
+# Kandidat yang benar-benar di-skor fuzzy per query
+SHORTLIST_SIZE = 64
+
+_matcher_memo = {"catalog": None, "matcher": None}
+
+
+def score(scorer: str, a: str, b: str) -> int:
+    """Skor 0-100 (int, sama seperti fuzzywuzzy) untuk satu pasangan."""
+    fn = getattr(_fuzz, scorer)
+    if BACKEND == "rapidfuzz" and scorer.startswith("token_"):
+        # fuzzywuzzy token_* selalu full_process (lowercase, buang simbol)
+        return int(round(fn(a, b, processor=_utils.default_process)))
+    return int(round(fn(a, b)))
+
+
+def full_name(product: dict) -> str:
+    return f"{product.get('name', '')} {product.get('variant') or ''}".strip()
+
+
+class ProductMatcher:
+    def __init__(self, products: list):
+        self.products = products
+        self.names = [full_name(p).lower() for p in products]
+        postings = {}
+        norms = []
+        for idx, name in enumerate(self.names):
+            grams = trigrams(tokenize(name))
+            norms.append(max(len(grams), 1))
+            for gram in grams:
+                postings.setdefault(gram, []).append(idx)
+        self.postings = {g: np.array(ids, dtype=np.int32) for g, ids in postings.items()}
+        self.norms = np.sqrt(np.array(norms, dtype=np.float32))
+
+    def candidates(self, query: str, size: int = SHORTLIST_SIZE) -> list:
+        """Index produk yang paling mirip secara trigram (urut sesuai katalog)."""
+        if len(self.products) <= size:
+            return list(range(len(self.products)))
+        lists = [self.postings[g] for g in trigrams(tokenize(query)) if g in self.postings]
+        if not lists:
+            return []
+        overlap = np.bincount(np.concatenate(lists), minlength=len(self.products))
+        weights = overlap / self.norms
+        top = np.argpartition(-weights, size)[:size]
+        top = top[overlap[top] > 0]
+        # Urutan katalog -> tie-break sama dengan scan linear lama
+        return sorted(top.tolist())
+
+    def best(self, query: str, scorer: str = "token_set_ratio"):
+        """(produk, skor) terbaik untuk query, atau (None, 0)."""
+        query = (query or "").lower()
+        shortlist = self.candidates(query)
+        if not query or not shortlist:
+            return None, 0
+
+        choices = [self.names[i] for i in shortlist]
+        if BACKEND == "rapidfuzz":
+            processor = _utils.default_process if scorer.startswith("token_") else None
+            scores = _process.cdist([query], choices, scorer=getattr(_fuzz, scorer), processor=processor)[0]
+            # Bulatkan dulu supaya tie-break (indeks pertama) sama dengan skor int
+            scores = np.rint(scores)
+            pos = int(np.argmax(scores))
+            return self.products[shortlist[pos]], int(scores[pos])
+
+        best_idx, best_score = None, 0
+        for idx, name in zip(shortlist, choices):
+            s = score(scorer, query, name)
+            if s > best_score:
+                best_idx, best_score = idx, s
+        if best_idx is None:
+            return None, 0
+        return self.products[best_idx], best_score
+
+    def shortlist_products(self, query: str) -> list:
+        return [self.products[i] for i in self.candidates((query or "").lower())]
+
+
+def get_product_matcher(known_products: list) -> ProductMatcher:
+    """Matcher untuk list katalog ini (dibangun ulang hanya kalau katalog berganti)."""
+    if _matcher_memo["catalog"] is not known_products:
+        _matcher_memo["matcher"] = ProductMatcher(known_products or [])
+        _matcher_memo["catalog"] = known_products
+    return _matcher_memo["matcher"]
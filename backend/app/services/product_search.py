@@ -0,0 +1,87 @@
+import re
+import asyncpg
+from app.config import PRODUCT_SEARCH_LIMIT
+
+# ==========================================
+# PRODUCT SEARCH (autocomplete)
+# ==========================================
+# Butuh migrations/001_product_search_trgm.sql (kolom search_text + index
+# pg_trgm). Urutan hasil: prefix seluruh teks > prefix salah satu kata >
+# kemiripan trigram (tahan typo: "bras" -> "beras"). Kalau migration belum
+# dijalankan, otomatis pakai query ILIKE lama.
+
+SEARCH_COLUMNS = "id, name, variant, base_unit, category, current_stock, sku, latest_selling_price"
+
+# Query >= 3 huruf: trigram (GIN) + boost prefix
+TRGM_SEARCH_QUERY = f"""
+    SELECT {SEARCH_COLUMNS},
+           word_similarity(:q, search_text)
+             + CASE WHEN search_text LIKE :prefix THEN 1.0
+                    WHEN search_text LIKE :word_prefix THEN 0.5
+                    ELSE 0 END AS score
+    FROM products
+    WHERE :q <% search_text OR search_text LIKE :contains
+    ORDER BY score DESC, name
+    LIMIT :limit
+"""
+
+# Query 1-2 huruf tidak punya trigram: prefix saja (index text_pattern_ops)
+PREFIX_SEARCH_QUERY = f"""
+    SELECT {SEARCH_COLUMNS}
+    FROM products
+    WHERE search_text LIKE :prefix
+    ORDER BY name
+    LIMIT :limit
+"""
+
+LEGACY_SEARCH_QUERY = f"""
+    SELECT {SEARCH_COLUMNS}
+    FROM products
+    WHERE name ILIKE :q OR variant ILIKE :q
+    LIMIT :limit
+"""
+
+# None = belum dicek, False = migration belum jalan (pakai ILIKE)
+_trgm_available = None
+
+
+def normalize_query(q: str) -> str:
+    """Sama dengan normalisasi kolom search_text: lowercase, spasi tunggal."""
+    return re.sub(r"\s+", " ", (q or "").strip().lower())
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def search_products(database, q: str, limit: int = PRODUCT_SEARCH_LIMIT) -> list:
+    """Produk paling relevan untuk teks autocomplete (record DB, sudah terurut)."""
+    global _trgm_available
+    query = normalize_query(q)
+    if not query:
+        return []
+
+    if _trgm_available is not False:
+        like = escape_like(query)
+        try:
+            if len(query) < 3:
+                rows = await database.fetch_all(
+                    query=PREFIX_SEARCH_QUERY, values={"prefix": f"{like}%", "limit": limit}
+                )
+            else:
+                rows = await database.fetch_all(query=TRGM_SEARCH_QUERY, values={
+                    "q": query,
+                    "prefix": f"{like}%",
+                    "word_prefix": f"% {like}%",
+                    "contains": f"%{like}%",
+                    "limit": limit,
+                })
+            _trgm_available = True
+            return rows
+        except (asyncpg.UndefinedColumnError, asyncpg.UndefinedFunctionError) as e:
+            print(f"[SEARCH] Trigram search unavailable, falling back to ILIKE: {e}")
+            _trgm_available = False
+
+    return await database.fetch_all(
+        query=LEGACY_SEARCH_QUERY, values={"q": f"%{q}%", "limit": limit}
+    )
@@ -0,0 +1,124 @@
+import re
+from app.config import RAG_TOP_K_PRODUCTS, RAG_TOP_K_SUPPLIERS, RAG_TOKEN_BUDGET, RAG_MIN_SCORE
+
+# ==========================================
+# RAG RETRIEVAL (katalog -> konteks prompt)
+# ==========================================
+# Memilih produk/supplier yang paling mirip dengan input user / hasil OCR,
+# bukan sekadar N baris pertama dari tabel. Skor = gabungan token yang sama
+# persis + kemiripan trigram karakter (tahan typo OCR: "Bras" ~ "Beras").
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+TOKEN_WEIGHT = 0.6
+TRIGRAM_WEIGHT = 0.4
+
+# Index per list katalog (memo by identity). Katalog yang sama dipakai ulang
+# tanpa menghitung ulang token/trigram setiap request.
+_index_memo = {"catalog": None, "entries": None}
+
+
+def tokenize(text: str) -> set:
+    return {t for t in TOKEN_PATTERN.findall((text or "").lower()) if len(t) > 1}
+
+
+def trigrams(tokens) -> set:
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _build_entries(items: list, text_fn) -> list:
+    entries = []
+    for item in items:
+        tokens = tokenize(text_fn(item))
+        if tokens:
+            entries.append((item, tokens, trigrams(tokens)))
+    return entries
+
+
+def _product_entries(known_products: list) -> list:
+    if _index_memo["catalog"] is not known_products:
+        _index_memo["entries"] = _build_entries(
+            known_products,
+            lambda p: f"{p.get('name', '')} {p.get('variant') or ''} {p.get('sku') or ''}"
+        )
+        _index_memo["catalog"] = known_products
+    return _index_memo["entries"]
+
+
+def score_entry(query_tokens: set, query_grams: set, tokens: set, grams: set) -> float:
+    """Seberapa besar bagian nama kandidat yang muncul di query (0-1)."""
+    token_score = len(tokens & query_tokens) / len(tokens)
+    gram_score = len(grams & query_grams) / len(grams)
+    return TOKEN_WEIGHT * token_score + TRIGRAM_WEIGHT * gram_score
+
+
+def rank(query: str, entries: list, top_k: int, min_score: float = RAG_MIN_SCORE) -> list:
+    query_tokens = tokenize(query)
+    if not query_tokens or not entries:
+        return []
+    query_grams = trigrams(query_tokens)
+
+    scored = []
+    for item, tokens, grams in entries:
+        score = score_entry(query_tokens, query_grams, tokens, grams)
+        if score >= min_score:
+            scored.append((score, item))
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return [item for _, item in scored[:top_k]]
+
+
+def select_lines(items: list, line_fn, token_budget: int) -> list:
+    """Format kandidat (urut relevansi) sampai budget token habis."""
+    lines = []
+    used = 0
+    for item in items:
+        line = line_fn(item)
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return lines
+
+
+def retrieve_products(query: str, known_products: list, top_k: int = RAG_TOP_K_PRODUCTS) -> list:
+    if not known_products:
+        return []
+    return rank(query, _product_entries(known_products), top_k)
+
+
+def retrieve_suppliers(query: str, known_suppliers: list, top_k: int = RAG_TOP_K_SUPPLIERS) -> list:
+    if not known_suppliers:
+        return []
+    entries = _build_entries(known_suppliers, lambda s: s.get('name', ''))
+    return rank(query, entries, top_k)
+
+
+def build_product_context(query: str, known_products: list, header: str, line_fn,
+                          token_budget: int = RAG_TOKEN_BUDGET) -> str:
+    """
+    Blok konteks produk untuk prompt: header + baris produk paling relevan.
+    Return "" kalau tidak ada yang relevan (prompt jadi lebih pendek).
+    """
+    products = retrieve_products(query, known_products)
+    lines = select_lines(products, line_fn, token_budget - estimate_tokens(header))
+    if not lines:
+        return ""
+    print(f"[RAG] {len(lines)}/{len(known_products)} products selected")
+    return header + "\n" + "\n".join(lines)
+
+
+def build_supplier_context(query: str, known_suppliers: list, header: str = "KNOWN SUPPLIERS (pakai ejaan ini jika cocok):") -> str:
+    suppliers = retrieve_suppliers(query, known_suppliers)
+    if not suppliers:
+        return ""
+    lines = [f"- {s['name']}" for s in suppliers]
+    return header + "\n" + "\n".join(lines)
@@ -0,0 +1,372 @@
+import re
+import statistics
+from datetime import date
+from app.config import OCR_LAYOUT_FAST_PATH
+from app.services.fast_parser import fast_path_stats
+
+# ==========================================
+# RECEIPT LAYOUT (boxes OCR -> baris -> tabel item)
+# ==========================================
+# 1. Box dikelompokkan jadi baris dengan threshold relatif terhadap tinggi
+#    box (bukan pixel tetap), jadi tahan terhadap resolusi/resize.
+# 2. Angka uang di tiap baris dipetakan ke kolom (unit_price / total) dari
+#    posisi x-nya; qty = angka kecil yang berdiri sendiri.
+# 3. Hasilnya tabel ringkas "name | qty | unit_price | total" untuk prompt,
+#    dan kalau semua baris konsisten dengan TOTAL struk, draft bisa dibuat
+#    tanpa LLM sama sekali.
+
+# Box masuk baris yang sama kalau selisih center-y <= faktor x median tinggi box
+ROW_TOLERANCE = 0.6
+MIN_CONFIDENCE = 0.1
+
+# Nomor HP / tanggal (0812-..., 12/03/2025) bukan angka uang
+MONEY_PATTERN = re.compile(
+    r"(?<![\d\-/])(?:rp\.?\s*)?(?!0\d)(\d{1,3}(?:[.\s]\d{3})+(?:,\d{1,2})?|\d+,\d{2}|\d{4,})(?![\d\-/])",
+    re.IGNORECASE
+)
+QTY_PATTERN = re.compile(r"(?<![\w.,])(\d{1,3}(?:,\d{1,2})?)(?:\s*x)?(?![\w.,])", re.IGNORECASE)
+SUMMARY_PATTERN = re.compile(
+    r"\b(sub\s*total|total|tunai|cash|kembali|kembalian|bayar|change|diskon|disc|ppn|pajak|tax)\b",
+    re.IGNORECASE
+)
+TOTAL_PATTERN = re.compile(r"\b(grand\s*total|total)\b", re.IGNORECASE)
+SUBTOTAL_PATTERN = re.compile(r"\bsub\s*total\b", re.IGNORECASE)
+TABLE_HEADER_PATTERN = re.compile(r"\b(item|qty|price|harga|amt|amount|jumlah)\b", re.IGNORECASE)
+
+ADDRESS_PATTERN = re.compile(r"^(jl|jln|jalan|kec|kecamatan|kab|kabupaten|kota|blok|rt|rw|desa|ds)\b\.?", re.IGNORECASE)
+PHONE_PATTERN = re.compile(r"(?:\+?62|0)8\d{7,11}")
+VARIANT_PATTERN = re.compile(
+    r"\b(isi\s*\d+|\d+(?:[.,]\d+)?\s*(?:kg|gr|gram|g|ml|ltr|liter|l))\b", re.IGNORECASE
+)
+UNIT_KEYWORDS = [
+    ("karton", "Karton"), ("dus", "Dus"), ("box", "Box"), ("karung", "Karung"),
+    ("sak", "Sak"), ("pack", "Pack"), ("renteng", "Renteng"), ("bungkus", "Bungkus"),
+]
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "mei": 5, "may": 5, "jun": 6, "jul": 7,
+    "agu": 8, "agt": 8, "aug": 8, "sep": 9, "okt": 10, "oct": 10, "nov": 11, "des": 12, "dec": 12,
+}
+DATE_NUMERIC = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\b")
+DATE_WORDS = re.compile(r"\b(\d{1,2})\s+([a-z]{3})[a-z]*\.?\s+(\d{4})\b", re.IGNORECASE)
+
+
+# --- 1. ROWS ---
+
+def _box_geometry(box) -> dict:
+    points, text, conf = box
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return {
+        "text": text, "conf": conf,
+        "x0": min(xs), "x1": max(xs),
+        "cy": (min(ys) + max(ys)) / 2, "h": max(ys) - min(ys),
+    }
+
+
+def cluster_rows(boxes: list) -> list:
+    """Kelompokkan box jadi baris (atas ke bawah), tiap baris urut kiri ke kanan."""
+    cells = [_box_geometry(b) for b in boxes if b[2] > MIN_CONFIDENCE and str(b[1]).strip()]
+    if not cells:
+        return []
+    median_h = statistics.median(c["h"] for c in cells) or 1.0
+    tolerance = median_h * ROW_TOLERANCE
+
+    rows = []
+    for cell in sorted(cells, key=lambda c: c["cy"]):
+        row = rows[-1] if rows else None
+        # Bandingkan dengan rata-rata center-y baris (bukan box pertama saja)
+        if row and abs(cell["cy"] - row["cy"]) <= tolerance:
+            row["cells"].append(cell)
+            row["cy"] = sum(c["cy"] for c in row["cells"]) / len(row["cells"])
+        else:
+            rows.append({"cy": cell["cy"], "cells": [cell]})
+
+    for row in rows:
+        row["cells"].sort(key=lambda c: c["x0"])
+        row["text"] = " ".join(c["text"] for c in row["cells"])
+    return rows
+
+
+def rows_to_text(rows: list) -> str:
+    return "\n".join(row["text"] for row in rows)
+
+
+# --- 2. NUMBERS & COLUMNS ---
+
+def parse_money(raw: str) -> float:
+    value = re.sub(r"^rp\.?\s*", "", raw.strip(), flags=re.IGNORECASE)
+    value = re.sub(r",\d{1,2}$", "", value)
+    return float(re.sub(r"[.\s]", "", value))
+
+
+def _money_cells(row: dict) -> list:
+    """Semua angka uang di baris + perkiraan posisi x (interpolasi di dalam box)."""
+    found = []
+    for cell in row["cells"]:
+        text = cell["text"]
+        for match in MONEY_PATTERN.finditer(text):
+            center = (match.start() + match.end()) / 2 / max(len(text), 1)
+            found.append({
+                "x": cell["x0"] + (cell["x1"] - cell["x0"]) * center,
+                "value": parse_money(match.group(1)),
+                "span": (cell, match.start(), match.end()),
+            })
+    return found
+
+
+def _text_without_money(row: dict) -> str:
+    parts = []
+    for cell in row["cells"]:
+        parts.append(MONEY_PATTERN.sub(" ", cell["text"]))
+    text = " ".join(parts)
+    return re.sub(r"\brp\.?(?=\s|$)", " ", text, flags=re.IGNORECASE)
+
+
+def _split_name_qty(text: str):
+    """'singkong jadul ORI 1kg 5' -> ('singkong jadul ORI 1kg', 5.0)."""
+    text = re.sub(r"\s+", " ", text).strip(" |:-")
+    matches = list(QTY_PATTERN.finditer(text))
+    if not matches:
+        return text, None
+    last = matches[-1]
+    # Qty harus di akhir (sebelum kolom harga), bukan di tengah nama
+    if text[last.end():].strip(" |:-x"):
+        return text, None
+    qty = float(last.group(1).replace(",", "."))
+    return text[:last.start()].strip(" |:-"), qty
+
+
+def _column_centers(money_rows: list):
+    """Posisi x kolom unit_price & total dari baris yang punya >= 2 angka uang."""
+    price_xs, total_xs = [], []
+    for cells in money_rows:
+        if len(cells) >= 2:
+            price_xs.append(cells[-2]["x"])
+            total_xs.append(cells[-1]["x"])
+    if not total_xs:
+        return None, None
+    return statistics.median(price_xs), statistics.median(total_xs)
+
+
+def _is_consistent(item: dict) -> bool:
+    expected = item["qty"] * item["unit_price"]
+    return abs(expected - item["total"]) <= max(1.0, item["total"] * 0.01)
+
+
+# --- 3. ANALYZE ---
+
+def analyze_receipt(boxes: list) -> dict:
+    """
+    Return dict:
+      text         : teks per baris (fallback prompt lama)
+      items        : [{name, qty, unit_price, total, consistent}]
+      total        : TOTAL struk (atau subtotal) kalau terbaca
+      header_lines : baris sebelum tabel item (nama toko, alamat, tanggal)
+      footer_lines : baris ringkasan setelah tabel (total, tunai/transfer)
+      table_text   : teks ringkas untuk LLM (None kalau tabel tidak ketemu)
+      is_consistent: semua item qty*harga=total DAN jumlahnya = TOTAL struk
+    """
+    rows = cluster_rows(boxes)
+    layout = {
+        "text": rows_to_text(rows), "items": [], "total": None,
+        "header_lines": [], "footer_lines": [], "table_text": None, "is_consistent": False,
+    }
+    if not rows:
+        return layout
+
+    money = [_money_cells(row) for row in rows]
+    item_candidates = [
+        i for i, row in enumerate(rows)
+        if money[i] and not SUMMARY_PATTERN.search(row["text"])
+    ]
+    price_x, total_x = _column_centers([money[i] for i in item_candidates])
+
+    items = []
+    item_rows = set()
+    consumed_name_rows = set()
+    for i in item_candidates:
+        cells = money[i]
+        name, qty = _split_name_qty(_text_without_money(rows[i]))
+
+        if len(cells) >= 2:
+            unit_price, total = cells[-2]["value"], cells[-1]["value"]
+        elif total_x is not None and qty:
+            # Satu angka: tentukan kolomnya dari posisi x
+            value = cells[0]["value"]
+            if abs(cells[0]["x"] - total_x) <= abs(cells[0]["x"] - price_x):
+                unit_price, total = value / qty, value
+            else:
+                unit_price, total = value, value * qty
+        else:
+            continue
+
+        if qty is None:
+            ratio = total / unit_price if unit_price else 0
+            qty = round(ratio) if ratio and abs(ratio - round(ratio)) < 0.01 else 1.0
+
+        # Nama di baris sendiri di atas baris angka ("Bumbu tomyum" / "1 Rp 9.000 Rp 9.000")
+        if len(re.sub(r"[^a-zA-Z]", "", name)) < 2 and i > 0:
+            prev = i - 1
+            if not money[prev] and prev not in consumed_name_rows and not TABLE_HEADER_PATTERN.search(rows[prev]["text"]):
+                name = rows[prev]["text"].strip()
+                consumed_name_rows.add(prev)
+        if len(re.sub(r"[^a-zA-Z]", "", name)) < 2:
+            continue
+
+        item = {"name": name, "qty": float(qty), "unit_price": float(unit_price), "total": float(total)}
+        item["consistent"] = _is_consistent(item)
+        items.append(item)
+        item_rows.add(i)
+
+    if not items:
+        return layout
+
+    first_item_row = min(min(item_rows), min(consumed_name_rows, default=len(rows)))
+    last_item_row = max(item_rows)
+
+    # TOTAL struk: baris "Total" (bukan subtotal), fallback subtotal
+    receipt_total = subtotal = None
+    for i in range(last_item_row + 1, len(rows)):
+        text = rows[i]["text"]
+        if not money[i]:
+            continue
+        value = max(c["value"] for c in money[i])
+        if SUBTOTAL_PATTERN.search(text):
+            subtotal = subtotal or value
+        elif TOTAL_PATTERN.search(text) and receipt_total is None:
+            receipt_total = value
+    receipt_total = receipt_total or subtotal
+
+    header_lines = [
+        rows[i]["text"] for i in range(first_item_row)
+        if not TABLE_HEADER_PATTERN.search(rows[i]["text"]) or money[i]
+    ]
+    footer_lines = [
+        rows[i]["text"] for i in range(last_item_row + 1, len(rows))
+        if money[i] or SUMMARY_PATTERN.search(rows[i]["text"]) or re.search(r"transfer|qris|debit", rows[i]["text"], re.IGNORECASE)
+    ]
+
+    table = ["name | qty | unit_price | total"]
+    for item in items:
+        table.append(f"{item['name']} | {item['qty']:g} | {item['unit_price']:.0f} | {item['total']:.0f}")
+
+    items_sum = sum(item["total"] for item in items)
+    layout.update({
+        "items": items,
+        "total": receipt_total,
+        "header_lines": header_lines,
+        "footer_lines": footer_lines,
+        "table_text": "\n".join(table),
+        "is_consistent": (
+            receipt_total is not None
+            and all(item["consistent"] for item in items)
+            and abs(items_sum - receipt_total) <= max(1.0, receipt_total * 0.005)
+        ),
+    })
+    return layout
+
+
+def compact_receipt_text(layout: dict) -> str:
+    """Header + tabel + ringkasan: input LLM yang jauh lebih pendek dari teks OCR mentah."""
+    parts = ["HEADER:", *layout["header_lines"], "", "ITEMS:", layout["table_text"]]
+    if layout["footer_lines"]:
+        parts += ["", "SUMMARY:", *layout["footer_lines"]]
+    return "\n".join(parts)
+
+
+# --- 4. DRAFT TANPA LLM ---
+
+def _parse_receipt_date(lines: list):
+    for line in lines:
+        match = DATE_NUMERIC.search(line)
+        if match:
+            day, month, year = (int(v) for v in match.groups())
+            year += 2000 if year < 100 else 0
+            try:
+                return date(year, month, day).isoformat()
+            except ValueError:
+                pass
+        match = DATE_WORDS.search(line)
+        if match and match.group(2).lower() in MONTHS:
+            try:
+                return date(int(match.group(3)), MONTHS[match.group(2).lower()], int(match.group(1))).isoformat()
+            except ValueError:
+                pass
+    return date.today().isoformat()
+
+
+def _split_variant(name: str):
+    match = VARIANT_PATTERN.search(name)
+    if not match:
+        return name, None
+    variant = match.group(1)
+    if variant.lower().startswith("isi"):
+        variant = "Isi " + re.sub(r"\D", "", variant)
+    product_name = re.sub(r"\s+", " ", name[:match.start()] + name[match.end():]).strip()
+    return product_name or name, variant
+
+
+def _guess_unit(name: str) -> str:
+    lower = name.lower()
+    for keyword, unit in UNIT_KEYWORDS:
+        if keyword in lower:
+            return unit
+    return "pcs"
+
+
+def layout_to_draft(layout: dict) -> dict:
+    """Draft procurement (format sama dengan output LLM struk) dari tabel yang konsisten."""
+    supplier_name = supplier_phone = None
+    address_lines = []
+    for line in layout["header_lines"]:
+        compact = re.sub(r"[\s\-]", "", line)
+        phone = PHONE_PATTERN.search(compact)
+        if phone:
+            supplier_phone = supplier_phone or phone.group(0)
+            continue
+        if ADDRESS_PATTERN.search(line.strip()):
+            address_lines.append(line.strip())
+            continue
+        if supplier_name is None and len(re.sub(r"[^a-zA-Z]", "", line)) >= 3 \
+                and not DATE_NUMERIC.search(line) and not DATE_WORDS.search(line):
+            supplier_name = line.strip()
+
+    footer = " ".join(layout["footer_lines"]).lower()
+    payment_method = "Transfer" if "transfer" in footer else "Tunai" if ("tunai" in footer or "cash" in footer) else None
+
+    items = []
+    for item in layout["items"]:
+        product_name, variant = _split_variant(item["name"])
+        items.append({
+            "product_name": product_name,
+            "variant": variant,
+            "qty": item["qty"],
+            "unit": _guess_unit(item["name"]),
+            "unit_price": item["unit_price"],
+            "total_price": item["total"],
+            "notes": None,
+        })
+
+    return {
+        "action": "new",
+        "supplier_name": supplier_name,
+        "supplier_phone": supplier_phone,
+        "supplier_address": ", ".join(address_lines) or None,
+        "transaction_date": _parse_receipt_date(layout["header_lines"]),
+        "receipt_number": None,
+        "items": items,
+        "subtotal": sum(i["total_price"] for i in items),
+        "total": layout["total"],
+        "payment_method": payment_method,
+        "confidence_score": 0.9,
+    }
+
+
+def fast_parse_receipt(layout: dict):
+    """Draft tanpa LLM kalau tabel struk konsisten; None = lanjut ke LLM."""
+    if not OCR_LAYOUT_FAST_PATH or not layout["is_consistent"]:
+        fast_path_stats["receipt"]["misses"] += 1
+        return None
+    fast_path_stats["receipt"]["hits"] += 1
+    return layout_to_draft(layout)
@@ -0,0 +1,79 @@
+import json
+import re
+
+SUPPLIER_PATTERN = re.compile(r'"supplier_name"\s*:\s*("(?:[^"\\]|\\.)*"|null)')
+ITEMS_PATTERN = re.compile(r'"items"\s*:\s*\[')
+
+
+class IncrementalDraftParser:
+    """
+    Parser JSON bertahap untuk output LLM yang di-stream.
+    feed() menerima potongan teks dan mengembalikan event yang sudah lengkap:
+    ("supplier", {...}) begitu supplier_name selesai ditulis, dan ("item", {...})
+    untuk setiap object di array "items" yang kurung kurawalnya sudah tertutup.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.supplier_emitted = False
+        self.items_done = False
+        self._items_pos = None   # index setelah '[' milik "items"
+        self._scan_pos = None    # posisi scan berikutnya di dalam array
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        events = []
+
+        if not self.supplier_emitted:
+            match = SUPPLIER_PATTERN.search(self.buffer)
+            if match:
+                self.supplier_emitted = True
+                events.append(("supplier", {"supplier_name": json.loads(match.group(1))}))
+
+        if self._items_pos is None:
+            match = ITEMS_PATTERN.search(self.buffer)
+            if match:
+                self._items_pos = self._scan_pos = match.end()
+
+        if self._items_pos is not None and not self.items_done:
+            events.extend(self._scan_items())
+        return events
+
+    def _scan_items(self) -> list:
+        events = []
+        buf = self.buffer
+        i = self._scan_pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start is not None:
+                    try:
+                        events.append(("item", json.loads(buf[self._obj_start:i + 1])))
+                    except ValueError:
+                        pass
+                    self._obj_start = None
+            elif ch == "]" and self._depth == 0:
+                self.items_done = True
+                i += 1
+                break
+            i += 1
+        self._scan_pos = i
+        return events
@@ -0,0 +1,133 @@
+"""
+Benchmark commit transaksi pembelian: loop per item (cara lama, 4-5 query per
+baris) vs commit set-based (commit_transaction_logic, query konstan).
+
+Butuh DATABASE_URL (database dev/staging, BUKAN production). Semua data
+benchmark ditulis di dalam transaksi yang di-rollback, jadi tidak tersisa:
+    python benchmarks/bench_commit.py
+    python benchmarks/bench_commit.py --items 5 20 40 80 --repeat 5
+
+Latency sangat tergantung jarak ke database (pgbouncer/Supabase): makin jauh,
+makin besar selisihnya karena yang dihemat adalah round-trip.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import databases
+from dotenv import load_dotenv
+from app.schemas import CommitTransactionInput
+from app.services.commit_service import (
+    commit_transaction_logic, upsert_contact, create_transaction_header,
+    upsert_product, create_transaction_item, record_stock_ledger
+)
+
+
+class CountingDatabase:
+    """Bungkus Database untuk menghitung round-trip query."""
+
+    def __init__(self, database):
+        self._database = database
+        self.queries = 0
+
+    def transaction(self, *args, **kwargs):
+        return self._database.transaction(*args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        self.queries += 1
+        return await self._database.execute(*args, **kwargs)
+
+    async def fetch_one(self, *args, **kwargs):
+        self.queries += 1
+        return await self._database.fetch_one(*args, **kwargs)
+
+    async def fetch_all(self, *args, **kwargs):
+        self.queries += 1
+        return await self._database.fetch_all(*args, **kwargs)
+
+    async def fetch_val(self, *args, **kwargs):
+        self.queries += 1
+        return await self._database.fetch_val(*args, **kwargs)
+
+
+async def legacy_commit(database, data):
+    """commit_transaction_logic sebelum versi bulk (per item)."""
+    async with database.transaction():
+        contact_id = await upsert_contact(database, data.supplier_name, data.supplier_phone, data.supplier_address, created=[])
+        trans_id, _ = await create_transaction_header(
+            database, contact_id, data.transaction_date, data.receipt_number,
+            data.total, data.payment_method, data.input_source, data.evidence_url
+        )
+        for item in data.items:
+            qty = float(item.qty or 0)
+            result = await upsert_product(database, item.product_name, item.variant, item.unit, qty, float(item.unit_price or 0))
+            await create_transaction_item(
+                database, trans_id, result["product_id"], qty, item.unit, float(item.unit_price or 0),
+                result["conversion_rate"], float(item.total_price or 0), item.notes
+            )
+            await record_stock_ledger(database, result["product_id"], trans_id, result["base_qty_change"], result["stock_after"], "Pembelian Masuk")
+
+
+def make_payload(count: int, run_id: str) -> CommitTransactionInput:
+    # Tiap produk muncul dua kali: baris pertama produk baru, baris kedua update stok
+    items = [{
+        "product_name": f"Bench {run_id} Produk {i % max(count // 2, 1)}",
+        "variant": "isi 12" if i % 3 == 0 else None,
+        "qty": 1 + i % 5, "unit": "dus",
+        "unit_price": 10000 + i * 100, "total_price": 10000 + i * 100,
+    } for i in range(count)]
+    return CommitTransactionInput(
+        supplier_name=f"Bench Supplier {run_id}", transaction_date="2025-01-01",
+        receipt_number=f"BENCH-{uuid.uuid4().hex[:12]}", total=0, items=items, input_source="MANUAL",
+    )
+
+
+async def measure(database, commit_fn, count: int, repeat: int) -> dict:
+    timings, queries = [], 0
+    run_id = uuid.uuid4().hex[:6]
+    for _ in range(repeat):
+        outer = await database.transaction()
+        try:
+            counting = CountingDatabase(database)
+            started = time.perf_counter()
+            await commit_fn(counting, make_payload(count, run_id))
+            timings.append(time.perf_counter() - started)
+            queries = counting.queries
+        finally:
+            await outer.rollback()
+    return {"median_ms": statistics.median(timings) * 1000, "queries": queries}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[5, 10, 20, 40, 80])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    load_dotenv()
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        sys.exit("DATABASE_URL not set")
+    database = databases.Database(url, min_size=1, max_size=1, statement_cache_size=0)
+    await database.connect()
+    try:
+        header = f"{'items':>6} {'legacy ms':>10} {'legacy q':>9} {'bulk ms':>9} {'bulk q':>7} {'speedup':>8}"
+        print(header)
+        print("-" * len(header))
+        for count in args.items:
+            legacy = await measure(database, legacy_commit, count, args.repeat)
+            bulk = await measure(database, commit_transaction_logic, count, args.repeat)
+            print(f"{count:>6} {legacy['median_ms']:>10.1f} {legacy['queries']:>9} "
+                  f"{bulk['median_ms']:>9.1f} {bulk['queries']:>7} {legacy['median_ms'] / bulk['median_ms']:>7.1f}x")
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+Benchmark OCR struk: tanpa vs dengan preprocessing (grayscale, crop, resize, deskew).
+
+Jalankan dari folder backend (butuh easyocr terinstall):
+    python benchmarks/bench_ocr_preprocess.py
+    python benchmarks/bench_ocr_preprocess.py foto1.jpg foto2.jpg --repeat 5
+    python benchmarks/bench_ocr_preprocess.py --simulate-photo   # upscale ke ~12MP + miring 4°
+
+Akurasi = recall token yang diharapkan (default: isi struk contoh
+dokumentasi/struk.jpeg), atau pakai --expected file.txt (satu token per baris).
+
+Status: BELUM ADA HASIL UKUR. Benchmark ini belum pernah dijalankan di foto
+struk asli (butuh model EasyOCR yang diunduh), jadi OCR_PREPROCESS tetap
+opt-in dan default false. Catat hasilnya (waktu & recall, per foto) di sini
+sebelum mengubah default.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from app.services.ocr_service import decode_image, ocr_image, get_ocr
+from app.services.image_preprocess import preprocess_receipt
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(__file__), "..", "..", "dokumentasi", "struk.jpeg")
+
+# Token yang terbaca jelas di dokumentasi/struk.jpeg
+DEFAULT_EXPECTED = [
+    "Yunden", "Jaya", "Bumbu", "tomyum", "Santan", "Kartonan", "singkong", "jadul",
+    "balado", "9.000,00", "175.000,00", "17.000,00", "85.000,00", "20.000,00",
+    "40.000,00", "309.000,00",
+]
+
+
+def simulate_phone_photo(image: np.ndarray, angle: float = 4.0) -> np.ndarray:
+    """Perbesar ke ~12MP dan miringkan sedikit, seperti foto HP asli."""
+    scale = (12_000_000 / (image.shape[0] * image.shape[1])) ** 0.5
+    big = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    height, width = big.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(big, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+
+
+def token_recall(text: str, expected: list) -> float:
+    haystack = text.lower()
+    found = sum(1 for token in expected if token.lower() in haystack)
+    return found / len(expected) if expected else 0.0
+
+
+def run_variant(image: np.ndarray, preprocess: bool, repeat: int, expected: list) -> dict:
+    timings = []
+    text = ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text = ocr_image(image, preprocess=preprocess)
+        timings.append(time.perf_counter() - started)
+
+    prep_started = time.perf_counter()
+    processed, info = preprocess_receipt(image, enabled=preprocess)
+    prep_time = time.perf_counter() - prep_started
+
+    return {
+        "variant": "preprocess" if preprocess else "raw",
+        "ocr_shape": "x".join(str(v) for v in processed.shape[:2]),
+        "prep_ms": prep_time * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "lines": len([line for line in text.splitlines() if line.strip()]),
+        "recall": token_recall(text, expected),
+        "angle": info.get("angle", 0.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", default=[DEFAULT_IMAGE])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--expected", help="file berisi token yang harus terbaca (satu per baris)")
+    parser.add_argument("--simulate-photo", action="store_true", help="upscale ke ~12MP + rotasi 4°")
+    args = parser.parse_args()
+
+    expected = DEFAULT_EXPECTED
+    if args.expected:
+        with open(args.expected, encoding="utf-8") as f:
+            expected = [line.strip() for line in f if line.strip()]
+
+    # Load model di luar pengukuran
+    get_ocr()
+
+    header = f"{'image':<24} {'variant':<11} {'ocr input':>11} {'prep ms':>8} {'total ms':>9} {'lines':>6} {'recall':>7} {'deskew':>7}"
+    print(header)
+    print("-" * len(header))
+    for path in args.images:
+        with open(path, "rb") as f:
+            image = decode_image(f.read())
+        if image is None:
+            print(f"{os.path.basename(path)}: cannot decode")
+            continue
+        if args.simulate_photo:
+            image = simulate_phone_photo(image)
+        for preprocess in (False, True):
+            r = run_variant(image, preprocess, args.repeat, expected)
+            print(f"{os.path.basename(path)[:24]:<24} {r['variant']:<11} {r['ocr_shape']:>11} "
+                  f"{r['prep_ms']:>8.1f} {r['median_ms']:>9.1f} {r['lines']:>6} {r['recall']:>7.0%} {r['angle']:>7}")
+
+
+if __name__ == "__main__":
+    main()
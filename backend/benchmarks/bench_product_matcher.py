@@ -0,0 +1,119 @@
+"""
+Benchmark pencocokan nama produk: scan linear fuzzywuzzy (cara lama) vs
+ProductMatcher (blocking trigram + skor shortlist).
+
+Jalankan dari folder backend:
+    python benchmarks/bench_product_matcher.py
+    python benchmarks/bench_product_matcher.py --sizes 1000 10000 --queries 50
+
+Katalog sintetis (nama grosir acak + varian); query = nama produk dengan typo
+OCR. "agree" = persentase query yang hasil terbaiknya sama dengan scan linear
+(skor sama; produk beda dengan skor sama dianggap setara).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzywuzzy import fuzz
+from app.services.product_matcher import ProductMatcher, BACKEND, full_name
+
+WORDS = [
+    "beras", "gula", "minyak", "goreng", "tepung", "terigu", "kopi", "teh", "susu", "kental",
+    "manis", "santan", "kara", "kecap", "sambal", "saus", "tomat", "mie", "instan", "bihun",
+    "singkong", "jadul", "balado", "keripik", "pedas", "original", "bumbu", "tomyum", "rendang",
+    "sabun", "cuci", "piring", "deterjen", "bubuk", "sampo", "sachet", "garam", "merica", "telur",
+    "ayam", "kornet", "sarden", "biskuit", "coklat", "keju", "wafer", "roti", "tawar", "selai",
+]
+BRANDS = ["indo", "sedap", "bimoli", "rose", "kapal", "api", "abc", "sasa", "royco", "sunco",
+          "filma", "tropical", "sania", "kara", "frisian", "bendera", "gulaku", "segitiga", "biru"]
+VARIANTS = ["1kg", "500gr", "250gr", "2L", "1L", "isi 36", "isi 12", "5kg", "25kg", "ORI", None]
+
+
+def make_catalog(size: int, rng: random.Random) -> list:
+    catalog = []
+    for i in range(size):
+        words = rng.sample(WORDS, rng.randint(2, 3))
+        name = " ".join([rng.choice(BRANDS)] + words).title()
+        catalog.append({"id": str(i), "name": f"{name} {i % 97}", "variant": rng.choice(VARIANTS)})
+    return catalog
+
+
+def add_typo(text: str, rng: random.Random) -> str:
+    chars = list(text)
+    for _ in range(rng.randint(1, 2)):
+        pos = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.4:
+            chars[pos] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        elif op < 0.7:
+            del chars[pos]
+        else:
+            chars.insert(pos, rng.choice("aeiou"))
+    return "".join(chars)
+
+
+def linear_best(query: str, catalog: list, scorer):
+    best, best_score = None, 0
+    query = query.lower()
+    for p in catalog:
+        s = scorer(query, full_name(p).lower())
+        if s > best_score:
+            best, best_score = p, s
+    return best, best_score
+
+
+def run(size: int, queries: int, scorer_name: str, rng: random.Random) -> dict:
+    catalog = make_catalog(size, rng)
+    picks = [rng.choice(catalog) for _ in range(queries)]
+    query_texts = [add_typo(full_name(p), rng) for p in picks]
+
+    started = time.perf_counter()
+    matcher = ProductMatcher(catalog)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    scorer = getattr(fuzz, scorer_name)
+    old_times, new_times, agree = [], [], 0
+    for q in query_texts:
+        t = time.perf_counter()
+        _, old_score = linear_best(q, catalog, scorer)
+        old_times.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        _, new_score = matcher.best(q, scorer_name)
+        new_times.append(time.perf_counter() - t)
+        agree += abs(old_score - new_score) <= 1
+
+    old_ms = statistics.median(old_times) * 1000
+    new_ms = statistics.median(new_times) * 1000
+    return {
+        "size": size, "build_ms": build_ms, "old_ms": old_ms, "new_ms": new_ms,
+        "speedup": old_ms / new_ms if new_ms else float("inf"), "agree": agree / queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--scorer", default="token_set_ratio", choices=["token_set_ratio", "partial_ratio"])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"backend: {BACKEND}, scorer: {args.scorer}, {args.queries} queries per size")
+    header = f"{'catalog':>8} {'build ms':>9} {'linear ms/q':>12} {'index ms/q':>11} {'speedup':>8} {'agree':>6}"
+    print(header)
+    print("-" * len(header))
+    for size in args.sizes:
+        r = run(size, args.queries, args.scorer, rng)
+        print(f"{r['size']:>8} {r['build_ms']:>9.1f} {r['old_ms']:>12.2f} {r['new_ms']:>11.3f} "
+              f"{r['speedup']:>7.0f}x {r['agree']:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
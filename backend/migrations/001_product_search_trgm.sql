@@ -0,0 +1,24 @@
+-- 001: Pencarian produk (autocomplete) berbasis trigram
+-- Jalankan sekali di database (Supabase SQL editor / psql). Aman diulang.
+--
+-- search_text = nama + varian + sku yang sudah dinormalisasi (lowercase,
+-- spasi tunggal). Index GIN trigram melayani pencarian typo-tolerant
+-- (word_similarity / LIKE '%q%'), index text_pattern_ops melayani prefix
+-- untuk query pendek (1-2 huruf) yang tidak punya trigram.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE public.products
+  ADD COLUMN IF NOT EXISTS search_text text
+  GENERATED ALWAYS AS (
+    lower(regexp_replace(
+      trim(coalesce(name, '') || ' ' || coalesce(variant, '') || ' ' || coalesce(sku, '')),
+      '\s+', ' ', 'g'
+    ))
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS products_search_text_trgm_idx
+  ON public.products USING gin (search_text gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS products_search_text_prefix_idx
+  ON public.products (search_text text_pattern_ops);
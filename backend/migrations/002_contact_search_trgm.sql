@@ -0,0 +1,37 @@
+-- 002: Pencarian kontak (supplier/customer picker) berbasis trigram
+-- Jalankan sekali setelah 001 (butuh extension pg_trgm). Aman diulang.
+--
+-- search_name  = nama lowercase, spasi tunggal ("Toko  Yunden" -> "toko yunden")
+-- phone_digits = nomor HP tanpa simbol, +62/62 -> 0, 8xx -> 08xx
+--                (sama dengan normalize_phone di backend)
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE public.contacts
+  ADD COLUMN IF NOT EXISTS search_name text
+  GENERATED ALWAYS AS (lower(regexp_replace(trim(name), '\s+', ' ', 'g'))) STORED;
+
+ALTER TABLE public.contacts
+  ADD COLUMN IF NOT EXISTS phone_digits text
+  GENERATED ALWAYS AS (
+    regexp_replace(
+      regexp_replace(regexp_replace(coalesce(phone, ''), '\D', '', 'g'), '^62(\d{9,})$', '0\1'),
+      '^8', '08'
+    )
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS contacts_search_name_trgm_idx
+  ON public.contacts USING gin (search_name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS contacts_type_search_name_idx
+  ON public.contacts (type, search_name text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS contacts_phone_digits_trgm_idx
+  ON public.contacts USING gin (phone_digits gin_trgm_ops);
+
+-- Filter "search" di /transactions: nomor invoice + transaksi milik kontak yang cocok
+CREATE INDEX IF NOT EXISTS transactions_invoice_number_trgm_idx
+  ON public.transactions USING gin (invoice_number gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS transactions_contact_id_idx
+  ON public.transactions (contact_id);
@@ -0,0 +1,9 @@
+-- 003: Index untuk commit transaksi (bulk)
+-- Resolusi produk per baris struk = LOWER(name) + LOWER(variant), dan
+-- penomoran SKU baru = prefix LIKE 'GEN-SING-BKS-%'. Aman diulang.
+
+CREATE INDEX IF NOT EXISTS products_name_variant_lower_idx
+  ON public.products (LOWER(name), LOWER(COALESCE(variant, '')));
+
+CREATE INDEX IF NOT EXISTS products_sku_pattern_idx
+  ON public.products (sku text_pattern_ops);
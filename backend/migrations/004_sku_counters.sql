@@ -0,0 +1,40 @@
+-- 004: Counter nomor SKU per prefix ([KATEGORI]-[MEREK]-[SATUAN])
+-- Pengganti scan "sku LIKE 'GEN-SING-BKS-%' ORDER BY sku DESC" tiap produk
+-- baru: nomor diambil atomic lewat INSERT ... ON CONFLICT DO UPDATE
+-- RETURNING (satu baris per prefix, bisa sekaligus satu blok nomor).
+-- Jalankan sekali, aman diulang.
+
+CREATE TABLE IF NOT EXISTS public.sku_counters (
+  prefix      text PRIMARY KEY,
+  last_number bigint NOT NULL DEFAULT 0,
+  updated_at  timestamptz NOT NULL DEFAULT now()
+);
+
+-- Seed dari SKU yang sudah ada (nomor terbesar secara numerik, bukan urutan teks)
+INSERT INTO public.sku_counters (prefix, last_number)
+SELECT substring(sku FROM '^(.*)-\d+$'), MAX(CAST(substring(sku FROM '-(\d+)$') AS bigint))
+FROM public.products
+WHERE sku ~ '^.+-\d{1,18}$'
+GROUP BY 1
+ON CONFLICT (prefix) DO UPDATE
+  SET last_number = GREATEST(sku_counters.last_number, EXCLUDED.last_number);
+
+-- SKU yang diisi manual (form produk) ikut menaikkan counter, supaya nomor
+-- berikutnya dari allocator tidak bentrok dengan UNIQUE sku.
+CREATE OR REPLACE FUNCTION public.sku_counters_track() RETURNS trigger AS $$
+BEGIN
+  IF NEW.sku ~ '^.+-\d{1,18}$' THEN
+    INSERT INTO public.sku_counters (prefix, last_number)
+    VALUES (substring(NEW.sku FROM '^(.*)-\d+$'), CAST(substring(NEW.sku FROM '-(\d+)$') AS bigint))
+    ON CONFLICT (prefix) DO UPDATE
+      SET last_number = EXCLUDED.last_number, updated_at = now()
+      WHERE sku_counters.last_number < EXCLUDED.last_number;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_sku_counters_track ON public.products;
+CREATE TRIGGER products_sku_counters_track
+  AFTER INSERT OR UPDATE OF sku ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.sku_counters_track();
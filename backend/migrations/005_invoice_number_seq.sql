@@ -0,0 +1,7 @@
+-- 005: Nomor invoice dari sequence (INV-YYYYMMDD-000123)
+-- nextval() tidak ikut transaksi dan tidak pernah memberi nilai yang sama,
+-- jadi tidak ada lagi tabrakan UNIQUE invoice_number (nomor lama acak 5 digit,
+-- nomor baru minimal 6 digit - tidak mungkin sama). Nomor yang dipakai
+-- transaksi gagal/rollback hilang (gap), itu wajar. Aman diulang.
+
+CREATE SEQUENCE IF NOT EXISTS public.invoice_number_seq AS bigint START 1;
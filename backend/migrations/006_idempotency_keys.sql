@@ -0,0 +1,19 @@
+-- 006: Idempotency-Key untuk endpoint commit (transaksi & penjualan)
+-- Client (HP, sinyal lemah) boleh mengulang commit dengan key yang sama;
+-- key diklaim di dalam transaksi commit, jadi retry hanya mengembalikan
+-- response tersimpan tanpa membuat transaksi/ledger/stok dobel. Aman diulang.
+
+CREATE TABLE IF NOT EXISTS public.idempotency_keys (
+  endpoint       text NOT NULL,
+  key            text NOT NULL,
+  request_hash   text NOT NULL,
+  transaction_id uuid,
+  response       jsonb,
+  created_at     timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (endpoint, key)
+);
+
+-- Untuk bersih-bersih key lama, mis. dijadwalkan harian:
+--   DELETE FROM public.idempotency_keys WHERE created_at < now() - interval '7 days';
+CREATE INDEX IF NOT EXISTS idempotency_keys_created_at_idx
+  ON public.idempotency_keys (created_at);
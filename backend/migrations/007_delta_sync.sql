@@ -0,0 +1,68 @@
+-- 007: Delta sync (/api/v1/sync/*) untuk aplikasi mobile
+-- Client menyimpan cursor (updated_at, id) dan hanya mengambil baris yang
+-- berubah sesudahnya; baris yang dihapus dicatat di sync_tombstones.
+-- Jalankan sekali, aman diulang.
+
+-- 1. updated_at wajib terisi (baris lama) dan selalu ikut berubah saat UPDATE,
+--    termasuk update yang tidak menyebut updated_at (mis. edit kontak)
+UPDATE public.products SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL;
+UPDATE public.contacts SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL;
+UPDATE public.transactions SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL;
+
+CREATE OR REPLACE FUNCTION public.sync_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_sync_touch ON public.products;
+CREATE TRIGGER products_sync_touch BEFORE UPDATE ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.sync_touch_updated_at();
+
+DROP TRIGGER IF EXISTS contacts_sync_touch ON public.contacts;
+CREATE TRIGGER contacts_sync_touch BEFORE UPDATE ON public.contacts
+  FOR EACH ROW EXECUTE FUNCTION public.sync_touch_updated_at();
+
+DROP TRIGGER IF EXISTS transactions_sync_touch ON public.transactions;
+CREATE TRIGGER transactions_sync_touch BEFORE UPDATE ON public.transactions
+  FOR EACH ROW EXECUTE FUNCTION public.sync_touch_updated_at();
+
+-- 2. Index keyset (updated_at, id) untuk feed perubahan
+CREATE INDEX IF NOT EXISTS products_updated_at_id_idx ON public.products (updated_at, id);
+CREATE INDEX IF NOT EXISTS contacts_updated_at_id_idx ON public.contacts (updated_at, id);
+CREATE INDEX IF NOT EXISTS transactions_updated_at_id_idx ON public.transactions (updated_at, id);
+
+-- 3. Tombstone: id baris yang dihapus (delete_product, transaksi kosong, dll.)
+CREATE TABLE IF NOT EXISTS public.sync_tombstones (
+  entity     text NOT NULL,
+  entity_id  uuid NOT NULL,
+  deleted_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (entity, entity_id)
+);
+
+-- Untuk bersih-bersih (samakan dengan SYNC_TOMBSTONE_RETENTION_DAYS), mis. harian:
+--   DELETE FROM public.sync_tombstones WHERE deleted_at < now() - interval '30 days';
+CREATE INDEX IF NOT EXISTS sync_tombstones_entity_deleted_at_idx
+  ON public.sync_tombstones (entity, deleted_at);
+
+CREATE OR REPLACE FUNCTION public.sync_record_tombstone() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO public.sync_tombstones (entity, entity_id)
+  VALUES (TG_TABLE_NAME, OLD.id)
+  ON CONFLICT (entity, entity_id) DO UPDATE SET deleted_at = now();
+  RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_sync_tombstone ON public.products;
+CREATE TRIGGER products_sync_tombstone AFTER DELETE ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.sync_record_tombstone();
+
+DROP TRIGGER IF EXISTS contacts_sync_tombstone ON public.contacts;
+CREATE TRIGGER contacts_sync_tombstone AFTER DELETE ON public.contacts
+  FOR EACH ROW EXECUTE FUNCTION public.sync_record_tombstone();
+
+DROP TRIGGER IF EXISTS transactions_sync_tombstone ON public.transactions;
+CREATE TRIGGER transactions_sync_tombstone AFTER DELETE ON public.transactions
+  FOR EACH ROW EXECUTE FUNCTION public.sync_record_tombstone();
@@ -0,0 +1,106 @@
+import asyncio
+from app.schemas import ExtractedItem, BatchCommitInput
+from app.services import commit_service, contact_directory
+
+
+class StubDatabase:
+    """Database palsu: tidak ada produk lama, SKU counter belum dimigrasi."""
+
+    def __init__(self):
+        self.executed = []
+
+    async def fetch_all(self, query, values=None):
+        return []
+
+    async def fetch_val(self, query, values=None):
+        return False
+
+    async def execute(self, query, values=None):
+        self.executed.append((query, values))
+
+
+def test_new_product_repeated_across_lines():
+    items = [
+        ExtractedItem(product_name="Kopi Baru", qty=2, unit="pcs", unit_price=1000, total_price=2000),
+        ExtractedItem(product_name="kopi baru", qty=3, unit="pcs", unit_price=1500, total_price=4500),
+    ]
+    database = StubDatabase()
+
+    results, new_products = asyncio.run(commit_service.upsert_products_bulk(database, items))
+
+    assert len(new_products) == 1
+    assert results[0]["product_id"] == results[1]["product_id"] == new_products[0]["id"]
+    assert [r["stock_after"] for r in results] == [2.0, 5.0]
+
+    inserts = [values for query, values in database.executed if "INSERT INTO products" in query]
+    assert len(inserts) == 1
+    assert inserts[0]["stocks"] == [5.0]
+
+
+class BatchStubDatabase(StubDatabase):
+    """Database palsu untuk commit batch: catat query, stok produk di dict."""
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+        self.stocks = {}
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def fetch_all(self, query, values=None):
+        self.queries.append(query)
+        if "FOR UPDATE" in query:
+            return [{"id": pid, "current_stock": self.stocks[pid], "average_cost": 0} for pid in values["ids"]]
+        if "RETURNING p.id" in query:
+            for pid, delta in zip(values["ids"], values["deltas"]):
+                self.stocks[pid] += delta
+            return [{"id": pid, "current_stock": self.stocks[pid]} for pid in values["ids"]]
+        return []
+
+    async def fetch_one(self, query, values=None):
+        self.queries.append(query)
+        if "INSERT INTO contacts" in query:
+            return {"id": values["id"], "name": values["name"], "type": values["type"], "phone": values["phone"]}
+        return None
+
+    async def execute(self, query, values=None):
+        await super().execute(query, values)
+        if "INSERT INTO products" in query:
+            self.stocks.update(zip(values["ids"], values["stocks"]))
+
+
+def test_batch_resolves_once_and_reuses_products_created_earlier(monkeypatch):
+    monkeypatch.setattr(contact_directory, "contact_directory", contact_directory.ContactDirectory())
+    item = {"product_name": "Kopi Baru", "unit": "pcs", "unit_price": 1000, "total_price": 1000}
+    purchase = {"transaction_date": "2025-01-02", "total": 0}
+    batch = BatchCommitInput(entries=[
+        {"type": "IN", "transaction": {**purchase, "supplier_name": "Toko A", "items": [{**item, "qty": 5}]}},
+        {"type": "OUT", "sale": {"customer_name": "Budi", "total": 1000, "items": [{**item, "qty": 1}]}},
+        {"type": "IN", "transaction": {**purchase, "supplier_name": "toko a", "items": [{**item, "product_name": "kopi baru", "qty": 2}]}},
+    ])
+    database = BatchStubDatabase()
+
+    results = asyncio.run(commit_service.commit_batch_logic(database, batch.entries))
+
+    assert [r["success"] for r in results] == [True, True, True]
+    # Resolve produk & kontak sekali untuk seluruh batch, bukan per entry
+    assert sum(q is commit_service.RESOLVE_PRODUCTS_QUERY for q in database.queries) == 1
+    assert sum(q is commit_service.SALE_PRODUCTS_QUERY for q in database.queries) == 1
+    assert sum(q is contact_directory.PREFETCH_CONTACTS_QUERY for q in database.queries) == 1
+
+    # Produk baru dari entry pertama dipakai entry sesudahnya, tidak dibuat ulang
+    product_inserts = [values for query, values in database.executed if "INSERT INTO products" in query]
+    assert len(product_inserts) == 1
+    product_id = product_inserts[0]["ids"][0]
+    sale_items = [values for query, values in database.executed if "subtotal" in query and "transaction_items" in query]
+    assert sale_items[0]["prod_ids"] == [product_id]
+    assert database.stocks[product_id] == 6.0
+    # Supplier "toko a" = "Toko A": hanya supplier & pelanggan baru yang di-INSERT
+    assert sum("INSERT INTO contacts" in q for q in database.queries) == 2